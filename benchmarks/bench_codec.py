@@ -0,0 +1,141 @@
+"""Micro-benchmarks for the protocol and parsing hot paths.
+
+Run with ``python benchmarks/bench_codec.py [--output results.json]
+[--compare baseline.json]``. Results are written as JSON, one entry per
+benchmark with the best per-call time in microseconds, so runs from
+different releases can be compared.
+"""
+import argparse
+import json
+import os
+import platform
+import struct
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# pylint: disable=wrong-import-position
+from tests.common import TEST_PACKETS  # noqa: E402
+from tplink_ess_lib import TpLinkESS  # noqa: E402
+from tplink_ess_lib.binary import byte2ports  # noqa: E402
+from tplink_ess_lib.protocol import Protocol  # noqa: E402
+
+VALUE_SAMPLES = {
+    "str": b"TL-SG105E\x00",
+    "ip": b"\xc0\xa8\x01m",
+    "hex": b"\x70\x4f\x57\x89\x61\x6a",
+    "action": b"",
+    "dec": b"\x05",
+    "vlan": struct.pack("!hii", 50, 0x11, 0x01) + b"GAMING\x00",
+    "pvid": struct.pack("!bh", 1, 50),
+    "stat": struct.pack("!bbbIIII", 1, 1, 6, 10085762, 0, 1062303, 0),
+    "bool": b"\x01",
+}
+
+
+def _packet(payload):
+    """Return a decoded packet with the given (type_id, value) TLVs."""
+    header = Protocol.header["blank"].copy()
+    return Protocol.assemble_packet(header, payload)
+
+
+def synthetic_packets():
+    """Return large decoded packets: 48-port stats and a full VLAN table."""
+    stats = [
+        (16384, struct.pack("!bbbIIII", port, 1, 6, port * 1000, 0, port * 900, 1))
+        for port in range(1, 49)
+    ]
+    vlans = [(8704, b"\x01")]
+    vlans += [
+        (8705, struct.pack("!hii", vid, 0xFF, 0x0F) + f"VLAN{vid:04d}".encode() + b"\0")
+        for vid in range(1, 33)
+    ]
+    vlans += [(8707, b" \x00")]
+    return {"stats48": _packet(stats), "vlan32": _packet(vlans)}
+
+
+def benchmarks():
+    """Return a dict of benchmark name -> zero-argument callable."""
+    cases = {}
+    packets = {key: Protocol.decode(pkt) for key, pkt in TEST_PACKETS.items()}
+    packets.update(synthetic_packets())
+    for key, data in packets.items():
+        encoded = Protocol.encode(data)
+        header, payload = Protocol.split(data)
+        parsed = Protocol.interpret_payload(payload)
+        cases[f"decode/{key}"] = lambda e=encoded: Protocol.decode(e)
+        cases[f"split/{key}"] = lambda d=data: Protocol.split(d)
+        cases[f"interpret_header/{key}"] = lambda h=header: Protocol.interpret_header(h)
+        cases[f"interpret_payload/{key}"] = lambda p=payload: (
+            Protocol.interpret_payload(p)
+        )
+        cases[f"parse_response/{key}"] = lambda p=parsed: TpLinkESS.parse_response(p)
+        tlvs = [(tlv.type_id, bytes(tlv.raw)) for tlv in Protocol.iter_payload(payload)]
+        cases[f"assemble_packet/{key}"] = lambda t=tlvs: Protocol.assemble_packet(
+            Protocol.header["blank"].copy(), t
+        )
+        template = Protocol.header_template(1, b"\x00" * 6, b"\x00" * 6)
+        cases[f"build_packet/{key}"] = lambda t=tlvs, h=template: (
+            Protocol.build_packet(h, 1, 0, t)
+        )
+    for kind, value in VALUE_SAMPLES.items():
+        cases[f"interpret_value/{kind}"] = lambda v=value, k=kind: (
+            Protocol.interpret_value(v, k)
+        )
+    for mask in (0, 0x11, 0xFF, 0xFFFFFFFF):
+        cases[f"byte2ports/{mask:#x}"] = lambda m=mask: byte2ports(m)
+    return cases
+
+
+def run(selected=None, repeat=5):
+    """Run the benchmarks and return the result document."""
+    results = {}
+    for name, func in benchmarks().items():
+        if selected and not any(name.startswith(prefix) for prefix in selected):
+            continue
+        timer = timeit.Timer(func)
+        number, _ = timer.autorange()
+        best = min(timer.repeat(repeat=repeat, number=number)) / number
+        results[name] = {"us": round(best * 1e6, 4), "loops": number}
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "machine": platform.machine(),
+        "results": results,
+    }
+
+
+def compare(current, baseline):
+    """Print the ratio of each benchmark to the baseline."""
+    print(f"{'benchmark':<40} {'baseline':>10} {'current':>10} {'ratio':>7}")
+    for name, result in current["results"].items():
+        if (old := baseline["results"].get(name)) is None:
+            continue
+        ratio = result["us"] / old["us"] if old["us"] else float("inf")
+        print(f"{name:<40} {old['us']:>10.3f} {result['us']:>10.3f} {ratio:>6.2f}x")
+
+
+def main():
+    """Run from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", help="write JSON results to this file")
+    parser.add_argument("--compare", help="JSON results of a previous run")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("prefix", nargs="*", help="only run matching benchmarks")
+    args = parser.parse_args()
+
+    current = run(args.prefix, args.repeat)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fptr:
+            json.dump(current, fptr, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as fptr:
+            compare(current, json.load(fptr))
+    else:
+        for name, result in current["results"].items():
+            print(f"{name:<40} {result['us']:>10.3f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""Benchmark Protocol.decode against the per-packet RC4 loop.
+
+Run with ``python benchmarks/bench_decode.py``.
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# pylint: disable=wrong-import-position
+from tplink_ess_lib.protocol import Protocol  # noqa: E402
+
+
+def rc4_decode(data):
+    """Decode by running the RC4 swap loop for every packet."""
+    data = bytearray(data)
+    s = bytearray(Protocol.KEY)  # pylint: disable=invalid-name
+    j = 0
+    for k in range(len(data)):  # pylint: disable=consider-using-enumerate
+        i = (k + 1) & 255
+        j = (j + s[i]) & 255
+        s[i], s[j] = s[j], s[i]
+        data[k] = data[k] ^ s[(s[i] + s[j]) & 255]
+    return bytes(data)
+
+
+def main():
+    """Print the per-packet decode cost before and after."""
+    print(f"{'size':>6} {'rc4 loop (us)':>14} {'keystream (us)':>15} {'speedup':>8}")
+    for size in (36, 154, 512, 1104, 1500):
+        packet = os.urandom(size)
+        assert rc4_decode(packet) == Protocol.decode(packet)
+        number = 2000
+        before = timeit.timeit(lambda p=packet: rc4_decode(p), number=number)
+        after = timeit.timeit(lambda p=packet: Protocol.decode(p), number=number)
+        before_us = before / number * 1e6
+        after_us = after / number * 1e6
+        print(f"{size:>6} {before_us:>14.2f} {after_us:>15.2f} {before / after:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
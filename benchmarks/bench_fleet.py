@@ -0,0 +1,136 @@
+"""Load test of fleet polling against simulated switches on loopback.
+
+Run with ``python benchmarks/bench_fleet.py [--count 1000] [--latency 0.005]
+[--jitter 0.002] [--loss 0.01] [--workers 4] [--output results.json]``.
+Every round polls all switches once through Fleet, or with --workers
+through a ShardedCollector of that many processes; the wall time of each
+round and the number of switches that answered are reported, and written
+as JSON with --output.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# pylint: disable=wrong-import-position
+from tplink_ess_lib.collector import ShardedCollector  # noqa: E402
+from tplink_ess_lib.fleet import Fleet  # noqa: E402
+from tplink_ess_lib.network import AsyncNetwork  # noqa: E402
+from tplink_ess_lib.simulator import SwitchSimulator  # noqa: E402
+
+HOST_MAC = "1c:1b:0d:e5:91:a4"
+
+
+async def run(args):
+    """Poll the simulated fleet for args.rounds rounds."""
+    simulator = await SwitchSimulator(
+        count=args.count,
+        num_ports=args.ports,
+        latency=args.latency,
+        jitter=args.jitter,
+        loss=args.loss,
+        token_ttl=args.token_ttl,
+        seed=0,
+    ).start()
+    if args.workers:
+        try:
+            rounds = await _run_sharded(args, simulator)
+        finally:
+            simulator.close()
+        return _results(args, simulator, rounds)
+    address, port = simulator.address
+    network = await AsyncNetwork(
+        HOST_MAC, address=address, send_port=port, receive_port=0
+    ).open()
+    simulator.reply_port = network.receive_address[1]
+    rounds = []
+    try:
+        async with Fleet(HOST_MAC, "admin", "admin", network=network) as fleet:
+            for _ in range(args.rounds):
+                start = time.perf_counter()
+                data = await fleet.update_data(simulator.macs, args.items)
+                rounds.append(
+                    {"seconds": time.perf_counter() - start, "answered": len(data)}
+                )
+    finally:
+        network.close()
+        simulator.close()
+    return _results(args, simulator, rounds)
+
+
+async def _run_sharded(args, simulator):
+    """Poll the simulated fleet through worker processes."""
+    address, port = simulator.address
+    loop = asyncio.get_running_loop()
+    collector = ShardedCollector(
+        HOST_MAC,
+        simulator.macs,
+        "admin",
+        "admin",
+        workers=args.workers,
+        address=address,
+        send_port=port,
+        receive_port=0,
+    )
+    # the simulator keeps answering on this loop while the collector blocks
+    await loop.run_in_executor(None, collector.start)
+    simulator.reply_port, *simulator.reply_ports = collector.receive_ports
+    rounds = []
+    try:
+        for _ in range(args.rounds):
+            start = time.perf_counter()
+            answered = await loop.run_in_executor(
+                None, lambda: sum(1 for _ in collector.poll(args.items))
+            )
+            rounds.append(
+                {"seconds": time.perf_counter() - start, "answered": answered}
+            )
+    finally:
+        collector.close()
+    return rounds
+
+
+def _results(args, simulator, rounds):
+    """Return the JSON results of a run."""
+    return {
+        "config": vars(args),
+        "requests": simulator.received,
+        "dropped": simulator.dropped,
+        "rounds": rounds,
+    }
+
+
+def main():
+    """Run from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=1000)
+    parser.add_argument("--ports", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.005)
+    parser.add_argument("--jitter", type=float, default=0.002)
+    parser.add_argument("--loss", type=float, default=0.0)
+    parser.add_argument("--token-ttl", type=float, default=None)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=0, help="collector processes")
+    parser.add_argument("--output", help="write JSON results to this file")
+    parser.add_argument("items", nargs="*", help="items to poll (default: due)")
+    args = parser.parse_args()
+    args.items = args.items or None
+
+    results = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fptr:
+            json.dump(results, fptr, indent=2, sort_keys=True)
+    for index, result in enumerate(results["rounds"], 1):
+        print(
+            f"round {index}: {result['answered']}/{args.count} switches "
+            f"in {result['seconds']:.3f} s"
+        )
+    print(f"{results['requests']} requests, {results['dropped']} dropped")
+
+
+if __name__ == "__main__":
+    main()
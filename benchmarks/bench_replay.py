@@ -0,0 +1,47 @@
+"""Decode and parse every reply of a capture file, offline.
+
+Run with ``python benchmarks/bench_replay.py poll.tpcap [--lazy]`` on a file
+written by ``tplink_ess_lib.capture.CaptureWriter`` or dumped by a
+``FlightRecorder``. Reports the best time per received packet for decoding,
+parsing and turning the payload into TpLinkESS result dicts.
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# pylint: disable=wrong-import-position
+from tplink_ess_lib import TpLinkESS  # noqa: E402
+from tplink_ess_lib.capture import RECEIVED, read_capture  # noqa: E402
+from tplink_ess_lib.protocol import Protocol  # noqa: E402
+
+
+def main():
+    """Run from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("capture", help="capture file")
+    parser.add_argument("--lazy", action="store_true", help="parse to TlvViews")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    packets = [r.data for r in read_capture(args.capture) if r.direction == RECEIVED]
+    if not packets:
+        sys.exit(f"{args.capture} holds no received packets")
+    decoded = [Protocol.decode(packet) for packet in packets]
+    parsed = [Protocol.parse(packet, lazy=args.lazy) for packet in decoded]
+
+    cases = {
+        "decode": lambda: [Protocol.decode(packet) for packet in packets],
+        "parse": lambda: [Protocol.parse(p, lazy=args.lazy) for p in decoded],
+        "parse_response": lambda: [TpLinkESS.parse_response(p) for _, p in parsed],
+    }
+    print(f"{len(packets)} received packets")
+    for name, func in cases.items():
+        best = min(timeit.repeat(func, number=10, repeat=args.repeat)) / 10
+        print(f"{name:<16} {best / len(packets) * 1e6:>10.3f} us/packet")
+
+
+if __name__ == "__main__":
+    main()
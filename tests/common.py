@@ -1,6 +1,10 @@
 """Provide common pytest fixtures."""
+import asyncio
 import base64
 import os
+import struct
+
+from tplink_ess_lib.protocol import Protocol
 
 
 def _make_packet(s: str) -> bytes:
@@ -115,3 +119,109 @@ def load_fixture(filename):
     path = os.path.join(os.path.dirname(__file__), "fixtures", filename)
     with open(path, encoding="utf-8") as fptr:
         return fptr.read()
+
+
+class FakeTransport(asyncio.DatagramTransport):
+    """Datagram transport that answers sent packets with canned replies."""
+
+    def __init__(self, fake, protocol):
+        """Initialize."""
+        super().__init__()
+        self._fake = fake
+        self._protocol = protocol
+        self._closing = False
+
+    def sendto(self, data, addr=None):
+        """Record the packet and deliver the next reply(s)."""
+        self._fake.sent.append(data)
+        self._fake.answer(data)
+
+    def is_closing(self):
+        """Return True once closed."""
+        return self._closing
+
+    def close(self):
+        """Close the transport."""
+        self._closing = True
+
+
+class FakeNetwork:
+    """Stand-in for the switch side of the network in tests."""
+
+    def __init__(self):
+        """Initialize."""
+        self.replies: list = []
+        self.error = None
+        self.sent: list = []
+        self.protocols: list = []
+
+    async def create_datagram_endpoint(
+        self, protocol_factory, *args, sock=None, **kwargs
+    ):
+        """Replace loop.create_datagram_endpoint."""
+        protocol = protocol_factory()
+        transport = FakeTransport(self, protocol)
+        self.protocols.append(protocol)
+        protocol.connection_made(transport)
+        return transport, protocol
+
+    def answer(self, data):
+        """Deliver canned replies for a sent packet."""
+        loop = asyncio.get_running_loop()
+        if self.error is not None:
+            for protocol in self.protocols:
+                loop.call_soon(protocol.error_received, self.error)
+            return
+        header, payload = Protocol.split(Protocol.decode(data))
+        header = Protocol.interpret_header(header)
+        count = len(self.replies) if header["op_code"] == Protocol.DISCOVERY else 1
+        for _ in range(count):
+            if not self.replies:
+                return
+            reply = self.replies.pop(0)
+            if callable(reply):
+                reply = reply(header, payload_tlvs(payload))
+            for datagram in reply if isinstance(reply, list) else [reply]:
+                for protocol in self.protocols:
+                    loop.call_soon(
+                        protocol.datagram_received, datagram, ("127.0.0.1", 29808)
+                    )
+
+
+def make_reply(request, payload=(), **fields):
+    """Build an encoded switch reply to a decoded request header."""
+    header = dict(request)
+    header["op_code"] = Protocol.SET
+    header.update(fields)
+    return Protocol.encode(Protocol.assemble_packet(header, list(payload)))
+
+
+def payload_tlvs(payload):
+    """Split raw payload bytes into (type_id, value) tuples."""
+    tlvs = []
+    while len(payload) > len(Protocol.PACKET_END):
+        dtype, dlen = struct.unpack("!hh", payload[0:4])
+        tlvs.append((dtype, payload[4 : 4 + dlen]))
+        payload = payload[4 + dlen :]
+    return tlvs
+
+
+CAPTURED_TLVS = {
+    Protocol.get_id(key): payload_tlvs(Protocol.split(Protocol.decode(packet))[1])
+    for key, packet in TEST_PACKETS.items()
+    if key in Protocol.tp_ids
+}
+
+
+def switch_reply(request, payload):
+    """Answer a GET with the captured TLVs for every requested type id."""
+    tlvs = []
+    for type_id, _ in payload:
+        tlvs += CAPTURED_TLVS.get(type_id, [])
+    return make_reply(request, tlvs)
+
+
+def sent_type_ids(packet):
+    """Return the type ids requested by a sent packet."""
+    payload = Protocol.split(Protocol.decode(packet))[1]
+    return [type_id for type_id, _ in payload_tlvs(payload)]
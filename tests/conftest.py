@@ -1,12 +1,15 @@
 """Provide common pytest fixtures."""
 
 import socket
+from asyncio.base_events import BaseEventLoop
 from unittest import mock
 from unittest.mock import call, mock_open, patch
 
 import pytest
+import pytest_asyncio
 
-from tests.common import load_fixture
+from tests.common import FakeNetwork, load_fixture
+from tplink_ess_lib.network import AsyncNetwork
 
 # TODO: get wireshark captures of packets for tests?
 
@@ -33,3 +36,18 @@ def mock_socket():
     """Fixture to mock socket calls."""
     with mock.Mock(spec=socket.socket) as m:
         yield m
+
+
+@pytest_asyncio.fixture
+async def mock_network():
+    """Fixture to mock the asyncio network with canned switch replies."""
+    fake = FakeNetwork()
+
+    async def _create_datagram_endpoint(loop, protocol_factory, *args, **kwargs):
+        return await fake.create_datagram_endpoint(protocol_factory, *args, **kwargs)
+
+    with patch("tplink_ess_lib.network.socket.socket") as mock_sock, patch.object(
+        BaseEventLoop, "create_datagram_endpoint", _create_datagram_endpoint
+    ), patch.object(AsyncNetwork, "RECEIVE_TIMEOUT", 0.05):
+        fake.socket = mock_sock.return_value
+        yield fake
@@ -0,0 +1,37 @@
+"""Binary helper tests."""
+
+import pytest
+
+from tplink_ess_lib.binary import PortSet, byte2ports, ports2byte
+
+
+@pytest.mark.parametrize(
+    "mask, ports",
+    [(0, ""), (0x11, "1,5"), (0xFF, "1,2,3,4,5,6,7,8"), (-(2**31), "32")],
+)
+def test_byte2ports(mask, ports):
+    """Test masks convert to port lists, including the sign bit as port 32."""
+    assert byte2ports(mask) == ports
+    assert str(PortSet(mask)) == ports
+
+
+def test_port_set():
+    """Test membership, iteration and set operations."""
+    ports = PortSet.parse("1,5,8")
+    assert 5 in ports
+    assert 2 not in ports
+    assert 0 not in ports
+    assert "5" not in ports
+    assert list(ports) == [1, 5, 8]
+    assert len(ports) == 3
+    assert ports == PortSet.from_ports([8, 5, 1]) == 0b10010001
+    assert ports | PortSet.from_ports([2]) == PortSet.parse("1,2,5,8")
+    assert ports & 0b10001 == PortSet.from_ports([1, 5])
+    assert ports - PortSet.from_ports([1]) == PortSet.from_ports([5, 8])
+    assert ports ^ PortSet.from_ports([1, 2]) == PortSet.from_ports([2, 5, 8])
+    assert PortSet.from_ports([5]).issubset(ports)
+    assert not ports.issubset(PortSet.from_ports([5]))
+    assert int(ports) == ports2byte("1,5,8")
+    assert not PortSet()
+    assert repr(ports) == "PortSet({1,5,8})"
+    assert len({ports, PortSet.parse("1,5,8")}) == 1
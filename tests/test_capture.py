@@ -0,0 +1,121 @@
+"""Capture, flight recorder and replay tests."""
+
+import pytest
+
+from tplink_ess_lib import TpLinkESS
+from tplink_ess_lib.capture import (
+    RECEIVED,
+    SENT,
+    CaptureWriter,
+    FlightRecorder,
+    ReplayTransport,
+    read_capture,
+)
+from tplink_ess_lib.network import AsyncNetwork, ConnectionProblem
+from tplink_ess_lib.protocol import Protocol
+
+from .common import switch_reply
+
+pytestmark = pytest.mark.asyncio
+
+TEST_HOST_MAC = "1c:1b:0d:e5:91:a4"
+TEST_SWITCH_MAC = "70:4f:57:89:61:6a"
+NUM_PORTS = [(Protocol.get_id("num_ports"), b"")]
+
+
+async def test_capture_file(mock_network, tmp_path):
+    """Test sent and received datagrams are written and read back."""
+    mock_network.replies = [switch_reply]
+    path = str(tmp_path / "poll.tpcap")
+    with CaptureWriter(path) as capture:
+        async with AsyncNetwork(TEST_HOST_MAC, capture=capture) as net:
+            await net.query(TEST_SWITCH_MAC, Protocol.GET, NUM_PORTS)
+
+    records = list(read_capture(path))
+    assert [record.direction for record in records] == [SENT, RECEIVED]
+    assert records[0].data == mock_network.sent[0]
+    header, payload = records[1].parse()
+    assert header["op_code"] == Protocol.SET
+    assert payload == [(10, "num_ports", 5)]
+    assert records[0].timestamp <= records[1].timestamp
+
+
+async def test_read_capture_bad_file(tmp_path):
+    """Test a file that is not a capture is refused."""
+    path = tmp_path / "other"
+    path.write_bytes(b"not a capture")
+    with pytest.raises(ValueError):
+        list(read_capture(str(path)))
+
+
+async def test_flight_recorder_dump(mock_network, tmp_path):
+    """Test the last packets are kept and dumped when a request fails."""
+    recorder = FlightRecorder(size=2, dump_dir=str(tmp_path))
+    mock_network.replies = [switch_reply]
+    async with AsyncNetwork(TEST_HOST_MAC, capture=recorder) as net:
+        await net.query(TEST_SWITCH_MAC, Protocol.GET, NUM_PORTS)
+        with pytest.raises(ConnectionProblem):
+            await net.query(TEST_SWITCH_MAC, Protocol.GET, NUM_PORTS)
+
+    assert len(recorder.records) == 2
+    assert len(recorder.dumps) == 1
+    dumped = list(read_capture(recorder.dumps[0]))
+    assert [record.direction for record in dumped] == [RECEIVED, SENT]
+    assert dumped[1].data == mock_network.sent[1]
+
+
+async def test_flight_recorder_limits(mock_network, tmp_path):
+    """Test dumps are rate limited, capped, and not made for stray packets."""
+    recorder = FlightRecorder(dump_dir=str(tmp_path))
+    async with AsyncNetwork(TEST_HOST_MAC, capture=recorder) as net:
+        net.datagram_received(b"\x00" * 8, ("10.0.0.1", 29808))
+        assert not recorder.dumps
+        for _ in range(2):
+            with pytest.raises(ConnectionProblem):
+                await net.query(TEST_SWITCH_MAC, Protocol.GET, NUM_PORTS)
+    assert len(recorder.dumps) == 1
+    assert recorder.suppressed == 1
+
+    recorder = FlightRecorder(
+        dump_dir=str(tmp_path / "capped"), min_interval=0, max_dumps=2
+    )
+    (tmp_path / "capped").mkdir()
+    recorder.record(SENT, b"packet")
+    for reason in ("first", "second", "third"):
+        recorder.error(reason)
+    assert len(recorder.dumps) == 2
+    assert sorted(str(path) for path in (tmp_path / "capped").iterdir()) == sorted(
+        recorder.dumps
+    )
+
+
+async def test_flight_recorder_without_dump_dir(mock_network):
+    """Test a recorder without dump_dir only keeps packets."""
+    recorder = FlightRecorder(size=4)
+    async with AsyncNetwork(TEST_HOST_MAC, capture=recorder) as net:
+        with pytest.raises(ConnectionProblem):
+            await net.query(TEST_SWITCH_MAC, Protocol.GET, NUM_PORTS)
+    assert len(recorder.records) == 1
+    assert not recorder.dumps
+
+
+async def test_replay(mock_network, tmp_path):
+    """Test a captured poll is reproduced offline through TpLinkESS."""
+    mock_network.replies = [switch_reply] * 3
+    path = str(tmp_path / "poll.tpcap")
+    with CaptureWriter(path) as capture:
+        async with TpLinkESS(TEST_HOST_MAC, capture=capture) as ess:
+            captured = await ess.query(TEST_SWITCH_MAC, ["hostname", "num_ports"])
+            await ess.query(TEST_SWITCH_MAC, "stats")
+
+    net = AsyncNetwork("02:00:00:00:00:01")
+    transport = ReplayTransport(net, read_capture(path))
+    await net.open(transport)
+    replayed = TpLinkESS("02:00:00:00:00:01", network=net)
+
+    assert await replayed.query(TEST_SWITCH_MAC, ["hostname", "num_ports"]) == captured
+    assert transport.remaining == 1
+    with pytest.raises(ConnectionProblem):
+        await net.query(TEST_SWITCH_MAC, Protocol.GET, NUM_PORTS, timeout=0.01)
+    assert (await replayed.query(TEST_SWITCH_MAC, "stats"))["stats"]
+    assert not transport.remaining
@@ -0,0 +1,58 @@
+"""Sharded collector tests, with worker processes and a loopback simulator."""
+
+import asyncio
+import threading
+
+import pytest
+
+from tplink_ess_lib.collector import ShardedCollector, shard_sequence_ids
+from tplink_ess_lib.simulator import SwitchSimulator
+
+TEST_HOST_MAC = "1c:1b:0d:e5:91:a4"
+
+
+@pytest.fixture
+def simulator():
+    """Yield a simulator answering from its own event loop thread."""
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    simulated = asyncio.run_coroutine_threadsafe(
+        SwitchSimulator(count=7, num_ports=5, seed=5).start(), loop
+    ).result()
+    yield simulated
+    loop.call_soon_threadsafe(simulated.close)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.close()
+
+
+def test_shard_sequence_ids():
+    """Test every worker gets its own sequence ids."""
+    shards = shard_sequence_ids(3)
+    assert shards == [range(0, 333), range(333, 666), range(666, 999)]
+
+
+def test_collector_poll(simulator):  # pylint: disable=redefined-outer-name
+    """Test workers sharing every reply each return their own switches."""
+    address, port = simulator.address
+    with ShardedCollector(
+        TEST_HOST_MAC,
+        simulator.macs,
+        "admin",
+        "admin",
+        workers=2,
+        address=address,
+        send_port=port,
+        receive_port=0,
+    ) as collector:
+        simulator.reply_port, *simulator.reply_ports = collector.receive_ports
+        first = dict(collector.poll(["num_ports", "stats"]))
+        for _ in collector.poll(["num_ports"]):
+            break  # the rest is drained
+        second = dict(collector.poll(["num_ports"]))
+
+    assert sorted(first) == simulator.macs
+    assert first[simulator.macs[0]]["num_ports"] == {"num_ports": 5}
+    assert len(first[simulator.macs[0]]["stats"]["stats"]) == 5
+    assert sorted(second) == simulator.macs
@@ -0,0 +1,162 @@
+"""OpenMetrics exporter tests."""
+
+import asyncio
+
+import pytest
+
+from tplink_ess_lib.exporter import CONTENT_TYPE, MetricsExporter, render_switch
+from tplink_ess_lib.fleet import Fleet
+from tplink_ess_lib.network import AsyncNetwork
+from tplink_ess_lib.rates import PortRates
+from tplink_ess_lib.records import PortStats, SwitchInfo, VlanEntry
+from tplink_ess_lib.simulator import SwitchSimulator
+
+pytestmark = pytest.mark.asyncio
+
+TEST_HOST_MAC = "1c:1b:0d:e5:91:a4"
+TEST_SWITCH_MAC = "70:4f:57:89:61:6a"
+
+COMPACT = {
+    "hostname": SwitchInfo(type="TL-SG108E", hostname='lab "b"', mac=TEST_SWITCH_MAC),
+    "stats": {
+        "stats": [PortStats(1, 1, 6, 10, 1, 20, 2), PortStats(2, 0, 0, 0, 0, 0, 0)]
+    },
+    "vlan": {
+        "vlan": [VlanEntry(1, 0x03, 0, "Default_VLAN"), VlanEntry(7, 0x01, 0, "X")]
+    },
+}
+
+
+async def _scrape(address, path="/metrics"):
+    """Return the status line, headers and body of a GET."""
+    reader, writer = await asyncio.open_connection(*address)
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: test\r\n\r\n".encode())
+    response = await reader.read()
+    writer.close()
+    head, body = response.split(b"\r\n\r\n", 1)
+    status, *headers = head.decode().split("\r\n")
+    return status, headers, body.decode()
+
+
+async def test_render_switch():
+    """Test samples of compact and dict data match, with escaped labels."""
+    lines = render_switch(TEST_SWITCH_MAC, COMPACT, timestamp=1.5)
+    as_dicts = {
+        "hostname": COMPACT["hostname"].as_dict(),
+        "stats": {"stats": [entry.as_dict() for entry in COMPACT["stats"]["stats"]]},
+        "vlan": {"vlan": [entry.as_dict() for entry in COMPACT["vlan"]["vlan"]]},
+    }
+
+    assert render_switch(TEST_SWITCH_MAC, as_dicts, timestamp=1.5) == lines
+    assert 'hostname="lab \\"b\\""' in lines["tplink_ess_switch"]
+    assert lines["tplink_ess_port_link_status"].splitlines()[0] == (
+        f'tplink_ess_port_link_status{{switch="{TEST_SWITCH_MAC}",port="1",'
+        'link="1000Full"} 6'
+    )
+    assert (
+        lines["tplink_ess_vlans"]
+        == f'tplink_ess_vlans{{switch="{TEST_SWITCH_MAC}"}} 2\n'
+    )
+    assert "tplink_ess_port_packets_total" in lines["tplink_ess_port_packets"]
+    assert 'direction="rx",result="bad"} 2\n' in lines["tplink_ess_port_packets"]
+
+    # unwrapped counters are preferred
+    rates = [PortRates(1, 0, 0, 0, 0, 1 << 33, 1, 20, 2)]
+    lines = render_switch(TEST_SWITCH_MAC, COMPACT, rates)
+    assert (
+        f'direction="tx",result="good"}} {1 << 33}\n'
+        in lines["tplink_ess_port_packets"]
+    )
+
+
+async def test_exporter_cached_body():
+    """Test the body is rendered once per change, with families grouped."""
+    exporter = MetricsExporter()
+    exporter.update(TEST_SWITCH_MAC, COMPACT, timestamp=1.0)
+    exporter.update("02:00:00:00:00:01", {"stats": COMPACT["stats"]}, timestamp=2.0)
+    body = exporter.render()
+
+    assert exporter.render() is body
+    text = body.decode()
+    assert text.endswith("# EOF\n")
+    names = [line.split("{")[0] for line in text.splitlines() if line[0] != "#"]
+    assert names == sorted(names, key=names.index)  # each family contiguous
+    assert text.index('up{switch="02:00') < text.index(f'up{{switch="{TEST_SWITCH_MAC}')
+
+    exporter.set_down(TEST_SWITCH_MAC)
+    assert (
+        f'tplink_ess_up{{switch="{TEST_SWITCH_MAC}"}} 0' in exporter.render().decode()
+    )
+    exporter.remove(TEST_SWITCH_MAC)
+    assert TEST_SWITCH_MAC not in exporter.render().decode()
+
+
+async def test_exporter_scrapes_send_nothing():
+    """Test scrapes are served from the poll loop's cache."""
+    async with SwitchSimulator(count=2, num_ports=5, seed=7) as simulator:
+        address, port = simulator.address
+        async with AsyncNetwork(
+            TEST_HOST_MAC, address=address, send_port=port, receive_port=0
+        ) as network:
+            simulator.reply_port = network.receive_address[1]
+            async with Fleet(TEST_HOST_MAC, "admin", "admin", network=network) as fleet:
+                exporter = MetricsExporter(
+                    fleet, simulator.macs + ["02:00:00:00:ff:ff"]
+                )
+                await exporter.start(port=0)
+                try:
+                    network.RECEIVE_TIMEOUT = 0.2
+                    while b"tplink_ess_up" not in (exporter.render()):
+                        await asyncio.sleep(0.01)
+                    await asyncio.sleep(0.3)
+                    received = simulator.received
+                    status, headers, body = await _scrape(exporter.address)
+                    await _scrape(exporter.address)
+                    missing, _, _ = await _scrape(exporter.address, "/other")
+                finally:
+                    exporter.close()
+
+    assert simulator.received == received
+    assert exporter.scrapes == 2
+    assert status == "HTTP/1.1 200 OK"
+    assert f"Content-Type: {CONTENT_TYPE}" in headers
+    assert missing.startswith("HTTP/1.1 404")
+    for mac in simulator.macs:
+        assert f'tplink_ess_up{{switch="{mac}"}} 1' in body
+        assert f'tplink_ess_vlans{{switch="{mac}"}} 1' in body
+    assert 'tplink_ess_up{switch="02:00:00:00:ff:ff"} 0' in body
+
+
+class BrokenFleet:
+    """Fleet whose polls fail with an unexpected error."""
+
+    def __init__(self):
+        """Initialize."""
+        self.polls = 0
+
+    async def update_data(self, _switch_macs, _action_names=None):
+        """Fail."""
+        self.polls += 1
+        raise RuntimeError("bug")
+
+
+async def test_exporter_poll_failure():
+    """Test a failing poll marks switches down and polling goes on."""
+    fleet = BrokenFleet()
+    exporter = MetricsExporter(fleet, [TEST_SWITCH_MAC], interval=0.01)
+    exporter.update(TEST_SWITCH_MAC, COMPACT)
+    await exporter.start(port=0)
+
+    async def _polled_twice():
+        while fleet.polls < 2:
+            await asyncio.sleep(0.01)
+
+    try:
+        await asyncio.wait_for(_polled_twice(), 1)
+    finally:
+        exporter.close()
+
+    assert exporter.poll_errors >= 2
+    assert (
+        f'tplink_ess_up{{switch="{TEST_SWITCH_MAC}"}} 0' in exporter.render().decode()
+    )
@@ -0,0 +1,54 @@
+"""Fleet tests."""
+
+import pytest
+
+from tplink_ess_lib.fleet import Fleet
+from tplink_ess_lib.protocol import Protocol
+
+from .common import make_reply
+
+pytestmark = pytest.mark.asyncio
+
+TEST_HOST_MAC = "1c:1b:0d:e5:91:a4"
+SWITCH_MACS = ["70:4f:57:89:61:05", "70:4f:57:89:61:08"]
+
+
+class CrossingSwitches:
+    """Fake switches whose replies arrive in the opposite order to requests."""
+
+    def __init__(self):
+        """Initialize."""
+        self.held = []
+
+    def answer(self, request, payload):
+        """Answer with num_ports taken from the last byte of the switch MAC."""
+        if request["op_code"] == Protocol.GET and payload[0][0] == 10:
+            return make_reply(request, [(10, request["switch_mac"][-1:])])
+        return make_reply(request)
+
+    def __call__(self, request, payload):
+        """Hold a request until its partner arrives, then answer both."""
+        self.held.append(self.answer(request, payload))
+        if len(self.held) < 2:
+            return []
+        replies, self.held = self.held[::-1], []
+        return replies
+
+
+async def test_fleet_update_data(mock_network):
+    """Test concurrent polls route crossing replies to the right switch."""
+    mock_network.replies = [CrossingSwitches()] * 6
+    async with Fleet(TEST_HOST_MAC) as fleet:
+        result = await fleet.update_data(SWITCH_MACS, ["num_ports"])
+
+    assert result == {
+        "70:4f:57:89:61:05": {"num_ports": {"num_ports": 5}},
+        "70:4f:57:89:61:08": {"num_ports": {"num_ports": 8}},
+    }
+    assert mock_network.socket.bind.call_count == 1
+
+
+async def test_fleet_update_data_no_reply(mock_network):
+    """Test a silent switch is left out of the results."""
+    async with Fleet(TEST_HOST_MAC) as fleet:
+        assert not await fleet.update_data(SWITCH_MACS[:1], ["num_ports"])
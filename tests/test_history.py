@@ -0,0 +1,100 @@
+"""Port counter history tests."""
+
+import os
+
+import pytest
+
+from tplink_ess_lib.history import (
+    HEADER_SIZE,
+    HistoryStore,
+    RingStore,
+    decode_deltas,
+    record_struct,
+)
+from tplink_ess_lib.records import PortStats
+
+TEST_SWITCH_MAC = "70:4f:57:89:61:6a"
+
+
+def _stats(step, ports=3):
+    """Return the stats of a switch at some step of time."""
+    return [
+        PortStats(
+            port, 1, 6, step * 1000 * port, step, (step * 70_000_000) % (1 << 32), 0
+        )
+        for port in range(1, ports + 1)
+    ]
+
+
+def test_ring_append_and_wrap(tmp_path):
+    """Test the ring keeps the newest records in a file of fixed size."""
+    path = str(tmp_path / "ring")
+    with RingStore(path, 3, capacity=5) as ring:
+        for step in range(8):
+            ring.append(_stats(step), timestamp=100.0 + step)
+        assert len(ring) == 5
+        assert [t for t, _ in ring.samples()] == [103.0, 104.0, 105.0, 106.0, 107.0]
+        assert ring.samples().__next__()[1] == _stats(3)
+        with pytest.raises(ValueError):
+            ring.append(_stats(9), timestamp=99.0)
+        with pytest.raises(ValueError):
+            ring.append(_stats(9, ports=4), timestamp=200.0)
+    assert os.path.getsize(path) == HEADER_SIZE + 5 * record_struct(3).size
+
+    # reopened, the ring carries on where it was
+    with RingStore(path, 3, capacity=1000) as ring:
+        assert ring.capacity == 5 and ring.appended == 8
+        ring.append([entry.as_dict() for entry in _stats(8)], timestamp=108.0)
+        assert [t for t, _ in ring.samples(start=106.5)] == [107.0, 108.0]
+    with pytest.raises(ValueError):
+        RingStore(path, 8)
+
+
+def test_ring_views_zero_copy(tmp_path):
+    """Test range reads are views into the mapping, split where they wrap."""
+    with RingStore(str(tmp_path / "ring"), 2, capacity=4) as ring:
+        for step in range(6):
+            ring.append(_stats(step, 2), timestamp=float(step))
+
+        views = ring.views(start=2.0, end=5.0)
+        assert [len(view) for view in views] == [
+            2 * ring._record.size,
+            ring._record.size,
+        ]
+        assert all(view.obj is views[0].obj for view in views)
+        fields = [f for view in views for f in record_struct(2).iter_unpack(view)]
+        assert [f[0] for f in fields] == [2.0, 3.0, 4.0]
+        assert not ring.views(start=10.0)
+        assert len(ring.views()) == 2
+        for view in views:
+            view.release()
+
+
+def test_delta_compaction(tmp_path):
+    """Test delta encoding is lossless across wraps and much smaller."""
+    with RingStore(str(tmp_path / "ring"), 8, capacity=100) as ring:
+        for step in range(100):
+            ring.append(_stats(step, 8), timestamp=1_700_000_000.25 + 30 * step)
+        compacted = ring.compact()
+        assert decode_deltas(compacted) == list(ring.samples())
+        assert len(compacted) < len(ring) * ring._record.size
+
+    # idle ports: four bytes for the 30 s step and seven per port
+    with RingStore(str(tmp_path / "idle"), 8, capacity=10) as ring:
+        for step in range(10):
+            ring.append(_stats(5, 8), timestamp=30.0 * step)
+        compacted = ring.compact(start=30.0)
+        assert len(compacted) - len(ring.compact(start=60.0)) == 4 + 8 * 7
+        assert decode_deltas(compacted) == list(ring.samples(start=30.0))
+    with pytest.raises(ValueError):
+        decode_deltas(b"junk")
+
+
+def test_history_store(tmp_path):
+    """Test every switch gets its own ring."""
+    with HistoryStore(str(tmp_path), capacity=10) as store:
+        store.append(TEST_SWITCH_MAC, _stats(1, 5), timestamp=1.0)
+        store.append("02:00:00:00:00:01", _stats(1, 8), timestamp=1.0)
+        store.append(TEST_SWITCH_MAC, _stats(2, 5), timestamp=2.0)
+        assert len(store.ring(TEST_SWITCH_MAC, 5)) == 2
+    assert sorted(os.listdir(tmp_path)) == ["020000000001.ring", "704f5789616a.ring"]
@@ -1,5 +1,6 @@
 """Library tests."""
 
+import asyncio
 import base64
 from unittest.mock import patch
 
@@ -8,313 +9,403 @@ import pytest
 import tplink_ess_lib
 from tplink_ess_lib import MissingMac
 from tplink_ess_lib.network import InterfaceProblem, Network, ConnectionProblem
-from .common import TEST_PACKETS
+from .common import TEST_PACKETS, sent_type_ids, switch_reply
 
 pytestmark = pytest.mark.asyncio
 
 TEST_HOST_MAC = "00:00:00:00:00:00"
 TEST_SWITCH_MAC = "70:4f:57:89:61:6a"
+STATS_RESULT = [
+    {
+        "Port": 1,
+        "Status": "Enabled",
+        "Status Raw": 1,
+        "Link Status": "1000Full",
+        "Link Status Raw": 6,
+        "TxGoodPkt": 10085762,
+        "TxBadPkt": 0,
+        "RxGoodPkt": 1062303,
+        "RxBadPkt": 0,
+    },
+    {
+        "Port": 2,
+        "Status": "Enabled",
+        "Status Raw": 1,
+        "Link Status": "Link Down",
+        "Link Status Raw": 0,
+        "TxGoodPkt": 0,
+        "TxBadPkt": 0,
+        "RxGoodPkt": 0,
+        "RxBadPkt": 0,
+    },
+    {
+        "Port": 3,
+        "Status": "Enabled",
+        "Status Raw": 1,
+        "Link Status": "1000Full",
+        "Link Status Raw": 6,
+        "TxGoodPkt": 23127099,
+        "TxBadPkt": 0,
+        "RxGoodPkt": 8488829,
+        "RxBadPkt": 0,
+    },
+    {
+        "Port": 4,
+        "Status": "Enabled",
+        "Status Raw": 1,
+        "Link Status": "Link Down",
+        "Link Status Raw": 0,
+        "TxGoodPkt": 0,
+        "TxBadPkt": 0,
+        "RxGoodPkt": 0,
+        "RxBadPkt": 0,
+    },
+    {
+        "Port": 5,
+        "Status": "Enabled",
+        "Status Raw": 1,
+        "Link Status": "1000Full",
+        "Link Status Raw": 6,
+        "TxGoodPkt": 9715369,
+        "TxBadPkt": 0,
+        "RxGoodPkt": 25004812,
+        "RxBadPkt": 25,
+    },
+]
 
 
 def _get_packets(keys: list[str]):
-    """Get packets from the test packets dictionary as a list of tuples with terminating ("","")."""
-    return [(TEST_PACKETS[key], "") for key in keys] + [("", "")]
+    """Get packets from the test packets dictionary as a list."""
+    return [TEST_PACKETS[key] for key in keys]
 
 
-async def test_discovery():
+async def test_discovery(mock_network):
     """Test switch discovery."""
-    with patch("tplink_ess_lib.network.socket.socket") as mock_socket:
-        mock_socket = mock_socket.return_value
-        mock_socket.recvfrom.side_effect = _get_packets(["discovery1"])
+    mock_socket = mock_network.socket
+    mock_network.replies = _get_packets(["discovery1"])
+
+    tplink = tplink_ess_lib.TpLinkESS(host_mac=TEST_HOST_MAC, testing=True)
+
+    result = await tplink.discovery()
+
+    # Verify socket set to non-blocking for the event loop
+    mock_socket.setblocking.assert_called_with(False)
+    # Verify socket bound with proper broadcast address
+    mock_socket.bind.assert_called_with(
+        (Network.BROADCAST_ADDR, Network.UDP_RECEIVE_FROM_PORT)
+    )
+
+    assert result == [
+        {
+            "dhcp": False,
+            "firmware": "1.0.2 Build 20160526 Rel.34684",
+            "gateway": "0.0.0.0",
+            "hardware": "TL-SG108PE 1.0",
+            "hostname": "TL-SG108PE",
+            "ip_addr": "192.168.1.3",
+            "ip_mask": "255.255.255.0",
+            "mac": "18:a6:f7:bc:80:d1",
+            "type": "TL-SG108PE",
+        }
+    ]
 
-        tplink = tplink_ess_lib.TpLinkESS(host_mac=TEST_HOST_MAC, testing=True)
 
-        result = await tplink.discovery()
-
-        # Verify timeout called with proper value
-        mock_socket.settimeout.assert_called_with(10)
-        # Verify socket bound with proper broadcast address
-        mock_socket.bind.assert_called_with(
-            (Network.BROADCAST_ADDR, Network.UDP_RECEIVE_FROM_PORT)
-        )
-
-        assert result == [
-            {
-                "dhcp": False,
-                "firmware": "1.0.2 Build 20160526 Rel.34684",
-                "gateway": "0.0.0.0",
-                "hardware": "TL-SG108PE 1.0",
-                "hostname": "TL-SG108PE",
-                "ip_addr": "192.168.1.3",
-                "ip_mask": "255.255.255.0",
-                "mac": "18:a6:f7:bc:80:d1",
-                "type": "TL-SG108PE",
-            }
-        ]
-
-
-async def test_discovery_multi():
+async def test_discovery_multi(mock_network):
     """Test switch discovery with multple switches."""
-    with patch("tplink_ess_lib.network.socket.socket") as mock_socket:
-        mock_socket = mock_socket.return_value
-        mock_socket.recvfrom.side_effect = _get_packets(["discovery1", "discovery2"])
+    mock_socket = mock_network.socket
+    mock_network.replies = _get_packets(["discovery1", "discovery2"])
+
+    tplink = tplink_ess_lib.TpLinkESS(host_mac=TEST_HOST_MAC, testing=True)
+
+    result = await tplink.discovery()
+
+    # Verify socket set to non-blocking for the event loop
+    mock_socket.setblocking.assert_called_with(False)
+    # Verify socket bound with proper broadcast address
+    mock_socket.bind.assert_called_with(
+        (Network.BROADCAST_ADDR, Network.UDP_RECEIVE_FROM_PORT)
+    )
+
+    assert result == [
+        {
+            "dhcp": False,
+            "firmware": "1.0.2 Build 20160526 Rel.34684",
+            "gateway": "0.0.0.0",
+            "hardware": "TL-SG108PE 1.0",
+            "hostname": "TL-SG108PE",
+            "ip_addr": "192.168.1.3",
+            "ip_mask": "255.255.255.0",
+            "mac": "18:a6:f7:bc:80:d1",
+            "type": "TL-SG108PE",
+        },
+        {
+            "dhcp": False,
+            "firmware": "1.0.0 Build 20160715 Rel.38605",
+            "gateway": "192.168.1.4",
+            "hardware": "TL-SG105E 3.0",
+            "hostname": "switch7",
+            "ip_addr": "192.168.1.109",
+            "ip_mask": "255.255.255.0",
+            "mac": "70:4f:57:89:61:6a",
+            "type": "TL-SG105E",
+        },
+    ]
+
+
+async def test_stats_query(mock_network):
+    """Test stats query."""
+    mock_socket = mock_network.socket
+    mock_network.replies = _get_packets(["stats"])
 
-        tplink = tplink_ess_lib.TpLinkESS(host_mac=TEST_HOST_MAC, testing=True)
+    tplink = tplink_ess_lib.TpLinkESS(host_mac=TEST_HOST_MAC, testing=True)
 
-        result = await tplink.discovery()
-
-        # Verify timeout called with proper value
-        mock_socket.settimeout.assert_called_with(10)
-        # Verify socket bound with proper broadcast address
-        mock_socket.bind.assert_called_with(
-            (Network.BROADCAST_ADDR, Network.UDP_RECEIVE_FROM_PORT)
-        )
-
-        assert result == [
-            {
-                "dhcp": False,
-                "firmware": "1.0.2 Build 20160526 Rel.34684",
-                "gateway": "0.0.0.0",
-                "hardware": "TL-SG108PE 1.0",
-                "hostname": "TL-SG108PE",
-                "ip_addr": "192.168.1.3",
-                "ip_mask": "255.255.255.0",
-                "mac": "18:a6:f7:bc:80:d1",
-                "type": "TL-SG108PE",
-            },
-            {
-                "dhcp": False,
-                "firmware": "1.0.0 Build 20160715 Rel.38605",
-                "gateway": "192.168.1.4",
-                "hardware": "TL-SG105E 3.0",
-                "hostname": "switch7",
-                "ip_addr": "192.168.1.109",
-                "ip_mask": "255.255.255.0",
-                "mac": "70:4f:57:89:61:6a",
-                "type": "TL-SG105E",
-            },
-        ]
-
-
-async def test_stats_query():
-    """Test stats query."""
-    with patch("tplink_ess_lib.network.socket.socket") as mock_socket:
-        mock_socket = mock_socket.return_value
-        mock_socket.recvfrom.side_effect = _get_packets(["stats"])
+    result = await tplink.query(TEST_SWITCH_MAC, "stats")
 
-        tplink = tplink_ess_lib.TpLinkESS(host_mac=TEST_HOST_MAC, testing=True)
+    # Verify socket set to non-blocking for the event loop
+    mock_socket.setblocking.assert_called_with(False)
+    # Verify socket bound with proper broadcast address
+    mock_socket.bind.assert_called_with(
+        (Network.BROADCAST_ADDR, Network.UDP_RECEIVE_FROM_PORT)
+    )
 
-        result = await tplink.query(TEST_SWITCH_MAC, "stats")
+    assert result == {"stats": STATS_RESULT}
 
-        # Verify timeout called with proper value
-        mock_socket.settimeout.assert_called_with(10)
-        # Verify socket bound with proper broadcast address
-        mock_socket.bind.assert_called_with(
-            (Network.BROADCAST_ADDR, Network.UDP_RECEIVE_FROM_PORT)
-        )
 
-        assert result == {
-            "stats": [
-                {
-                    "Port": 1,
-                    "Status": "Enabled",
-                    "Status Raw": 1,
-                    "Link Status": "1000Full",
-                    "Link Status Raw": 6,
-                    "TxGoodPkt": 10085762,
-                    "TxBadPkt": 0,
-                    "RxGoodPkt": 1062303,
-                    "RxBadPkt": 0,
-                },
-                {
-                    "Port": 2,
-                    "Status": "Enabled",
-                    "Status Raw": 1,
-                    "Link Status": "Link Down",
-                    "Link Status Raw": 0,
-                    "TxGoodPkt": 0,
-                    "TxBadPkt": 0,
-                    "RxGoodPkt": 0,
-                    "RxBadPkt": 0,
-                },
-                {
-                    "Port": 3,
-                    "Status": "Enabled",
-                    "Status Raw": 1,
-                    "Link Status": "1000Full",
-                    "Link Status Raw": 6,
-                    "TxGoodPkt": 23127099,
-                    "TxBadPkt": 0,
-                    "RxGoodPkt": 8488829,
-                    "RxBadPkt": 0,
-                },
+async def test_update_data(mock_network):
+    """Test update data function."""
+    mock_socket = mock_network.socket
+    mock_network.replies = _get_packets(["stats", "login1"]) + [switch_reply] * 12
+
+    tplink = tplink_ess_lib.TpLinkESS(host_mac=TEST_HOST_MAC, testing=True)
+
+    result = await tplink.update_data(switch_mac=TEST_SWITCH_MAC)
+
+    # Verify socket set to non-blocking for the event loop
+    mock_socket.setblocking.assert_called_with(False)
+    # Verify socket bound with proper broadcast address
+    mock_socket.bind.assert_called_with(
+        (Network.BROADCAST_ADDR, Network.UDP_RECEIVE_FROM_PORT)
+    )
+
+    assert result == {
+        "hostname": {
+            "type": "TL-SG105E",
+            "hostname": "switch7",
+            "mac": "70:4f:57:89:61:6a",
+            "firmware": "1.0.0 Build 20160715 Rel.38605",
+            "hardware": "TL-SG105E 3.0",
+            "dhcp": False,
+            "ip_addr": "192.168.1.109",
+            "ip_mask": "255.255.255.0",
+            "gateway": "192.168.1.4",
+        },
+        "num_ports": {"num_ports": 5},
+        "ports": {
+            "ports": [
+                "01:01:00:01:06:00:00",
+                "02:01:00:01:00:00:00",
+                "03:01:00:01:06:00:00",
+                "04:01:00:01:00:00:00",
+                "05:01:00:01:06:00:00",
+            ]
+        },
+        "trunk": {"trunk": "01:00:00:00:00"},
+        "mtu_vlan": {"mtu_vlan": "00:01"},
+        "vlan": {
+            "vlan_enabled": "01",
+            "vlan": [
                 {
-                    "Port": 4,
-                    "Status": "Enabled",
-                    "Status Raw": 1,
-                    "Link Status": "Link Down",
-                    "Link Status Raw": 0,
-                    "TxGoodPkt": 0,
-                    "TxBadPkt": 0,
-                    "RxGoodPkt": 0,
-                    "RxBadPkt": 0,
+                    "VLAN ID": 1,
+                    "Member Ports": "1,2,3,4,5",
+                    "Tagged Ports": "",
+                    "VLAN Name": "Default_VLAN",
                 },
                 {
-                    "Port": 5,
-                    "Status": "Enabled",
-                    "Status Raw": 1,
-                    "Link Status": "1000Full",
-                    "Link Status Raw": 6,
-                    "TxGoodPkt": 9715369,
-                    "TxBadPkt": 0,
-                    "RxGoodPkt": 25004812,
-                    "RxBadPkt": 25,
+                    "VLAN ID": 50,
+                    "Member Ports": "1,5",
+                    "Tagged Ports": "",
+                    "VLAN Name": "GAMING",
                 },
+            ],
+            "vlan_filler": " ",
+        },
+        "pvid": {
+            "pvid": [(1, 50), (2, 1), (3, 1), (4, 1), (5, 1)],
+            "vlan_filler": " ",
+        },
+        "stats": {"stats": STATS_RESULT},
+    }
+
+    # Test socket error
+    mock_network.error = OSError()
+    with pytest.raises(ConnectionProblem):
+        await tplink.update_data(switch_mac=TEST_SWITCH_MAC)
+
+
+async def test_partial_update_data(mock_network):
+    """Test update data function with subset."""
+    mock_socket = mock_network.socket
+    mock_network.replies = _get_packets(["login1", "login2"]) + [switch_reply]
+
+    tplink = tplink_ess_lib.TpLinkESS(host_mac=TEST_HOST_MAC, testing=True)
+
+    result = await tplink.update_data(
+        switch_mac=TEST_SWITCH_MAC, action_names=["hostname", "ports"]
+    )
+
+    assert result == {
+        "hostname": {
+            "type": "TL-SG105E",
+            "hostname": "switch7",
+            "mac": "70:4f:57:89:61:6a",
+            "firmware": "1.0.0 Build 20160715 Rel.38605",
+            "hardware": "TL-SG105E 3.0",
+            "dhcp": False,
+            "ip_addr": "192.168.1.109",
+            "ip_mask": "255.255.255.0",
+            "gateway": "192.168.1.4",
+        },
+        "ports": {
+            "ports": [
+                "01:01:00:01:06:00:00",
+                "02:01:00:01:00:00:00",
+                "03:01:00:01:06:00:00",
+                "04:01:00:01:00:00:00",
+                "05:01:00:01:06:00:00",
             ]
-        }
+        },
+    }
 
 
-async def test_update_data():
-    """Test update data function."""
-    with patch("tplink_ess_lib.network.socket.socket") as mock_socket:
-        mock_socket = mock_socket.return_value
-
-        mock_socket.recvfrom.side_effect = _get_packets(
-            [
-                "stats",
-                "login1",
-                "hostname",
-                "num_ports",
-                "ports",
-                "trunk",
-                "mtu_vlan",
-                "vlan",
-                "pvid",
-            ]
-        )
-
-        tplink = tplink_ess_lib.TpLinkESS(host_mac=TEST_HOST_MAC, testing=True)
+async def test_missing_hostmac_exception():
+    """Test missing host mac address exception."""
+    with pytest.raises(MissingMac):
+        tplink_ess_lib.TpLinkESS()
 
-        result = await tplink.update_data(switch_mac=TEST_SWITCH_MAC)
 
-        # Verify timeout called with proper value
-        mock_socket.settimeout.assert_called_with(10)
-        # Verify socket bound with proper broadcast address
-        mock_socket.bind.assert_called_with(
-            (Network.BROADCAST_ADDR, Network.UDP_RECEIVE_FROM_PORT)
-        )
-
-        assert result == {
-            "hostname": {
-                "type": "TL-SG105E",
-                "hostname": "switch7",
-                "mac": "70:4f:57:89:61:6a",
-                "firmware": "1.0.0 Build 20160715 Rel.38605",
-                "hardware": "TL-SG105E 3.0",
-                "dhcp": False,
-                "ip_addr": "192.168.1.109",
-                "ip_mask": "255.255.255.0",
-                "gateway": "192.168.1.4",
-            },
-            "num_ports": {"num_ports": 5},
-            "ports": {
-                "ports": [
-                    "01:01:00:01:06:00:00",
-                    "02:01:00:01:00:00:00",
-                    "03:01:00:01:06:00:00",
-                    "04:01:00:01:00:00:00",
-                    "05:01:00:01:06:00:00",
-                ]
-            },
-            "trunk": {"trunk": "01:00:00:00:00"},
-            "mtu_vlan": {"mtu_vlan": "00:01"},
-            "vlan": {
-                "vlan_enabled": "01",
-                "vlan": [
-                    {
-                        "VLAN ID": 1,
-                        "Member Ports": "1,2,3,4,5",
-                        "Tagged Ports": "",
-                        "VLAN Name": "Default_VLAN",
-                    },
-                    {
-                        "VLAN ID": 50,
-                        "Member Ports": "1,5",
-                        "Tagged Ports": "",
-                        "VLAN Name": "GAMING",
-                    },
-                ],
-                "vlan_filler": " ",
-            },
-            "pvid": {
-                "pvid": [(1, 50), (2, 1), (3, 1), (4, 1), (5, 1)],
-                "vlan_filler": " ",
-            },
-        }
+async def test_binding_exceptions(mock_network):
+    """Test socket binding exceptions."""
+    mock_socket = mock_network.socket
+    mock_socket.bind.side_effect = OSError
+    with pytest.raises(OSError):
+        tplink = tplink_ess_lib.TpLinkESS(host_mac=TEST_HOST_MAC, testing=True)
+        await tplink.discovery()
+    mock_socket.bind.side_effect = InterfaceProblem
+    with pytest.raises(InterfaceProblem):
+        tplink = tplink_ess_lib.TpLinkESS(host_mac=TEST_HOST_MAC, testing=True)
+        await tplink.discovery()
+    mock_socket.bind.side_effect = InterfaceProblem
+    with pytest.raises(InterfaceProblem):
+        tplink = tplink_ess_lib.TpLinkESS(host_mac=TEST_HOST_MAC)
+        await tplink.update_data(switch_mac=TEST_SWITCH_MAC)
 
-        # Test recvfrom socket error
-        mock_socket.recvfrom.side_effect = OSError
-        with pytest.raises(ConnectionProblem):
-            await tplink.update_data(switch_mac=TEST_SWITCH_MAC)
 
+async def test_update_data_batches_get(mock_network):
+    """Test update data packs items into as few GET packets as fit."""
+    mock_network.replies = _get_packets(["login1", "login2"]) + [switch_reply] * 12
 
-async def test_partial_update_data():
-    """Test update data function with subset."""
-    with patch("tplink_ess_lib.network.socket.socket") as mock_socket:
-        mock_socket = mock_socket.return_value
-        mock_socket.recvfrom.side_effect = _get_packets(
-            ["login1", "login2", "hostname", "ports"]
-        )
+    tplink = tplink_ess_lib.TpLinkESS(host_mac=TEST_HOST_MAC, testing=True)
+    batches = tplink._batch_actions(TEST_SWITCH_MAC, list(tplink.working_ids_tp))
+    assert sum(len(batch) for batch in batches) == len(tplink.working_ids_tp)
+    assert 1 < len(batches) < len(tplink.working_ids_tp)
 
-        tplink = tplink_ess_lib.TpLinkESS(host_mac=TEST_HOST_MAC, testing=True)
+    await tplink.update_data(switch_mac=TEST_SWITCH_MAC)
+    assert len(mock_network.sent) == 2 + len(batches)
 
-        result = await tplink.update_data(
-            switch_mac=TEST_SWITCH_MAC, action_names=["hostname", "ports"]
-        )
-
-        assert result == {
-            "hostname": {
-                "type": "TL-SG105E",
-                "hostname": "switch7",
-                "mac": "70:4f:57:89:61:6a",
-                "firmware": "1.0.0 Build 20160715 Rel.38605",
-                "hardware": "TL-SG105E 3.0",
-                "dhcp": False,
-                "ip_addr": "192.168.1.109",
-                "ip_mask": "255.255.255.0",
-                "gateway": "192.168.1.4",
-            },
-            "ports": {
-                "ports": [
-                    "01:01:00:01:06:00:00",
-                    "02:01:00:01:00:00:00",
-                    "03:01:00:01:06:00:00",
-                    "04:01:00:01:00:00:00",
-                    "05:01:00:01:06:00:00",
-                ]
-            },
-        }
+    # num_ports is now known, so the whole poll fits one packet
+    assert tplink._batch_actions(TEST_SWITCH_MAC, list(tplink.working_ids_tp)) == [
+        list(tplink.working_ids_tp)
+    ]
 
 
-async def test_missing_hostmac_exception():
-    """Test missing host mac address exception."""
-    with pytest.raises(MissingMac):
-        tplink_ess_lib.TpLinkESS()
+async def test_query_multiple(mock_network):
+    """Test querying several items at once."""
+    mock_network.replies = [switch_reply]
 
+    tplink = tplink_ess_lib.TpLinkESS(host_mac=TEST_HOST_MAC, testing=True)
+    result = await tplink.query(TEST_SWITCH_MAC, ["num_ports", "vlan", "pvid"])
 
-async def test_binding_exceptions():
-    """Test socket binding exceptions."""
-    with patch("tplink_ess_lib.network.socket.socket") as mock_socket:
-        mock_socket = mock_socket.return_value
-        mock_socket.bind.side_effect = OSError
-        with pytest.raises(OSError):
-            tplink = tplink_ess_lib.TpLinkESS(host_mac=TEST_HOST_MAC, testing=True)
-            await tplink.discovery()
-        mock_socket.bind.side_effect = InterfaceProblem
-        with pytest.raises(InterfaceProblem):
-            tplink = tplink_ess_lib.TpLinkESS(host_mac=TEST_HOST_MAC, testing=True)
-            await tplink.discovery()
-        mock_socket.bind.side_effect = InterfaceProblem
-        with pytest.raises(InterfaceProblem):
-            tplink = tplink_ess_lib.TpLinkESS(host_mac=TEST_HOST_MAC)
-            await tplink.update_data(switch_mac=TEST_SWITCH_MAC)
+    assert len(mock_network.sent) == 1
+    assert result == {
+        "num_ports": {"num_ports": 5},
+        "vlan": {
+            "vlan_enabled": "01",
+            "vlan": [
+                {
+                    "VLAN ID": 1,
+                    "Member Ports": "1,2,3,4,5",
+                    "Tagged Ports": "",
+                    "VLAN Name": "Default_VLAN",
+                },
+                {
+                    "VLAN ID": 50,
+                    "Member Ports": "1,5",
+                    "Tagged Ports": "",
+                    "VLAN Name": "GAMING",
+                },
+            ],
+            "vlan_filler": " ",
+        },
+        "pvid": {
+            "pvid": [(1, 50), (2, 1), (3, 1), (4, 1), (5, 1)],
+            "vlan_filler": " ",
+        },
+    }
+
+
+async def test_discover_early_completion(mock_network):
+    """Test streaming discovery stops on max_switches or a quiet period."""
+    tplink = tplink_ess_lib.TpLinkESS(host_mac=TEST_HOST_MAC, testing=True)
+    loop = asyncio.get_running_loop()
+
+    mock_network.replies = _get_packets(["discovery1", "discovery2"])
+    start = loop.time()
+    found = [switch["hostname"] async for switch in tplink.discover(timeout=0.2)]
+    assert found == ["TL-SG108PE", "switch7"]
+    assert loop.time() - start >= 0.2
+
+    mock_network.replies = _get_packets(["discovery1", "discovery1", "discovery2"])
+    start = loop.time()
+    result = await tplink.discovery(timeout=5, quiet=0.05)
+    assert [switch["hostname"] for switch in result] == ["TL-SG108PE", "switch7"]
+    assert loop.time() - start < 1
+
+    mock_network.replies = _get_packets(["discovery1", "discovery2"])
+    start = loop.time()
+    result = await tplink.discovery(timeout=5, max_switches=1)
+    assert [switch["hostname"] for switch in result] == ["TL-SG108PE"]
+    assert loop.time() - start < 1
+    assert not tplink._network._pending
+
+
+async def test_update_data_refresh_schedule(mock_network):
+    """Test only items whose refresh interval elapsed are queried."""
+    mock_network.replies = _get_packets(["login1", "login2"]) + [switch_reply] * 12
+    tplink = tplink_ess_lib.TpLinkESS(
+        host_mac=TEST_HOST_MAC, testing=True, refresh_intervals={"vlan": 60}
+    )
+    with patch("tplink_ess_lib.time.monotonic", return_value=1000.0):
+        await tplink.update_data(switch_mac=TEST_SWITCH_MAC)
+        sent = len(mock_network.sent)
+        result = await tplink.update_data(switch_mac=TEST_SWITCH_MAC)
+    assert result["hostname"]["hostname"] == "switch7"
+    assert [sent_type_ids(p) for p in mock_network.sent[sent:]] == [[4096, 16384]]
+
+    sent = len(mock_network.sent)
+    with patch("tplink_ess_lib.time.monotonic", return_value=1060.0):
+        await tplink.update_data(switch_mac=TEST_SWITCH_MAC)
+    assert [sent_type_ids(p) for p in mock_network.sent[sent:]] == [[4096, 8705, 16384]]
+
+    # nothing due: no packets at all
+    tplink = tplink_ess_lib.TpLinkESS(
+        host_mac=TEST_HOST_MAC,
+        testing=True,
+        refresh_intervals={"ports": 5, "stats": 5},
+    )
+    tplink._refreshed = {
+        (TEST_SWITCH_MAC, action): 1000.0 for action in tplink.working_ids_tp
+    }
+    sent = len(mock_network.sent)
+    with patch("tplink_ess_lib.time.monotonic", return_value=1001.0):
+        assert await tplink.update_data(switch_mac=TEST_SWITCH_MAC) == {}
+    assert len(mock_network.sent) == sent
@@ -0,0 +1,118 @@
+"""Passive listener tests, over real loopback sockets."""
+
+import asyncio
+import socket
+
+import pytest
+
+from tplink_ess_lib.fleet import Fleet
+from tplink_ess_lib.listener import PassiveListener
+from tplink_ess_lib.metrics import MetricsRegistry
+from tplink_ess_lib.network import AsyncNetwork
+from tplink_ess_lib.protocol import Protocol
+from tplink_ess_lib.records import SwitchInfo
+from tplink_ess_lib.simulator import SwitchSimulator
+
+pytestmark = pytest.mark.asyncio
+
+TEST_HOST_MAC = "1c:1b:0d:e5:91:a4"
+
+
+@pytest.mark.parametrize("compact", [False, True])
+async def test_listener_harvests_replies(compact):
+    """Test a listener sees the replies to another host's polls."""
+    updates = []
+    registry = MetricsRegistry()
+    async with SwitchSimulator(count=3, num_ports=5, seed=6) as simulator:
+        address, port = simulator.address
+        async with AsyncNetwork(
+            TEST_HOST_MAC, address=address, send_port=port, receive_port=0
+        ) as network, PassiveListener(
+            compact,
+            address=address,
+            receive_port=0,
+            callback=lambda state, names: updates.append((state.mac, names)),
+            metrics=registry,
+        ) as listener:
+            simulator.reply_port = network.receive_address[1]
+            simulator.reply_ports = [listener.receive_address[1]]
+            async with Fleet(
+                TEST_HOST_MAC, "admin", "admin", compact=compact, network=network
+            ) as fleet:
+                polled = await fleet.update_data(simulator.macs)
+                await asyncio.sleep(0.01)
+                await fleet.update_data(simulator.macs, ["stats"])
+            await asyncio.sleep(0.01)
+
+    assert sorted(listener.switches) == simulator.macs
+    for mac, data in polled.items():
+        state = listener.switches[mac]
+        assert state.data == data
+        assert isinstance(state.info, SwitchInfo)
+        assert state.info.mac == mac
+        assert len(listener.rates.rates(mac)) == 5
+    assert (simulator.macs[0], ["stats"]) in updates
+    assert registry.counter("packets_sent") == 0
+    assert registry.counter("packets_received", op_code="RETURN") == 3
+
+
+@pytest.mark.parametrize("listener_first", [False, True])
+async def test_listener_beside_network(listener_first):
+    """Test a listener and a network share one reply port, in either order."""
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as probe:
+        probe.bind(("", 0))
+        reply_port = probe.getsockname()[1]
+    simulator = SwitchSimulator(reply_port=reply_port, reply_address="255.255.255.255")
+    await simulator.start("0.0.0.0")
+    network = AsyncNetwork(
+        TEST_HOST_MAC, send_port=simulator.address[1], receive_port=reply_port
+    )
+    listener = PassiveListener(receive_port=reply_port)
+    try:
+        for opening in (listener, network) if listener_first else (network, listener):
+            await opening.open()
+        async with Fleet(TEST_HOST_MAC, "admin", "admin", network=network) as fleet:
+            polled = await fleet.update_data(simulator.macs, ["num_ports"])
+        await asyncio.sleep(0.01)
+    finally:
+        listener.close()
+        network.close()
+        simulator.close()
+
+    assert polled[simulator.macs[0]] == {"num_ports": {"num_ports": 8}}
+    assert listener.switches[simulator.macs[0]].data == polled[simulator.macs[0]]
+
+
+async def test_listener_ignores_rejected():
+    """Test a rejected reply updates only when the switch was heard."""
+    listener = PassiveListener()
+    header = dict(
+        Protocol.header["blank"],
+        op_code=Protocol.SET,
+        switch_mac=b"\x02\x00\x00\x00\x00\x01",
+        error_code=1,
+    )
+
+    state = listener.ingest(header, [(10, "num_ports", 5)], now=5.0)
+
+    assert state.replies == 1 and state.last_seen == 5.0
+    assert not state.data
+    state = listener.ingest(dict(header, error_code=0), [(10, "num_ports", 5)])
+    assert state.data == {"num_ports": {"num_ports": 5}}
+
+
+async def test_listener_ignores_unrequested_items():
+    """Test a reply holding only items the library does not poll is skipped."""
+    updates = []
+    listener = PassiveListener(callback=lambda *args: updates.append(args))
+    header = dict(
+        Protocol.header["blank"],
+        op_code=Protocol.SET,
+        switch_mac=b"\x02\x00\x00\x00\x00\x01",
+    )
+
+    state = listener.ingest(header, [(4352, "igmp_snooping", True)], now=5.0)
+
+    assert state.replies == 1 and state.last_seen == 5.0
+    assert not state.data
+    assert not updates
@@ -0,0 +1,113 @@
+"""Metrics tests."""
+
+import pytest
+
+from tplink_ess_lib.metrics import (
+    NULL_METRICS,
+    CallbackMetrics,
+    Histogram,
+    MetricsRegistry,
+)
+from tplink_ess_lib.network import AsyncNetwork, ConnectionProblem
+from tplink_ess_lib.protocol import Protocol
+from tplink_ess_lib.session import Session
+
+from .common import make_reply
+
+TEST_HOST_MAC = "1c:1b:0d:e5:91:a4"
+TEST_SWITCH_MAC = "70:4f:57:89:61:6a"
+NUM_PORTS = [(Protocol.get_id("num_ports"), b"")]
+
+
+def test_null_metrics():
+    """Test the default sink is disabled and accepts anything."""
+    assert not NULL_METRICS.enabled
+    NULL_METRICS.increment("packets_sent", switch="x")
+    NULL_METRICS.observe("rtt_seconds", 0.1)
+    assert AsyncNetwork(TEST_HOST_MAC).metrics is NULL_METRICS
+
+
+def test_histogram():
+    """Test samples land in cumulative buckets."""
+    histogram = Histogram((0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(value)
+    assert histogram.cumulative() == [(0.1, 2), (1.0, 3), (float("inf"), 4)]
+    assert histogram.count == 4
+    assert histogram.sum == pytest.approx(2.65)
+    assert histogram.quantile(0.5) == 0.1
+    assert histogram.quantile(0.99) == float("inf")
+    assert Histogram().quantile(0.5) is None
+
+
+def test_registry_labels():
+    """Test counters and histograms are kept per label set and merged on read."""
+    registry = MetricsRegistry()
+    registry.increment("packets_sent", switch="a", op_code="GET")
+    registry.increment("packets_sent", 2, switch="b", op_code="GET")
+    registry.observe("rtt_seconds", 0.01, switch="a")
+    registry.observe("rtt_seconds", 0.02, switch="b")
+    assert registry.counter("packets_sent") == 3
+    assert registry.counter("packets_sent", switch="b") == 2
+    assert registry.counter("timeouts") == 0
+    assert registry.histogram("rtt_seconds").count == 2
+    assert registry.histogram("rtt_seconds", switch="a").sum == 0.01
+    registry.reset()
+    assert not registry.counters
+
+
+def test_callback_metrics():
+    """Test every metric is forwarded to the callback."""
+    calls = []
+    metrics = CallbackMetrics(lambda *args: calls.append(args))
+    metrics.increment("logins", switch="a")
+    metrics.observe("rtt_seconds", 0.5)
+    assert calls == [
+        ("counter", "logins", 1, {"switch": "a"}),
+        ("histogram", "rtt_seconds", 0.5, {}),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_network_metrics(mock_network):
+    """Test the network reports packets, drops, timings and timeouts."""
+    mock_network.replies = [
+        lambda req, _: [
+            make_reply(req, [(10, b"\x01")], sequence_id=req["sequence_id"] - 1),
+            make_reply(req, [(10, b"\x02")], host_mac=b"\x01" * 6),
+            b"garbage",
+            make_reply(req, [(10, b"\x05")]),
+        ],
+    ]
+    registry = MetricsRegistry()
+    async with AsyncNetwork(TEST_HOST_MAC, metrics=registry) as net:
+        await net.query(TEST_SWITCH_MAC, Protocol.GET, NUM_PORTS)
+        with pytest.raises(ConnectionProblem):
+            await net.query(TEST_SWITCH_MAC, Protocol.GET, NUM_PORTS)
+
+    labels = {"switch": TEST_SWITCH_MAC, "op_code": "GET"}
+    assert registry.counter("packets_sent", **labels) == 2
+    # the reply to another host is dropped before its header is decrypted
+    assert registry.counter("packets_received") == 2
+    assert registry.counter("replies_dropped", reason="sequence_id") == 1
+    assert registry.counter("replies_dropped", reason="host_mac") == 1
+    assert registry.counter("replies_dropped", reason="malformed") == 1
+    assert registry.counter("timeouts", **labels) == 1
+    assert registry.histogram("rtt_seconds", **labels).count == 1
+    # only the reply that was waited for is decoded in full
+    assert registry.histogram("decode_seconds", op_code="SET").count == 1
+    assert registry.histogram("parse_seconds", switch=TEST_SWITCH_MAC).count == 1
+
+
+@pytest.mark.asyncio
+async def test_login_metrics(mock_network):
+    """Test logins are counted per switch."""
+    mock_network.replies = [
+        lambda req, _: make_reply(req, token_id=7),
+        lambda req, _: make_reply(req, op_code=Protocol.RETURN),
+    ]
+    registry = MetricsRegistry()
+    async with AsyncNetwork(TEST_HOST_MAC, metrics=registry) as net:
+        await Session(net, TEST_SWITCH_MAC, "admin", "admin").login()
+
+    assert registry.counter("logins", switch=TEST_SWITCH_MAC) == 1
@@ -0,0 +1,214 @@
+"""Network tests."""
+
+import asyncio
+from unittest.mock import Mock
+
+import pytest
+
+from tplink_ess_lib.capture import FlightRecorder
+from tplink_ess_lib.metrics import MetricsRegistry
+from tplink_ess_lib.network import AsyncNetwork, ConnectionProblem
+from tplink_ess_lib.protocol import Protocol
+
+from .common import make_reply
+
+pytestmark = pytest.mark.asyncio
+
+TEST_HOST_MAC = "1c:1b:0d:e5:91:a4"
+TEST_SWITCH_MAC = "70:4f:57:89:61:6a"
+NUM_PORTS = [(Protocol.get_id("num_ports"), b"")]
+
+
+async def test_query_matches_sequence_id(mock_network):
+    """Test replies for other sequence ids or hosts are ignored."""
+    mock_network.replies = [
+        lambda req, _: [
+            make_reply(req, [(10, b"\x01")], sequence_id=req["sequence_id"] - 1),
+            make_reply(req, [(10, b"\x02")], host_mac=b"\x01" * 6),
+            make_reply(req, [(10, b"\x05")], token_id=42),
+        ],
+    ]
+    async with AsyncNetwork(TEST_HOST_MAC) as net:
+        header, payload = await net.query(TEST_SWITCH_MAC, Protocol.GET, NUM_PORTS)
+        assert payload == [(10, "num_ports", 5)]
+        assert header["sequence_id"] == net.sequence_id
+        assert net.token_id == 42
+
+
+async def test_query_other_host_not_parsed(mock_network):
+    """Test replies to another host are dropped before their payload is read."""
+    mock_network.replies = [
+        lambda req, _: [
+            make_reply(req, host_mac=b"\x01" * 6)[:-4] + b"\x00" * 4,
+            make_reply(req, [(10, b"\x05")]),
+        ],
+    ]
+    capture = FlightRecorder()
+    capture.error = Mock()
+    async with AsyncNetwork(TEST_HOST_MAC, capture=capture) as net:
+        _, payload = await net.query(TEST_SWITCH_MAC, Protocol.GET, NUM_PORTS)
+    assert payload == [(10, "num_ports", 5)]
+    capture.error.assert_not_called()
+    assert len(capture.records) == 3
+
+
+async def test_query_sequence_ids(mock_network):
+    """Test a network uses only its sequence ids and drops replies to others."""
+    mock_network.replies = [
+        lambda req, _: [
+            make_reply(req, [(10, b"\x01")], sequence_id=(req["sequence_id"] + 10)),
+            make_reply(req, [(10, b"\x05")]),
+        ],
+    ] * 3
+    registry = MetricsRegistry()
+    async with AsyncNetwork(
+        TEST_HOST_MAC, sequence_ids=range(100, 110), metrics=registry
+    ) as net:
+        for _ in range(3):
+            header, payload = await net.query(TEST_SWITCH_MAC, Protocol.GET, NUM_PORTS)
+            assert 100 <= header["sequence_id"] < 110
+            assert payload == [(10, "num_ports", 5)]
+
+    assert registry.counter("replies_dropped", reason="sequence_id") == 3
+    assert registry.counter("packets_received") == 3
+
+
+async def test_query_timeout(mock_network):
+    """Test a query without a reply times out."""
+    async with AsyncNetwork(TEST_HOST_MAC) as net:
+        with pytest.raises(ConnectionProblem):
+            await net.query(TEST_SWITCH_MAC, Protocol.GET, NUM_PORTS)
+        assert not net._pending  # pylint: disable=protected-access
+
+
+async def test_query_cancel(mock_network):
+    """Test a cancelled query releases its pending slot."""
+    async with AsyncNetwork(TEST_HOST_MAC) as net:
+        task = asyncio.ensure_future(
+            net.query(TEST_SWITCH_MAC, Protocol.GET, NUM_PORTS, timeout=5)
+        )
+        await asyncio.sleep(0)
+        assert net._pending  # pylint: disable=protected-access
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert not net._pending  # pylint: disable=protected-access
+
+
+async def test_query_retransmit(mock_network):
+    """Test a lost request is resent with the same sequence_id."""
+    mock_network.replies = [
+        lambda req, _: [],
+        lambda req, _: make_reply(req, [(10, b"\x05")]),
+    ]
+    async with AsyncNetwork(TEST_HOST_MAC) as net:
+        net.rtt(TEST_SWITCH_MAC).rto = 0.01
+        _, payload = await net.query(TEST_SWITCH_MAC, Protocol.GET, NUM_PORTS)
+
+        assert payload == [(10, "num_ports", 5)]
+        assert len(mock_network.sent) == 2
+        assert mock_network.sent[0] == mock_network.sent[1]
+        assert net.retransmits == 1
+        # the reply to a resent packet is not an RTT sample
+        assert net.rtt(TEST_SWITCH_MAC).samples == 0
+
+
+async def test_query_retransmit_limit(mock_network):
+    """Test retransmits stop after MAX_RETRANSMITS."""
+    async with AsyncNetwork(TEST_HOST_MAC) as net:
+        estimator = net.rtt(TEST_SWITCH_MAC)
+        estimator.rto = estimator.min_rto = 0.001
+        with pytest.raises(ConnectionProblem):
+            await net.query(TEST_SWITCH_MAC, Protocol.GET, NUM_PORTS, timeout=1)
+
+        assert len(mock_network.sent) == AsyncNetwork.MAX_RETRANSMITS + 1
+
+
+async def test_query_rtt_sample(mock_network):
+    """Test a first-time reply updates the switch's RTT estimate."""
+    mock_network.replies = [lambda req, _: make_reply(req, [(10, b"\x05")])]
+    async with AsyncNetwork(TEST_HOST_MAC) as net:
+        await net.query(TEST_SWITCH_MAC, Protocol.GET, NUM_PORTS)
+
+        estimator = net.rtt(TEST_SWITCH_MAC)
+        assert estimator.samples == 1
+        assert estimator.rto == estimator.min_rto
+
+
+async def test_send_requires_open():
+    """Test sending on an unopened network."""
+    net = AsyncNetwork(TEST_HOST_MAC)
+    with pytest.raises(ConnectionProblem):
+        await net.send(TEST_SWITCH_MAC, Protocol.GET, NUM_PORTS)
+
+
+async def test_shared_network(mock_network):
+    """Test shared networks are handed out per options and closed when unused."""
+    mock_network.replies = [lambda req, _: [make_reply(req, [(10, b"\x05")])]] * 2
+    first = await AsyncNetwork.shared(TEST_HOST_MAC)
+    second = await AsyncNetwork.shared(TEST_HOST_MAC)
+    lazy = await AsyncNetwork.shared(TEST_HOST_MAC, lazy=True)
+    assert second is first
+    assert lazy is not first
+
+    first.release()
+    await second.query(TEST_SWITCH_MAC, Protocol.GET, NUM_PORTS)
+    second.release()
+    with pytest.raises(ConnectionProblem):
+        await second.send(TEST_SWITCH_MAC, Protocol.GET, NUM_PORTS)
+    reopened = await AsyncNetwork.shared(TEST_HOST_MAC)
+    assert reopened is not first
+    reopened.release()
+    lazy.release()
+
+
+class HoldingSwitch:
+    """Fake switch answering every window of requests reversed and twice."""
+
+    def __init__(self, window):
+        """Initialize."""
+        self.window = window
+        self.held = []
+
+    def __call__(self, request, payload):
+        """Hold requests until a window is full."""
+        value = request["sequence_id"].to_bytes(2, "big")
+        self.held.append(make_reply(request, [(10, value)]))
+        if len(self.held) < self.window:
+            return []
+        replies, self.held = self.held[::-1], []
+        return replies + replies
+
+
+async def test_query_many_pipelined(mock_network):
+    """Test pipelined requests with out-of-order and duplicate replies."""
+    mock_network.replies = [HoldingSwitch(3)] * 6
+    async with AsyncNetwork(TEST_HOST_MAC) as net:
+        results = await net.query_many(
+            TEST_SWITCH_MAC, [(Protocol.GET, NUM_PORTS)] * 6, window=3
+        )
+        assert not net._pending  # pylint: disable=protected-access
+    sequence_ids = [header["sequence_id"] for header, _ in results]
+    assert [payload[0][2] for _, payload in results] == sequence_ids
+    assert len(set(sequence_ids)) == 6
+
+
+async def test_query_many_window_limit(mock_network):
+    """Test no more than window requests are outstanding."""
+    in_flight = []
+
+    def _silent_switch(request, payload):
+        in_flight.append(len(net._pending))  # pylint: disable=protected-access
+        return []
+
+    mock_network.replies = [_silent_switch] * 3
+    async with AsyncNetwork(TEST_HOST_MAC) as net:
+        results = await net.query_many(
+            TEST_SWITCH_MAC, [(Protocol.GET, NUM_PORTS)] * 3, window=2
+        )
+    # the third request waits for a slot; which of the first two frees it
+    # and when is up to the timers, so only the bound is checked
+    assert len(in_flight) == 3
+    assert in_flight[:2] == [1, 2]
+    assert max(in_flight) == 2
+    assert all(isinstance(result, ConnectionProblem) for result in results)
@@ -0,0 +1,165 @@
+"""Protocol tests."""
+
+import os
+from unittest.mock import Mock
+
+import pytest
+
+from tplink_ess_lib.protocol import Protocol, TlvView
+
+from .common import TEST_PACKETS
+
+
+def _reference_decode(data):
+    """Decode with the per-packet RC4 loop the keystream cache replaced."""
+    data = bytearray(data)
+    s = bytearray(Protocol.KEY)  # pylint: disable=invalid-name
+    j = 0
+    for k in range(len(data)):  # pylint: disable=consider-using-enumerate
+        i = (k + 1) & 255
+        j = (j + s[i]) & 255
+        s[i], s[j] = s[j], s[i]
+        data[k] = data[k] ^ s[(s[i] + s[j]) & 255]
+    return bytes(data)
+
+
+@pytest.mark.parametrize("length", [0, 1, 36, 255, 256, 1500, 1600])
+def test_decode_matches_rc4(length):
+    """Test the cached keystream matches the RC4 loop for any length."""
+    data = os.urandom(length)
+    assert Protocol.decode(data) == _reference_decode(data)
+    assert Protocol.encode(Protocol.decode(data)) == data
+
+
+def test_decode_packets():
+    """Test decoding captured packets."""
+    for packet in TEST_PACKETS.values():
+        assert Protocol.decode(packet) == _reference_decode(packet)
+
+
+def test_parse_matches_split():
+    """Test the zero-copy parser agrees with split/interpret."""
+    for packet in TEST_PACKETS.values():
+        data = Protocol.decode(packet)
+        header, payload = Protocol.split(data)
+        parsed_header, tlvs = Protocol.parse(data)
+        assert parsed_header == Protocol.interpret_header(header)
+        assert [tuple(tlv) for tlv in tlvs] == Protocol.interpret_payload(payload)
+
+
+def test_parse_wanted_is_lazy():
+    """Test unwanted TLVs are skipped and values decode on access."""
+    data = Protocol.decode(TEST_PACKETS["vlan"])
+    _, tlvs = Protocol.parse(data, wanted={Protocol.get_id("vlan")})
+    assert [tlv.type_id for tlv in tlvs] == [8705, 8705]
+    assert all(tlv._value is TlvView._UNSET for tlv in tlvs)
+    assert bytes(tlvs[1].raw[:2]) == b"\x00\x32"
+    assert tlvs[1].value == [50, "1,5", "", "GAMING"]
+    assert tlvs[1][1] == "vlan"
+
+
+def test_tlv_view_index_is_lazy(monkeypatch):
+    """Test reading the type id or name of a TlvView does not decode it."""
+    stats = Protocol.get_id("stats")
+    decode = Mock(side_effect=Protocol.schema[stats].decode)
+    monkeypatch.setitem(
+        Protocol.schema, stats, Protocol.schema[stats]._replace(decode=decode)
+    )
+    _, tlvs = Protocol.parse(Protocol.decode(TEST_PACKETS["stats"]), lazy=True)
+
+    assert [tlv[0] for tlv in tlvs] == [stats] * len(tlvs)
+    assert {tlv[1] for tlv in tlvs} == {"stats"}
+    assert tlvs[0][-3] == stats
+    decode.assert_not_called()
+    assert tlvs[0][2] == tlvs[0].value
+    assert decode.call_count == 1
+
+
+def test_parse_invalid():
+    """Test malformed packets are rejected."""
+    with pytest.raises(AssertionError):
+        Protocol.parse(b"\x00" * 10)
+    with pytest.raises(AssertionError):
+        Protocol.parse(b"\x00" * 40)
+
+
+def test_schema_covers_ids():
+    """Test a codec is compiled for every known type id."""
+    assert set(Protocol.schema) == set(Protocol.ids_tp)
+    assert Protocol.schema[16384].name == "stats"
+
+
+@pytest.mark.parametrize(
+    "type_id, value",
+    [
+        (2, "switch7"),
+        (4, "192.168.1.109"),
+        (3, "70:4f:57:89:61:6a"),
+        (10, 5),
+        (12, True),
+        (8706, (1, 50)),
+        (16384, (1, 1, 6, 10085762, 0, 1062303, 0)),
+    ],
+)
+def test_schema_round_trip(type_id, value):
+    """Test compiled encoders and decoders invert each other."""
+    encoded = Protocol.encode_value(type_id, value)
+    assert Protocol.schema[type_id].decode(encoded) == value
+
+
+def test_schema_vlan():
+    """Test VLAN entries encode from masks and decode to port lists."""
+    encoded = Protocol.encode_value(8705, (50, 0x11, 0x01, "GAMING"))
+    assert encoded == Protocol.set_vlan(50, 0x11, 0x01, "GAMING")
+    assert Protocol.interpret_value(encoded, "vlan") == [50, "1,5", "1", "GAMING"]
+
+
+def test_interpret_value_unknown_kind():
+    """Test values of unknown kinds are returned undecoded."""
+    assert Protocol.interpret_value(b"\x01", "other") == b"\x01"
+
+
+def test_build_packet_matches_assemble():
+    """Test patching a header template equals assembling the header."""
+    payload = [(10, b""), (8705, Protocol.set_vlan(1, 0x1F, 0, "Default_VLAN"))]
+    header = dict(
+        Protocol.header["blank"],
+        op_code=Protocol.GET,
+        switch_mac=b"pOW\x89aj",
+        host_mac=b"\x1c\x1b\r\xe5\x91\xa4",
+        sequence_id=417,
+        token_id=-3,
+    )
+    template = Protocol.header_template(
+        Protocol.GET, header["switch_mac"], header["host_mac"]
+    )
+    built = Protocol.build_packet(template, 417, -3, payload)
+    assert built == Protocol.assemble_packet(header, payload)
+    assert Protocol.interpret_header(built)["check_length"] == len(built)
+
+
+def test_peek_header():
+    """Test the header is read from an encrypted datagram without its payload."""
+    for packet in TEST_PACKETS.values():
+        header = Protocol.peek_header(packet)
+        assert header == Protocol.parse(Protocol.decode(packet), lazy=True)[0]
+        assert Protocol.encrypt_field(header["host_mac"], Protocol.HOST_MAC_FIELD) == (
+            packet[Protocol.HOST_MAC_FIELD]
+        )
+    with pytest.raises(AssertionError):
+        Protocol.peek_header(b"\x00" * 10)
+
+
+def test_split_payload():
+    """Test TLVs are split into ordered payloads that fit one packet."""
+    items = [(8705, Protocol.set_vlan(vid, 0xFF, 0, "V" * 20)) for vid in range(200)]
+    credentials = [(512, b"admin\x00"), (514, b"admin\x00")]
+
+    batches = Protocol.split_payload(items, credentials)
+
+    assert [tlv for batch in batches for tlv in batch] == items
+    for batch in batches:
+        size = len(Protocol.assemble_packet(dict(Protocol.header["blank"]), batch))
+        assert size + 4 * 2 + 12 <= Protocol.MAX_PACKET_SIZE
+    assert len(batches) == -(-len(items) * 35 // (Protocol.MAX_PACKET_SIZE - 56))
+    assert not Protocol.split_payload([])
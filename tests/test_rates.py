@@ -0,0 +1,74 @@
+"""Rate engine tests."""
+
+import pytest
+
+import tplink_ess_lib
+from tplink_ess_lib.rates import COUNTER_WRAP, PortRates, RateEngine
+from tplink_ess_lib.records import PortStats
+
+from .common import TEST_PACKETS, switch_reply
+from .test_init import STATS_RESULT, TEST_HOST_MAC
+
+SWITCH = "70:4f:57:89:61:6a"
+
+
+def _stats(*counters):
+    """Build stats tuples for consecutive ports."""
+    return [(port, 1, 6) + tuple(c) for port, c in enumerate(counters, 1)]
+
+
+def test_rates():
+    """Test rates and error ratios between two samples."""
+    engine = RateEngine()
+    assert not engine.update(SWITCH, _stats((100, 0, 200, 0)), 10.0)
+    rates = engine.update(SWITCH, _stats((300, 0, 290, 10)), 12.0)
+    assert rates == [PortRates(1, 100.0, 50.0, 0.0, 0.1, 300, 0, 290, 10)]
+    assert engine.rates(SWITCH) == rates
+
+
+def test_counter_wrap():
+    """Test 32-bit wraps keep the 64-bit virtual counters growing."""
+    engine = RateEngine()
+    engine.update(SWITCH, _stats((COUNTER_WRAP - 50, 0, 0, 0)), 0.0)
+    rates = engine.update(SWITCH, _stats((50, 0, 0, 0)), 1.0)
+    assert rates[0].tx_pps == 100.0
+    assert rates[0].tx_good == COUNTER_WRAP + 50
+    assert engine.reboots(SWITCH) == 0
+
+
+def test_reboot():
+    """Test a counter reset is not mistaken for a wrap."""
+    engine = RateEngine()
+    engine.update(SWITCH, _stats((1000, 0, 5000, 0), (7000, 0, 10, 0)), 0.0)
+    rates = engine.update(SWITCH, _stats((20, 0, 30, 0), (7010, 0, 40, 0)), 1.0)
+    assert engine.reboots(SWITCH) == 1
+    assert rates[0].tx_pps == 20.0
+    assert rates[0].tx_good == 1020
+    assert rates[1].tx_pps == 7010.0
+
+
+@pytest.mark.parametrize("convert", [dict, PortStats._make])
+def test_input_forms(convert):
+    """Test dict and record stats entries."""
+    engine = RateEngine()
+    if convert is dict:
+        samples = [STATS_RESULT, STATS_RESULT]
+    else:
+        samples = [_stats((1, 0, 1, 0)), _stats((3, 0, 3, 0))]
+        samples = [[convert(entry) for entry in sample] for sample in samples]
+    engine.update(SWITCH, samples[0], 0.0)
+    assert len(engine.update(SWITCH, samples[1], 1.0)) == len(samples[1])
+
+
+@pytest.mark.asyncio
+async def test_tplink_port_rates(mock_network):
+    """Test update_data feeds the rate engine."""
+    mock_network.replies = [TEST_PACKETS["login1"], TEST_PACKETS["login2"]]
+    mock_network.replies += [switch_reply] * 2
+    tplink = tplink_ess_lib.TpLinkESS(host_mac=TEST_HOST_MAC, testing=True)
+    await tplink.update_data(SWITCH, ["stats"])
+    assert not tplink.port_rates(SWITCH)
+    await tplink.update_data(SWITCH, ["stats"])
+    assert [rate.port for rate in tplink.port_rates(SWITCH)] == [1, 2, 3, 4, 5]
+    assert tplink.port_rates(SWITCH)[0].tx_pps == 0.0
+    tplink.close()
@@ -0,0 +1,88 @@
+"""Reconciler tests."""
+
+import pytest
+
+from tplink_ess_lib import TpLinkESS
+from tplink_ess_lib.protocol import Protocol
+from tplink_ess_lib.reconcile import DesiredState, diff
+from tplink_ess_lib.records import PvidEntry, VlanEntry
+
+VLAN = Protocol.get_id("vlan")
+PVID = Protocol.get_id("pvid")
+
+CURRENT = {
+    "vlan": {
+        "vlan": [
+            VlanEntry(1, 0xFF, 0, "Default_VLAN"),
+            VlanEntry(10, 0x03, 0x01, "OLD"),
+            VlanEntry(20, 0x0C, 0, "LAB"),
+        ]
+    },
+    "pvid": {"pvid": [PvidEntry(port, 1) for port in range(1, 9)]},
+    "mirror": {"mirror": "00:00:00"},
+    "loop_prev": {"loop_prev": True},
+}
+
+
+def test_diff_no_drift():
+    """Test a switch already in the desired state needs no settings."""
+    desired = DesiredState(
+        vlans=CURRENT["vlan"]["vlan"],
+        pvids={1: 1, 8: 1},
+        settings={"mirror": "00:00:00", "loop_prev": True},
+        prune=True,
+    )
+    assert not diff(desired, CURRENT)
+
+
+def test_diff_minimal():
+    """Test only changed items are set, ordered so PVIDs have their VLAN."""
+    desired = DesiredState(
+        vlans=[
+            VlanEntry(1, 0xFF, 0, "Default_VLAN"),
+            VlanEntry(10, 0x03, 0x03, "OLD"),
+            VlanEntry(30, 0xF0, 0, "NEW"),
+        ],
+        pvids={5: 30, 6: 1},
+        settings={"mirror": b"\x01\x00\x02", "loop_prev": True},
+        prune=True,
+    )
+
+    assert diff(desired, CURRENT) == [
+        (VLAN, Protocol.set_vlan(10, 0x03, 0x03, "OLD")),
+        (VLAN, Protocol.set_vlan(30, 0xF0, 0, "NEW")),
+        (PVID, Protocol.set_pvid(30, 5)),
+        (Protocol.get_id("mirror"), b"\x01\x00\x02"),
+        (VLAN, Protocol.set_vlan(20, 0, 0, "")),
+    ]
+    # without prune, VLAN 20 is left alone
+    assert len(diff(desired._replace(prune=False), CURRENT)) == 4
+
+
+def test_diff_pruned_vlan_kept_empty():
+    """Test a VLAN left without members by a prune is not removed again."""
+    current = dict(
+        CURRENT, vlan={"vlan": CURRENT["vlan"]["vlan"] + [VlanEntry(40, 0, 0, "")]}
+    )
+    desired = DesiredState(vlans=CURRENT["vlan"]["vlan"], prune=True)
+    assert not diff(desired, current)
+
+
+def test_diff_dict_data():
+    """Test update_data dicts compare like compact records."""
+    data = {
+        "vlan": {"vlan": [vlan.as_dict() for vlan in CURRENT["vlan"]["vlan"]]},
+        "pvid": TpLinkESS.parse_response(
+            [(PVID, "pvid", (port, vid)) for port, vid in CURRENT["pvid"]["pvid"]]
+        ),
+    }
+    desired = DesiredState(vlans=CURRENT["vlan"]["vlan"], pvids={3: 20})
+    assert diff(desired, data) == [(PVID, Protocol.set_pvid(20, 3))]
+
+
+def test_desired_items():
+    """Test only managed items are read, and unknown settings rejected."""
+    assert not DesiredState().items()
+    assert DesiredState(pvids={}, settings={"qos1": True}).items() == ["pvid", "qos1"]
+    with pytest.raises(ValueError):
+        DesiredState(settings={"hostname": "x"}).items()
@@ -0,0 +1,149 @@
+"""Record type tests."""
+
+from unittest.mock import Mock
+
+import pytest
+
+import tplink_ess_lib
+from tplink_ess_lib.binary import ports2byte
+from tplink_ess_lib.protocol import Protocol
+from tplink_ess_lib.records import (
+    PortStats,
+    PvidEntry,
+    SwitchInfo,
+    VlanEntry,
+    VlanIndex,
+    as_dict,
+    parse_records,
+)
+
+from .common import TEST_PACKETS, switch_reply
+
+pytestmark = pytest.mark.asyncio
+
+TEST_HOST_MAC = "00:00:00:00:00:00"
+TEST_SWITCH_MAC = "70:4f:57:89:61:6a"
+
+
+def _payloads(key):
+    """Return the lazy and decoded payloads of a captured packet."""
+    data = Protocol.decode(TEST_PACKETS[key])
+    return Protocol.parse(data)[1], Protocol.parse(data, lazy=False)[1]
+
+
+async def test_records_match_parse_response():
+    """Test records convert to the parse_response dicts."""
+    for key in ("stats", "vlan", "pvid", "hostname", "ports"):
+        lazy, decoded = _payloads(key)
+        expected = tplink_ess_lib.TpLinkESS.parse_response(decoded)
+        assert parse_records(lazy) == parse_records(decoded)
+        assert as_dict(parse_records(lazy)) == expected
+
+    lazy, _ = _payloads("stats")
+    assert parse_records(lazy)["stats"][4] == PortStats(
+        5, 1, 6, 9715369, 0, 25004812, 25
+    )
+    lazy, _ = _payloads("vlan")
+    assert parse_records(lazy)["vlan"][1] == VlanEntry(50, 0b10001, 0, "GAMING")
+    lazy, _ = _payloads("pvid")
+    assert parse_records(lazy)["pvid"][0] == PvidEntry(1, 50) == (1, 50)
+    assert ports2byte("1,5") == 0b10001
+    assert ports2byte("") == 0
+
+
+async def test_compact_update_data(mock_network):
+    """Test compact mode stores records."""
+    mock_network.replies = [TEST_PACKETS["login1"], TEST_PACKETS["login2"]]
+    mock_network.replies += [switch_reply] * 4
+    tplink = tplink_ess_lib.TpLinkESS(host_mac=TEST_HOST_MAC, testing=True)
+    compact = tplink_ess_lib.TpLinkESS(
+        host_mac=TEST_HOST_MAC, testing=True, compact=True
+    )
+    names = ["hostname", "stats", "vlan", "pvid"]
+
+    data = await compact.update_data(TEST_SWITCH_MAC, names)
+    assert isinstance(data["hostname"], SwitchInfo)
+    assert data["hostname"].hostname == "switch7"
+    assert isinstance(data["stats"]["stats"][0], PortStats)
+
+    mock_network.replies = [TEST_PACKETS["login1"], TEST_PACKETS["login2"]]
+    mock_network.replies += [switch_reply] * 4
+    assert as_dict(data) == await tplink.update_data(TEST_SWITCH_MAC, names)
+    compact.close()
+    tplink.close()
+
+
+async def test_compact_skips_decoders(mock_network, monkeypatch):
+    """Test compact parsing builds records without the kind decoders."""
+    decoders = {}
+    for name in ("stats", "vlan", "pvid"):
+        codec = Protocol.schema[Protocol.get_id(name)]
+        decoders[name] = Mock(side_effect=codec.decode)
+        monkeypatch.setitem(
+            Protocol.schema, codec.type_id, codec._replace(decode=decoders[name])
+        )
+    for key in ("stats", "vlan", "pvid"):
+        _, lazy = Protocol.parse(Protocol.decode(TEST_PACKETS[key]))
+        assert parse_records(lazy)[key]
+
+    mock_network.replies = [TEST_PACKETS["login1"], TEST_PACKETS["login2"]]
+    mock_network.replies += [switch_reply] * 3
+    compact = tplink_ess_lib.TpLinkESS(
+        host_mac=TEST_HOST_MAC, testing=True, compact=True
+    )
+    data = await compact.update_data(TEST_SWITCH_MAC, ["stats", "vlan", "pvid"])
+    compact.close()
+
+    assert isinstance(data["vlan"]["vlan"][0], VlanEntry)
+    for decode in decoders.values():
+        decode.assert_not_called()
+
+
+async def test_compact_discovery(mock_network):
+    """Test compact discovery yields SwitchInfo records."""
+    mock_network.replies = [TEST_PACKETS["discovery2"]]
+    tplink = tplink_ess_lib.TpLinkESS(
+        host_mac=TEST_HOST_MAC, testing=True, compact=True
+    )
+    result = await tplink.discovery()
+    assert result == [
+        SwitchInfo(
+            type="TL-SG105E",
+            hostname="switch7",
+            mac="70:4f:57:89:61:6a",
+            firmware="1.0.0 Build 20160715 Rel.38605",
+            hardware="TL-SG105E 3.0",
+            dhcp=False,
+            ip_addr="192.168.1.109",
+            ip_mask="255.255.255.0",
+            gateway="192.168.1.4",
+        )
+    ]
+
+
+async def test_vlan_index():
+    """Test VLAN and PVID lookups by port and by VLAN."""
+    lazy, decoded = _payloads("vlan")
+    vlans = parse_records(lazy)["vlan"]
+    assert vlans[1].members == 0b10001
+    assert str(vlans[0].members) == "1,2,3,4,5"
+    pvids = parse_records(_payloads("pvid")[0])["pvid"]
+    index = VlanIndex(vlans, pvids)
+
+    assert index.vlans_of(5) == [1, 50]
+    assert index.vlans_of(2) == [1]
+    assert index.vlans_of(9) == []
+    assert index.tagged_vlans_of(1) == []
+    assert list(index.ports_of(50)) == [1, 5]
+    assert not index.ports_of(99)
+    assert index.pvid_of(1) == 50
+    assert list(index.ports_with_pvid(1)) == [2, 3, 4, 5]
+
+    data = {
+        "vlan": tplink_ess_lib.TpLinkESS.parse_response(decoded),
+        "pvid": tplink_ess_lib.TpLinkESS.parse_response(_payloads("pvid")[1]),
+    }
+    from_dicts = VlanIndex.from_data(data)
+    assert from_dicts.vlans == index.vlans
+    assert from_dicts.pvids == index.pvids
+    assert VlanIndex.from_data({}).vlans_of(1) == []
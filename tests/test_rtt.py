@@ -0,0 +1,36 @@
+"""RTT estimator tests."""
+
+import pytest
+
+from tplink_ess_lib.rtt import RttEstimator
+
+
+def test_first_sample():
+    """Test the first sample sets SRTT and half of it as variance."""
+    estimator = RttEstimator()
+    estimator.sample(0.1)
+    assert estimator.srtt == 0.1
+    assert estimator.rttvar == 0.05
+    assert estimator.rto == pytest.approx(0.3)
+
+
+def test_smoothing():
+    """Test later samples are smoothed and a steady RTT shrinks the timeout."""
+    estimator = RttEstimator()
+    for _ in range(50):
+        estimator.sample(0.02)
+    assert estimator.srtt == pytest.approx(0.02)
+    assert estimator.rto == RttEstimator.MIN_RTO
+    estimator.sample(0.5)
+    assert estimator.srtt == pytest.approx(0.02 + (0.5 - 0.02) / 8)
+    assert estimator.rto > 0.2
+
+
+def test_backoff():
+    """Test timeouts double the RTO up to the maximum."""
+    estimator = RttEstimator(initial_rto=1.0)
+    estimator.backoff()
+    assert estimator.rto == 2.0
+    for _ in range(5):
+        estimator.backoff()
+    assert estimator.rto == RttEstimator.MAX_RTO
@@ -0,0 +1,96 @@
+"""Session tests."""
+
+import pytest
+
+import tplink_ess_lib
+from tplink_ess_lib.network import ConnectionProblem
+from tplink_ess_lib.protocol import Protocol
+
+from .common import make_reply, switch_reply
+
+pytestmark = pytest.mark.asyncio
+
+TEST_HOST_MAC = "1c:1b:0d:e5:91:a4"
+TEST_SWITCH_MAC = "70:4f:57:89:61:6a"
+
+
+class TokenSwitch:
+    """Fake switch that hands out tokens and rejects stale ones."""
+
+    def __init__(self, password="secret"):
+        """Initialize."""
+        self.token = 100
+        self.password = password
+        self.logins = 0
+
+    def __call__(self, request, payload):
+        """Answer one request."""
+        ids = [type_id for type_id, _ in payload]
+        if Protocol.get_id("get_token_id") in ids:
+            self.token += 1
+            return make_reply(request, token_id=self.token)
+        if request["op_code"] == Protocol.LOGIN:
+            password = dict(payload)[Protocol.get_id("password")]
+            if password != self.password.encode("ascii") + b"\x00":
+                return make_reply(request, error_code=-1)
+            self.logins += 1
+            return make_reply(request, token_id=self.token)
+        if request["token_id"] != self.token:
+            return make_reply(request, error_code=-1)
+        return switch_reply(request, payload)
+
+
+async def test_session_reuses_login(mock_network):
+    """Test polls reuse the sockets and token of the previous poll."""
+    switch = TokenSwitch()
+    mock_network.replies = [switch] * 20
+    tplink = tplink_ess_lib.TpLinkESS(host_mac=TEST_HOST_MAC, pwd="secret")
+
+    await tplink.update_data(TEST_SWITCH_MAC, ["num_ports"])
+    sent = len(mock_network.sent)
+    assert sent == 3
+    assert (await tplink.update_data(TEST_SWITCH_MAC, ["num_ports"]))["num_ports"] == {
+        "num_ports": 5
+    }
+    assert len(mock_network.sent) == sent + 1
+    assert switch.logins == 1
+    assert mock_network.socket.bind.call_count == 1
+
+    # token expires on the switch side: log in again and retry once
+    switch.token += 10
+    await tplink.update_data(TEST_SWITCH_MAC, ["num_ports"])
+    assert switch.logins == 2
+    assert (await tplink.session(TEST_SWITCH_MAC)).logins == 2
+    tplink.close()
+
+
+async def test_session_login_rejected(mock_network):
+    """Test a rejected login raises."""
+    mock_network.replies = [TokenSwitch()] * 4
+    async with tplink_ess_lib.TpLinkESS(host_mac=TEST_HOST_MAC, pwd="wrong") as tplink:
+        with pytest.raises(ConnectionProblem):
+            await tplink.update_data(TEST_SWITCH_MAC, ["num_ports"])
+
+
+async def test_set_many_keeps_applied_half(mock_network):
+    """Test items applied before the switch stopped answering are kept."""
+    switch = TokenSwitch()
+    credentials = {Protocol.get_id("username"), Protocol.get_id("password")}
+
+    def _answer(request, payload):
+        settings = [tlv for tlv in payload if tlv[0] not in credentials]
+        if request["op_code"] == Protocol.LOGIN and len(settings) > 1:
+            return make_reply(request, error_code=-1, token_id=switch.token)
+        if settings and settings[0][1] == b"two\x00":
+            return []
+        return switch(request, payload)
+
+    mock_network.replies = [_answer] * 10
+    hostname = Protocol.get_id("hostname")
+    async with tplink_ess_lib.TpLinkESS(host_mac=TEST_HOST_MAC, pwd="secret") as ess:
+        results = await ess.set_many(
+            TEST_SWITCH_MAC, [(hostname, b"one\x00"), (hostname, b"two\x00")]
+        )
+
+    assert results[0] is None
+    assert isinstance(results[1], ConnectionProblem)
@@ -0,0 +1,309 @@
+"""Simulator tests, over real loopback sockets."""
+
+import asyncio
+import gc
+import socket
+from unittest.mock import patch
+
+import pytest
+import pytest_asyncio
+
+from tplink_ess_lib import TpLinkESS
+from tplink_ess_lib.fleet import Fleet
+from tplink_ess_lib.network import AsyncNetwork
+from tplink_ess_lib.protocol import Protocol
+from tplink_ess_lib.reconcile import DesiredState
+from tplink_ess_lib.records import VlanEntry
+from tplink_ess_lib.session import Session
+from tplink_ess_lib.simulator import SwitchSimulator
+
+pytestmark = pytest.mark.asyncio
+
+TEST_HOST_MAC = "1c:1b:0d:e5:91:a4"
+
+
+async def _connect(simulator):
+    """Open a network that talks to the simulator on loopback."""
+    address, port = simulator.address
+    network = await AsyncNetwork(
+        TEST_HOST_MAC, address=address, send_port=port, receive_port=0
+    ).open()
+    simulator.reply_port = network.receive_address[1]
+    return network
+
+
+@pytest_asyncio.fixture
+async def simulated():
+    """Yield a function starting a simulator and a network connected to it."""
+    opened = []
+
+    async def _start(**kwargs):
+        simulator = await SwitchSimulator(**kwargs).start()
+        network = await _connect(simulator)
+        opened.extend((simulator, network))
+        return simulator, network
+
+    yield _start
+    for item in opened:
+        item.close()
+
+
+async def test_simulator_discovery(simulated):
+    """Test every simulated switch answers a broadcast discovery."""
+    simulator, network = await simulated(count=5, jitter=0.005, seed=1)
+    ess = TpLinkESS(TEST_HOST_MAC, network=network)
+
+    switches = await ess.discovery(timeout=1, max_switches=5)
+
+    assert sorted(switch["mac"] for switch in switches) == simulator.macs
+    assert switches[0]["type"] == "TL-SG108E"
+
+
+async def test_simulator_fleet_update_data(simulated):
+    """Test a fleet polls simulated switches through login and GET."""
+    simulator, network = await simulated(count=3, num_ports=5, seed=2)
+
+    async with Fleet(TEST_HOST_MAC, "admin", "admin", network=network) as fleet:
+        data = await fleet.update_data(simulator.macs)
+        await asyncio.sleep(0.01)
+        await fleet.update_data(simulator.macs, ["stats"])
+        switch = await fleet.switch(simulator.macs[0])
+
+    assert set(data) == set(simulator.macs)
+    first = data[simulator.macs[0]]
+    assert first["hostname"]["hostname"] == "sim00001"
+    assert first["num_ports"] == {"num_ports": 5}
+    assert len(first["stats"]["stats"]) == 5
+    assert first["vlan"]["vlan"][0]["VLAN Name"] == "Default_VLAN"
+    assert len(switch.port_rates(simulator.macs[0])) == 5
+    assert not network._pending  # pylint: disable=protected-access
+
+
+async def test_simulator_instances_share_default_port():
+    """Test standalone instances share one network on the default reply port."""
+    simulator = await SwitchSimulator(count=2).start()
+    address, port = simulator.address
+    first = TpLinkESS(TEST_HOST_MAC, "admin", "admin")
+    second = TpLinkESS(TEST_HOST_MAC, "admin", "admin")
+    try:
+        with patch.object(AsyncNetwork, "BROADCAST_ADDR", address), patch.object(
+            AsyncNetwork, "UDP_SEND_TO_PORT", port
+        ):
+            await first.update_data(simulator.macs[0], ["num_ports"])
+            await second.update_data(simulator.macs[1], ["num_ports"])
+            network = await first._get_network()  # pylint: disable=protected-access
+            first.close()
+            await second.update_data(simulator.macs[1], ["num_ports"])
+            # an instance dropped without close() gives its share back
+            dropped = TpLinkESS(TEST_HOST_MAC, "admin", "admin")
+            await dropped.update_data(simulator.macs[0], ["num_ports"])
+            del dropped
+            gc.collect()
+            second.close()
+    finally:
+        simulator.close()
+        second.close()
+
+    assert network.receive_address is None
+    await asyncio.sleep(0)  # transports close their sockets on the next turn
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind((address, AsyncNetwork.UDP_RECEIVE_FROM_PORT))
+
+
+async def test_simulator_cache_per_switch(simulated):
+    """Test items that are not due are served from the polled switch's data."""
+    simulator, network = await simulated(count=2)
+    first, second = simulator.macs
+    ess = TpLinkESS(TEST_HOST_MAC, "admin", "admin", network=network)
+
+    await ess.update_data(first)
+    await ess.update_data(second)
+    data = await ess.update_data(first)
+
+    assert data["hostname"]["hostname"] == "sim00001"
+    assert data["hostname"]["mac"] == first
+    assert (await ess.update_data(second))["hostname"]["hostname"] == "sim00002"
+    assert ess.vlan_index(first).pvid_of(1) == 1
+
+
+async def test_simulator_token_expiry(simulated):
+    """Test an expired token is rejected and the session logs in again."""
+    simulator, network = await simulated(token_ttl=0.05)
+    session = Session(network, simulator.macs[0], "admin", "admin")
+
+    await session.query(Protocol.GET, [(10, b"")])
+    await asyncio.sleep(0.1)
+    header, payload = await session.query(Protocol.GET, [(10, b"")])
+
+    assert header["error_code"] == 0
+    assert payload == [(10, "num_ports", 8)]
+    assert session.logins == 2
+
+
+async def test_simulator_slow_login(simulated):
+    """Test a login slower than the retransmit timeout starts over, unresent."""
+    simulator, network = await simulated(latency=0.03)
+    session = Session(network, simulator.macs[0], "admin", "admin")
+    estimator = network.rtt(session.switch_mac)
+    estimator.rto = estimator.min_rto = 0.01
+
+    await session.login()
+
+    assert session.logged_in
+    assert network.retransmits == 0
+    assert estimator.samples == 2
+
+
+async def test_simulator_bad_login(simulated):
+    """Test wrong credentials are rejected."""
+    simulator, network = await simulated()
+    session = Session(network, simulator.macs[0], "admin", "wrong")
+
+    with pytest.raises(Exception, match="login rejected"):
+        await session.login()
+
+
+async def test_simulator_set(simulated):
+    """Test a LOGIN carrying settings changes the switch."""
+    simulator, network = await simulated()
+    switch = simulator.switches[next(iter(simulator.switches))]
+
+    await network.set(
+        switch.mac,
+        "admin",
+        "admin",
+        [
+            (Protocol.get_id("hostname"), b"renamed\x00"),
+            (Protocol.get_id("vlan"), Protocol.set_vlan(50, 0x11, 0x01, "GAMING")),
+            (Protocol.get_id("pvid"), Protocol.set_pvid(50, 1)),
+        ],
+    )
+
+    assert switch.hostname == "renamed"
+    assert switch.vlans[50] == (0x11, 0x01, "GAMING")
+    assert switch.pvids[1] == 50
+
+
+async def test_simulator_set_many(simulated):
+    """Test a VLAN plan is pushed with one login and per-item results."""
+    simulator, network = await simulated(count=2)
+    plan = [
+        (Protocol.get_id("vlan"), Protocol.set_vlan(vid, 0xFF, 0x0F, f"VLAN{vid}"))
+        for vid in range(2, 100)
+    ]
+    plan += [(Protocol.get_id("pvid"), Protocol.set_pvid(10, port)) for port in (1, 9)]
+
+    async with Fleet(TEST_HOST_MAC, "admin", "admin", network=network) as fleet:
+        results = await fleet.set_many({mac: plan for mac in simulator.macs})
+
+    # get_token_id and LOGIN, two packets of settings, a new login and a
+    # retry of the rejected second packet, then its halves down to the bad PVID
+    assert simulator.received == 2 * (2 + 2 + 2 + 1 + 10)
+    for mac in simulator.macs:
+        assert results[mac][:-1] == [None] * (len(plan) - 1)
+        assert "pvid rejected" in str(results[mac][-1])
+    switch = simulator.switches[next(iter(simulator.switches))]
+    assert switch.vlans[59] == (0xFF, 0x0F, "VLAN59")
+    assert switch.pvids[1] == 10
+
+
+async def test_simulator_set_many_jitter(simulated):
+    """Test settings slower than the retransmit timeout start over, unresent."""
+    simulator, network = await simulated(latency=0.02, jitter=0.015, seed=5)
+    session = Session(network, simulator.macs[0], "admin", "admin")
+    await session.login()
+    # the login sampled the RTT; make the settings outlast the timeout
+    estimator = network.rtt(session.switch_mac)
+    estimator.rto = estimator.min_rto = 0.01
+    plan = [
+        (Protocol.get_id("vlan"), Protocol.set_vlan(vid, 0x03, 0, f"VLAN{vid}"))
+        for vid in range(2, 6)
+    ]
+    plan += [(Protocol.get_id("pvid"), Protocol.set_pvid(5, port)) for port in (1, 2)]
+
+    results = await session.set_many(plan)
+
+    assert results == [None] * len(plan)
+    assert network.retransmits == 0
+    switch = simulator.switches[next(iter(simulator.switches))]
+    assert switch.vlans[5] == (0x03, 0, "VLAN5")
+    assert switch.pvids[2] == 5
+
+
+async def test_simulator_set_many_no_reply(simulated):
+    """Test items are not sent once the switch stops answering."""
+    simulator, network = await simulated(loss=1.0)
+    session = Session(network, simulator.macs[0], "admin", "admin")
+    session.logged_in = True
+    network.rtt(simulator.macs[0]).rto = 1
+
+    results = await session.set_many(
+        [(Protocol.get_id("pvid"), Protocol.set_pvid(1, port)) for port in (1, 2)],
+        timeout=0.05,
+    )
+
+    assert [str(result) for result in results] == ["timeout", "timeout"]
+    assert simulator.received == 1
+
+
+async def test_simulator_reconcile(simulated):
+    """Test a fleet converges with minimal settings, then sends none."""
+    simulator, network = await simulated(count=3, seed=4)
+    desired = DesiredState(
+        vlans=[
+            VlanEntry(1, 0x0F, 0, "Default_VLAN"),
+            VlanEntry(20, 0xF0, 0x80, "IOT"),
+        ],
+        pvids={port: 20 for port in range(5, 9)},
+        settings={"loop_prev": True},
+        prune=True,
+    )
+
+    async with Fleet(TEST_HOST_MAC, "admin", "admin", network=network) as fleet:
+        sent = await fleet.reconcile({mac: desired for mac in simulator.macs})
+        received = simulator.received
+        again = await fleet.reconcile({mac: desired for mac in simulator.macs})
+
+    for mac in simulator.macs:
+        assert len(sent[mac]) == 2 + 4 + 1
+        assert all(result is None for _, result in sent[mac])
+    assert again == {mac: [] for mac in simulator.macs}
+    # the second pass only reads vlan, pvid and loop_prev in one GET
+    assert simulator.received == received + len(simulator.macs)
+    switch = simulator.switches[next(iter(simulator.switches))]
+    assert switch.vlans == {1: (0x0F, 0, "Default_VLAN"), 20: (0xF0, 0x80, "IOT")}
+
+
+async def test_simulator_loss(simulated):
+    """Test lost requests time out."""
+    simulator, network = await simulated(loss=1.0, require_login=False)
+
+    with pytest.raises(Exception, match="timeout"):
+        await network.query(simulator.macs[0], Protocol.GET, [(10, b"")], 0.05)
+    assert simulator.dropped == 1
+
+
+async def test_simulator_loss_recovered(simulated):
+    """Test retransmits recover lossy switches without a long stall."""
+    simulator, network = await simulated(count=20, loss=0.3, seed=3)
+    network.MAX_RETRANSMITS = 10
+    for mac in simulator.macs:
+        network.rtt(mac).rto = 0.02
+
+    async with Fleet(TEST_HOST_MAC, "admin", "admin", network=network) as fleet:
+        data = await fleet.update_data(simulator.macs, ["num_ports"])
+
+    assert simulator.dropped
+    assert network.retransmits
+    assert len(data) == 20
+
+
+async def test_simulator_latency(simulated):
+    """Test replies are delayed by the configured latency."""
+    simulator, network = await simulated(latency=0.05, require_login=False)
+    loop = asyncio.get_running_loop()
+
+    start = loop.time()
+    await network.query(simulator.macs[0], Protocol.GET, [(10, b"")], 1)
+
+    assert loop.time() - start >= 0.05
@@ -1,11 +1,20 @@
 """Provide a package for tplink-ess-lib."""
 from __future__ import annotations
 
+import asyncio
 import logging
-from typing import Any, Dict
+import time
+import weakref
+from typing import Any, AsyncIterator, Dict, Optional
 
-from .network import ConnectionProblem, MissingMac, Network
+from .network import AsyncNetwork, ConnectionProblem, MissingMac, Network
 from .protocol import Protocol
+from .rates import PortRates, RateEngine
+from .capture import Recorder
+from .metrics import Metrics
+from .records import LINK_STATUS, STATUS, SwitchInfo, VlanIndex, parse_records
+from .reconcile import DesiredState, diff
+from .session import Session
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -14,19 +23,8 @@ class TpLinkESS:
     """Represent a TP-Link ESS switch."""
 
     RESULT_FIELD_LOOKUP = {
-        "Status": {
-            0: "Disabled",
-            1: "Enabled",
-        },
-        "Link Status": {
-            0: "Link Down",
-            1: "AUTO",
-            2: "MH10",
-            3: "MF10",
-            4: "MH100",
-            5: "100Full",
-            6: "1000Full",
-        },
+        "Status": STATUS,
+        "Link Status": LINK_STATUS,
     }
 
     RESULT_TYPE_FIELDS = {
@@ -59,10 +57,60 @@ class TpLinkESS:
 
     tp_ids = {v[1]: k for k, v in working_ids_tp.items()}
 
+    # Estimated reply size in bytes (fixed, per port) for each item, used to
+    # pack as many items as fit into one GET without overflowing a datagram.
+    RESPONSE_SIZE_HINTS = {
+        2: (160, 0),
+        10: (5, 0),
+        4096: (0, 11),
+        4608: (4, 1),
+        8192: (6, 0),
+        8705: (1002, 0),
+        8706: (5, 7),
+        12288: (5, 0),
+        12289: (4, 1),
+        16640: (4, 1),
+        16384: (0, 23),
+        17152: (5, 0),
+    }
+
+    DEFAULT_NUM_PORTS = 24  # assumed until the switch reports num_ports
+    PIPELINE_WINDOW = 4  # GET packets in flight per switch during update_data
+
+    # Seconds between refreshes of each item in update_data; items that are
+    # not due are served from the cached data. 0 refreshes on every poll.
+    REFRESH_INTERVALS = {
+        "hostname": 3600,
+        "num_ports": 3600,
+        "ports": 0,
+        "stats": 0,
+    }
+    DEFAULT_REFRESH_INTERVAL = 300
+
     def __init__(
-        self, host_mac: str = "", user: str = "", pwd: str = "", testing: bool = False
+        self,
+        host_mac: str = "",
+        user: str = "",
+        pwd: str = "",
+        testing: bool = False,
+        network: Optional[AsyncNetwork] = None,
+        window: int = PIPELINE_WINDOW,
+        compact: bool = False,
+        refresh_intervals: Optional[Dict[str, float]] = None,
+        metrics: Optional[Metrics] = None,
+        capture: Optional[Recorder] = None,
     ) -> None:
-        """Connect or discover a TP-Link ESS switch on the network."""
+        """
+        Connect or discover a TP-Link ESS switch on the network.
+
+        Pass an open network to share one receive socket with other
+        instances (see Fleet); it is then left open by close(). window is
+        the number of GET packets kept in flight per switch. With compact
+        set, parsed data holds record objects (see records.as_dict).
+        refresh_intervals overrides entries of REFRESH_INTERVALS. metrics,
+        e.g. a MetricsRegistry, collects counters and timings of the network
+        this instance opens, and capture (see capture.py) its datagrams.
+        """
         if not host_mac:
             _LOGGER.error("MAC address missing.")
             raise MissingMac
@@ -70,67 +118,279 @@ class TpLinkESS:
         self._user = user
         self._pwd = pwd
         self._host_mac = host_mac
-        self._data: Dict[Any, Any] = {}
+        self._data: Dict[str, Dict[str, Any]] = {}  # per switch MAC
         self._testing = testing
+        self._window = window
+        self._compact = compact
+        self.rates = RateEngine()
+        self._refresh_intervals = {
+            **TpLinkESS.REFRESH_INTERVALS,
+            **(refresh_intervals or {}),
+        }
+        self._refreshed: Dict[tuple, float] = {}
+        self._network: Optional[AsyncNetwork] = network
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._release: Optional[weakref.finalize] = None
+        self._sessions: Dict[str, Session] = {}
+        self._metrics = metrics
+        self._capture = capture
+
+    async def __aenter__(self):
+        """Enter method."""
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, exc_tb):
+        """Exit method."""
+        self.close()
+
+    def close(self) -> None:
+        """Close the network and forget all switch sessions."""
+        if self._release is not None:
+            self._release()
+            self._release = None
+            self._network = None
+        self._sessions = {}
+
+    async def _get_network(self) -> AsyncNetwork:
+        """
+        Return the network, taking the loop's shared one on first use.
+
+        Instances without a network of their own share one per event loop
+        (see AsyncNetwork.shared). It is given back by close(), or when the
+        instance is garbage collected, and replaced if the instance is used
+        from another event loop, e.g. by successive asyncio.run calls.
+        """
+        loop = asyncio.get_running_loop()
+        if self._release is not None and self._loop is not loop:
+            self.close()
+        if self._network is None:
+            self._network = await AsyncNetwork.shared(
+                self._host_mac,
+                testing=self._testing,
+                lazy=self._compact,
+                metrics=self._metrics,
+                capture=self._capture,
+            )
+            self._loop = loop
+            self._release = weakref.finalize(self, self._network.release)
+        return self._network
+
+    async def session(self, switch_mac: str) -> Session:
+        """Return the persistent session for a switch."""
+        if (session := self._sessions.get(switch_mac)) is None:
+            session = Session(
+                await self._get_network(), switch_mac, self._user, self._pwd
+            )
+            self._sessions[switch_mac] = session
+        return session
 
-    async def discovery(self) -> list[dict]:
+    async def discovery(
+        self,
+        timeout: Optional[float] = None,
+        quiet: Optional[float] = None,
+        max_switches: Optional[int] = None,
+    ) -> list[dict]:
         """Return a list of unique switches found by discovery."""
-        switches = {}
-        with Network(self._host_mac, testing=self._testing) as net:
-            net.send(Network.BROADCAST_MAC, Protocol.DISCOVERY, {})
-            while True:
-                try:
-                    header, payload = net.receive()
-                    switches[header["switch_mac"]] = TpLinkESS.parse_response(payload)
-                except ConnectionProblem:
-                    break
-        return list(switches.values())
-
-    async def query(self, switch_mac: str, action: str) -> dict:
+        return [switch async for switch in self.discover(timeout, quiet, max_switches)]
+
+    async def discover(
+        self,
+        timeout: Optional[float] = None,
+        quiet: Optional[float] = None,
+        max_switches: Optional[int] = None,
+    ) -> AsyncIterator[dict]:
+        """
+        Yield each unique switch as soon as its discovery reply is parsed.
+
+        Stops at the overall timeout (default Network.RECEIVE_TIMEOUT), after
+        quiet seconds without a new reply, or once max_switches were found.
+        """
+        seen = set()
+        net = await self._get_network()
+        replies = net.replies(
+            Network.BROADCAST_MAC, Protocol.DISCOVERY, {}, timeout, quiet
+        )
+        try:
+            async for header, payload in replies:
+                if header["switch_mac"] in seen:
+                    continue
+                seen.add(header["switch_mac"])
+                if self._compact:
+                    yield SwitchInfo.from_payload(payload)
+                else:
+                    yield TpLinkESS.parse_response(payload)
+                if max_switches is not None and len(seen) >= max_switches:
+                    return
+        finally:
+            await replies.aclose()
+
+    async def query(self, switch_mac: str, action) -> dict:
         """
         Send a query.
 
         Sends a query to a specific switch and return the results
-        as a dict.
+        as a dict. A list of actions is sent in as few packets as possible
+        and returns a dict of results keyed by action.
         """
-        with Network(host_mac=self._host_mac, testing=self._testing) as net:
-            header, payload = net.query(  # pylint: disable=unused-variable
+        names = [action] if isinstance(action, str) else list(action)
+        results = {}
+        net = await self._get_network()
+        for batch in self._batch_actions(
+            switch_mac, [Protocol.tp_ids[n] for n in names]
+        ):
+            _, payload = await net.query(
                 switch_mac=switch_mac,
                 op_code=Protocol.GET,
-                payload=[(Protocol.tp_ids[action], b"")],
+                payload=[(type_id, b"") for type_id in batch],
             )
-            return TpLinkESS.parse_response(payload)
+            if isinstance(action, str):
+                return TpLinkESS.parse_response(payload)
+            for type_id, tlvs in TpLinkESS._group_payload(batch, payload).items():
+                results[Protocol.ids_tp[type_id][1]] = TpLinkESS.parse_response(tlvs)
+        return results
 
     async def update_data(self, switch_mac, action_names=None) -> dict:
-        """Refresh switch data. Optional list of items to query (default all)."""
+        """
+        Refresh switch data.
+
+        Optional list of items to query; by default every item whose
+        refresh interval has elapsed, the rest are served from the data
+        cached for this switch.
+        """
+        now = time.monotonic()
+        data = self._data.setdefault(switch_mac, {})
+        if action_names is None:
+            actions = self._due_actions(switch_mac, now)
+            if not actions:
+                return data
+        else:
+            actions = [TpLinkESS.tp_ids[name] for name in action_names]
         try:
-            net = Network(host_mac=self._host_mac, testing=self._testing)
+            session = await self.session(switch_mac)
         except OSError as err:
             _LOGGER.error("Problems with network interface: %s", err)
             raise err
-        # Login to switch
-        net.login(switch_mac, self._user, self._pwd)
-        if action_names is None:
-            actions = TpLinkESS.working_ids_tp
-        else:
-            actions = {
-                TpLinkESS.tp_ids[name]: TpLinkESS.working_ids_tp[TpLinkESS.tp_ids[name]]
-                for name in action_names
-            }
 
-        for action in actions:
-            try:
-                header, payload = net.query(  # pylint: disable=unused-variable
-                    switch_mac=switch_mac,
-                    op_code=Protocol.GET,
-                    payload=[(action, b"")],
-                )
+        batches = self._batch_actions(switch_mac, actions)
+        results = await session.query_many(
+            [(Protocol.GET, [(action, b"") for action in batch]) for batch in batches],
+            window=self._window,
+        )
+        # nothing answered this poll: report it instead of stale data
+        if results and all(isinstance(r, ConnectionProblem) for r in results):
+            raise results[0]
+        for batch, result in zip(batches, results):
+            if isinstance(result, ConnectionProblem):
+                continue
+            for action in batch:
+                self._refreshed[(switch_mac, action)] = now
+            for action, tlvs in TpLinkESS._group_payload(batch, result[1]).items():
                 index = TpLinkESS.working_ids_tp[action][1]
-                self._data[index] = TpLinkESS.parse_response(payload)
-            except ConnectionProblem:
-                break
+                data[index] = self._parse(action, tlvs)
+                if index == "stats":
+                    self.rates.update(switch_mac, data[index].get("stats", []))
+
+        return data
+
+    async def set_many(self, switch_mac: str, items) -> list:
+        """
+        Apply many settings to a switch with one login (see Session.set_many).
+
+        Returns the result of every item, None when applied. Cached data is
+        refreshed on the next update_data.
+        """
+        session = await self.session(switch_mac)
+        results = await session.set_many(items)
+        for key in [key for key in self._refreshed if key[0] == switch_mac]:
+            del self._refreshed[key]
+        return results
+
+    async def reconcile(self, switch_mac: str, desired: DesiredState) -> list:
+        """
+        Bring a switch to the desired state, sending only what differs.
 
-        return self._data
+        Reads the managed items, then applies the diff (see reconcile.diff)
+        with set_many. Returns (setting, result) pairs of what was sent;
+        empty, with nothing sent, when the switch already matches.
+        """
+        data = await self.update_data(switch_mac, desired.items())
+        if not (changes := diff(desired, data)):
+            return []
+        return list(zip(changes, await self.set_many(switch_mac, changes)))
+
+    def _due_actions(self, switch_mac: str, now: float) -> list[int]:
+        """Return the items whose refresh interval has elapsed."""
+        due = []
+        for action, (_, name, _) in TpLinkESS.working_ids_tp.items():
+            refreshed = self._refreshed.get((switch_mac, action))
+            interval = self._refresh_intervals.get(
+                name, TpLinkESS.DEFAULT_REFRESH_INTERVAL
+            )
+            if refreshed is None or now - refreshed >= interval:
+                due.append(action)
+        return due
+
+    def vlan_index(self, switch_mac: str) -> VlanIndex:
+        """Return the VLAN and PVID indexes of a switch's last vlan and pvid data."""
+        return VlanIndex.from_data(self._data.get(switch_mac, {}))
+
+    def port_rates(self, switch_mac: str) -> list[PortRates]:
+        """Return per-port rates between the last two stats polls."""
+        return self.rates.rates(switch_mac)
+
+    def _parse(self, action: int, payload) -> Any:
+        """Parse the TLVs of one item as dicts, or records when compact."""
+        if not self._compact:
+            return TpLinkESS.parse_response(payload)
+        if action == Protocol.get_id("hostname"):
+            return SwitchInfo.from_payload(payload)
+        return parse_records(payload)
+
+    def _batch_actions(self, switch_mac: str, actions) -> list[list[int]]:
+        """Split type ids into GET batches whose replies fit in one datagram."""
+        num_ports = (
+            self._data.get(switch_mac, {})
+            .get("num_ports", {})
+            .get("num_ports", TpLinkESS.DEFAULT_NUM_PORTS)
+        )
+        budget = (
+            Protocol.MAX_PACKET_SIZE - Protocol.header["len"] - len(Protocol.PACKET_END)
+        )
+        batches: list[list[int]] = []
+        used = budget
+        for action in actions:
+            fixed, per_port = TpLinkESS.RESPONSE_SIZE_HINTS.get(action, (0, 0))
+            size = fixed + per_port * num_ports
+            if used + size > budget:
+                batches.append([])
+                used = 0
+            batches[-1].append(action)
+            used += size
+        return batches
+
+    @staticmethod
+    def _group_payload(type_ids, payload) -> Dict[int, list]:
+        """
+        Split a multi-TLV reply into the TLVs belonging to each requested id.
+
+        Switches answer an item with related TLVs around it (the hostname
+        query returns the whole system block, vlan comes with vlan_enabled
+        and vlan_filler). Unrequested TLVs stay with the current item while
+        they are in the same id range, otherwise join the nearest requested id.
+        Without any requested id, every TLV is dropped.
+        """
+        groups: Dict[int, list] = {type_id: [] for type_id in type_ids}
+        if not groups:
+            return {}
+        current = None
+        for tlv in payload:
+            type_id = tlv[0]
+            if type_id in groups:
+                current = type_id
+            elif current is None or current >> 8 != type_id >> 8:
+                current = min(groups, key=lambda k, t=type_id: abs(k - t))
+            groups[current].append(tlv)
+        return {type_id: tlvs for type_id, tlvs in groups.items() if tlvs}
 
     @staticmethod
     def _map_data_fields(type_name: str, data):
@@ -158,7 +418,7 @@ class TpLinkESS:
         for type_id, type_name, data in payload:  # pylint: disable=unused-variable
             if isinstance(data, (tuple, list)):
                 data = TpLinkESS._map_data_fields(type_name, data)
-                output[type_name] = output.get(type_name, []) + [data]
+                output.setdefault(type_name, []).append(data)
             else:
                 if type_name in output:
                     if isinstance(output[type_name], list):
@@ -1,16 +1,42 @@
 """Binary helper for tplink_ess_lib."""
 
+from __future__ import annotations
+
+from typing import Iterable, Iterator, Optional, Union
+
 SEP = ","
 
+PORT_MASK = 0xFFFFFFFF  # VLAN masks are 32 bits wide, port 1 is bit 0
+
+
+def _iter_ports(mask: int) -> Iterator[int]:
+    """Yield the 1-based port number of every set bit, lowest first."""
+    mask &= PORT_MASK
+    while mask:
+        low = mask & -mask
+        yield low.bit_length()
+        mask ^= low
+
+
+# port number strings of every byte value, for each byte of a mask
+_BYTE_PORTS = [
+    [
+        tuple(str(8 * shift + bit + 1) for bit in range(8) if value >> bit & 1)
+        for value in range(256)
+    ]
+    for shift in range(4)
+]
+
 
 def byte2ports(byte):
     """Convert bytes to ports."""
-    out = []
-    for i in range(32):
-        if byte % 2:
-            out.append(str(i + 1))
-        byte >>= 1
-    return SEP.join(out)
+    byte &= PORT_MASK
+    return SEP.join(
+        _BYTE_PORTS[0][byte & 255]
+        + _BYTE_PORTS[1][byte >> 8 & 255]
+        + _BYTE_PORTS[2][byte >> 16 & 255]
+        + _BYTE_PORTS[3][byte >> 24]
+    )
 
 
 def mac_to_bytes(mac):
@@ -21,3 +47,115 @@ def mac_to_bytes(mac):
 def mac_to_str(mac):
     """Convert mac bytes to a string."""
     return ":".join(format(s, "02x") for s in mac)
+
+
+def ports2byte(ports):
+    """Convert a comma-separated port list to a bit mask."""
+    mask = 0
+    for port in ports.split(SEP):
+        if port:
+            mask |= 1 << (int(port) - 1)
+    return mask
+
+
+class PortSet:
+    """
+    Immutable set of switch ports backed by an integer bit mask.
+
+    Membership is a shift and a mask; set operations combine masks. The
+    comma-separated string form used by parse_response is built on first
+    use by str().
+    """
+
+    __slots__ = ("mask", "_text")
+
+    def __init__(self, mask: int = 0) -> None:
+        """Initialize from a bit mask, port 1 being the lowest bit."""
+        self.mask = mask & PORT_MASK
+        self._text: Optional[str] = None
+
+    @classmethod
+    def from_ports(cls, ports: Iterable[int]) -> PortSet:
+        """Return the set of the given port numbers."""
+        mask = 0
+        for port in ports:
+            mask |= 1 << (port - 1)
+        return cls(mask)
+
+    @classmethod
+    def parse(cls, text: str) -> PortSet:
+        """Return the set of a comma-separated port list."""
+        return cls(ports2byte(text))
+
+    def __contains__(self, port) -> bool:
+        """Return True if port is in the set."""
+        return isinstance(port, int) and port > 0 and bool(self.mask >> (port - 1) & 1)
+
+    def __iter__(self) -> Iterator[int]:
+        """Iterate over the ports in ascending order."""
+        return _iter_ports(self.mask)
+
+    def __len__(self) -> int:
+        """Return the number of ports."""
+        return bin(self.mask).count("1")
+
+    def __bool__(self) -> bool:
+        """Return True unless empty."""
+        return bool(self.mask)
+
+    def __int__(self) -> int:
+        """Return the bit mask."""
+        return self.mask
+
+    __index__ = __int__
+
+    @staticmethod
+    def _mask_of(other: Union[PortSet, int]) -> int:
+        """Return the mask of a PortSet or int operand."""
+        return other.mask if isinstance(other, PortSet) else int(other)
+
+    def __or__(self, other) -> PortSet:
+        """Return the union."""
+        return PortSet(self.mask | self._mask_of(other))
+
+    def __and__(self, other) -> PortSet:
+        """Return the intersection."""
+        return PortSet(self.mask & self._mask_of(other))
+
+    def __sub__(self, other) -> PortSet:
+        """Return the ports not in other."""
+        return PortSet(self.mask & ~self._mask_of(other))
+
+    def __xor__(self, other) -> PortSet:
+        """Return the ports in exactly one of the sets."""
+        return PortSet(self.mask ^ self._mask_of(other))
+
+    __ror__ = __or__
+    __rand__ = __and__
+    __rxor__ = __xor__
+
+    def issubset(self, other) -> bool:
+        """Return True if every port is also in other."""
+        return not self.mask & ~self._mask_of(other)
+
+    def __eq__(self, other) -> bool:
+        """Compare with another PortSet or a mask."""
+        if isinstance(other, PortSet):
+            return self.mask == other.mask
+        if isinstance(other, int):
+            return self.mask == other & PORT_MASK
+        return NotImplemented
+
+    def __hash__(self) -> int:
+        """Return the hash of the mask."""
+        return hash(self.mask)
+
+    def __str__(self) -> str:
+        """Return the comma-separated port list."""
+        if self._text is None:
+            self._text = byte2ports(self.mask)
+        return self._text
+
+    def __repr__(self) -> str:
+        """Return the representation."""
+        return f"PortSet({{{str(self)}}})"
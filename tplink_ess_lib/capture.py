@@ -0,0 +1,293 @@
+"""Provide packet capture, a flight recorder and offline replay."""
+
+from __future__ import annotations
+
+import asyncio
+import collections
+import logging
+import os
+import struct
+import time
+from typing import IO, Deque, Dict, Iterable, Iterator, List, NamedTuple, Optional
+
+from .protocol import Protocol
+
+_LOGGER = logging.getLogger(__name__)
+
+SENT = 0
+RECEIVED = 1
+
+MAGIC = b"TPESSCAP"
+VERSION = 1
+
+# timestamp (seconds since the epoch), direction, datagram length
+_RECORD = struct.Struct("!dBH")
+
+
+class CaptureRecord(NamedTuple):
+    """One captured datagram, as it was on the wire."""
+
+    timestamp: float
+    direction: int
+    data: bytes
+
+    def decoded(self) -> bytes:
+        """Return the decrypted packet."""
+        return Protocol.decode(self.data)
+
+    def parse(self, lazy: bool = False):
+        """Return the header+payload of the packet as a tuple."""
+        return Protocol.parse(self.decoded(), lazy=lazy)
+
+
+class Recorder:
+    """
+    Sink for datagrams sent and received by a network; records nothing.
+
+    Networks call record() for every datagram and error() when a request
+    fails or a malformed packet arrives.
+    """
+
+    def record(self, direction: int, data: bytes) -> None:
+        """Record one datagram."""
+
+    def error(self, reason: str) -> None:
+        """Note that something went wrong."""
+
+
+def _write_records(fptr: IO[bytes], records: Iterable[CaptureRecord]) -> None:
+    """Write a capture file header and records."""
+    fptr.write(MAGIC + bytes((VERSION,)))
+    for record in records:
+        fptr.write(_RECORD.pack(*record[:2], len(record.data)) + record.data)
+
+
+class CaptureWriter(Recorder):
+    """
+    Write every datagram to a capture file.
+
+    The file holds the encrypted datagrams with a timestamp and direction;
+    CaptureRecord.decoded() recovers the plain packet, so it is not stored
+    twice.
+    """
+
+    def __init__(self, path: str) -> None:
+        """Open path for writing."""
+        self.path = path
+        self._file: Optional[IO[bytes]] = open(  # pylint: disable=consider-using-with
+            path, "wb"
+        )
+        _write_records(self._file, ())
+        self.count = 0
+
+    def record(self, direction: int, data: bytes) -> None:
+        """Append one datagram."""
+        if self._file is not None:
+            self._file.write(_RECORD.pack(time.time(), direction, len(data)) + data)
+            self.count += 1
+
+    def error(self, reason: str) -> None:
+        """Flush, so the file is complete up to the failure."""
+        if self._file is not None:
+            self._file.flush()
+
+    def close(self) -> None:
+        """Close the file."""
+        if self._file is not None:
+            self._file.close()
+        self._file = None
+
+    def __enter__(self):
+        """Enter method."""
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        """Exit method."""
+        self.close()
+
+
+class FlightRecorder(Recorder):
+    """
+    Keep the last size datagrams in memory.
+
+    On error the buffer is written to a new capture file in dump_dir, if
+    set, so the traffic leading up to a failure can be replayed. A switch
+    that stays down fails every poll, so errors within min_interval seconds
+    of the last dump only count in suppressed, and only the newest
+    max_dumps files are kept.
+    """
+
+    def __init__(
+        self,
+        size: int = 256,
+        dump_dir: Optional[str] = None,
+        min_interval: float = 60.0,
+        max_dumps: int = 10,
+    ) -> None:
+        """Initialize."""
+        self.records: Deque[CaptureRecord] = collections.deque(maxlen=size)
+        self.dump_dir = dump_dir
+        self.min_interval = min_interval
+        self.max_dumps = max_dumps
+        self.dumps: List[str] = []
+        self.suppressed = 0
+        self._last_dump: Optional[float] = None
+
+    def record(self, direction: int, data: bytes) -> None:
+        """Remember one datagram, forgetting the oldest when full."""
+        self.records.append(CaptureRecord(time.time(), direction, data))
+
+    def error(self, reason: str) -> None:
+        """Dump the buffer to dump_dir, unless the last dump is too recent."""
+        if self.dump_dir is None or not self.records:
+            return
+        now = time.monotonic()
+        if self._last_dump is not None and now - self._last_dump < self.min_interval:
+            self.suppressed += 1
+            return
+        self._last_dump = now
+        path = os.path.join(
+            self.dump_dir, f"flight-{time.time():.6f}-{len(self.dumps)}.tpcap"
+        )
+        self.dump(path)
+        self.dumps.append(path)
+        _LOGGER.warning(
+            "%s: wrote last %d packets to %s", reason, len(self.records), path
+        )
+        while len(self.dumps) > self.max_dumps:
+            try:
+                os.remove(self.dumps.pop(0))
+            except OSError as err:
+                _LOGGER.debug("Could not remove old dump: %s", err)
+
+    def dump(self, path: str) -> None:
+        """Write the buffered datagrams to a capture file."""
+        with open(path, "wb") as fptr:
+            _write_records(fptr, list(self.records))
+
+
+def read_capture(path: str) -> Iterator[CaptureRecord]:
+    """Yield the records of a capture file."""
+    with open(path, "rb") as fptr:
+        if fptr.read(len(MAGIC) + 1) != MAGIC + bytes((VERSION,)):
+            raise ValueError(f"{path} is not a capture file")
+        while head := fptr.read(_RECORD.size):
+            timestamp, direction, length = _RECORD.unpack(head)
+            yield CaptureRecord(timestamp, direction, fptr.read(length))
+
+
+class _Exchange(NamedTuple):
+    """A captured request and the replies that answered it."""
+
+    switch_mac: bytes
+    op_code: int
+    type_ids: tuple
+    sent: float
+    replies: list
+
+
+def _exchanges(records: Iterable[CaptureRecord]) -> List[_Exchange]:
+    """Pair every sent request with the received replies sharing its key."""
+    exchanges: List[_Exchange] = []
+    waiting: Dict[tuple, _Exchange] = {}
+    broadcast = Protocol.header["blank"]["switch_mac"]
+    for record in records:
+        try:
+            header, payload = record.parse(lazy=True)
+        except (AssertionError, KeyError, ValueError, struct.error):
+            continue
+        if record.direction == SENT:
+            exchange = _Exchange(
+                header["switch_mac"],
+                header["op_code"],
+                tuple(tlv.type_id for tlv in payload),
+                record.timestamp,
+                [],
+            )
+            exchanges.append(exchange)
+            waiting[(header["switch_mac"], header["sequence_id"])] = exchange
+        else:
+            exchange = waiting.get(
+                (header["switch_mac"], header["sequence_id"])
+            ) or waiting.get((broadcast, header["sequence_id"]))
+            if exchange is not None:
+                exchange.replies.append((record.timestamp, record.decoded()))
+    return exchanges
+
+
+class ReplayTransport(asyncio.DatagramTransport):
+    """
+    Answer a network's requests with the replies of a capture.
+
+    Open the network with it to run the library offline::
+
+        net = AsyncNetwork(host_mac)
+        await net.open(ReplayTransport(net, read_capture(path)))
+
+    A sent request is matched to the first unused captured request with
+    the same switch, op_code and requested type ids; its captured replies
+    are delivered with the new sequence_id and host MAC. Requests without a
+    match get no reply. With realtime set, replies keep their captured
+    delay.
+    """
+
+    def __init__(self, network, records: Iterable[CaptureRecord], realtime=False):
+        """Initialize."""
+        super().__init__()
+        self._network = network
+        self._realtime = realtime
+        self._exchanges = _exchanges(records)
+        self._closing = False
+
+    def sendto(self, data, addr=None):
+        """Deliver the captured replies to a request."""
+        header, payload = Protocol.parse(Protocol.decode(data))
+        wanted = (
+            header["switch_mac"],
+            header["op_code"],
+            tuple(tlv.type_id for tlv in payload),
+        )
+        for index, exchange in enumerate(self._exchanges):
+            if exchange[:3] == wanted:
+                del self._exchanges[index]
+                break
+        else:
+            _LOGGER.debug("No captured reply for %s", wanted)
+            return
+        loop = asyncio.get_running_loop()
+        for timestamp, reply in exchange.replies:
+            packet = bytearray(reply)
+            fields = list(Protocol.HEADER_STRUCT.unpack_from(packet))
+            fields[3] = header["host_mac"]
+            fields[4] = header["sequence_id"]
+            Protocol.HEADER_STRUCT.pack_into(packet, 0, *fields)
+            delay = timestamp - exchange.sent if self._realtime else 0
+            loop.call_later(
+                max(delay, 0),
+                self._network.datagram_received,
+                Protocol.encode(bytes(packet)),
+                addr,
+            )
+
+    @property
+    def remaining(self) -> int:
+        """Return the number of captured requests not replayed yet."""
+        return len(self._exchanges)
+
+    def get_protocol(self):
+        """Return the network replies are delivered to."""
+        return self._network
+
+    def set_protocol(self, protocol):
+        """Deliver replies to another network."""
+        self._network = protocol
+
+    def is_closing(self):
+        """Return True once closed."""
+        return self._closing
+
+    def close(self):
+        """Close the transport."""
+        self._closing = True
+
+    abort = close
@@ -0,0 +1,199 @@
+"""Provide a collector that polls a large fleet from several processes."""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import pickle
+from multiprocessing.connection import wait
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .fleet import Fleet
+from .network import AsyncNetwork, ConnectionProblem
+
+_LOGGER = logging.getLogger(__name__)
+
+SEQUENCE_IDS = 1000  # sequence ids split between the workers
+
+# Messages from a worker, pickled tuples starting with their kind.
+_READY = 0  # (READY, receive port)
+_DATA = 1  # (DATA, switch_mac, data)
+_FAILED = 2  # (FAILED, switch_mac, reason)
+_DONE = 3  # (DONE,) once every switch of a poll was sent
+# A worker is sent (items,) to poll and None to exit.
+
+
+def _dumps(message) -> bytes:
+    """Serialize a message for the pipe."""
+    return pickle.dumps(message, pickle.HIGHEST_PROTOCOL)
+
+
+def shard_sequence_ids(workers: int) -> List[range]:
+    """Split the sequence ids into one disjoint range per worker."""
+    span = SEQUENCE_IDS // workers
+    return [range(index * span, (index + 1) * span) for index in range(workers)]
+
+
+async def _poll(fleet: Fleet, switch_mac: str, items) -> tuple:
+    """Poll one switch, return the message reporting it."""
+    try:
+        switch = await fleet.switch(switch_mac)
+        return (_DATA, switch_mac, await switch.update_data(switch_mac, items))
+    except ConnectionProblem as err:
+        return (_FAILED, switch_mac, str(err) or "timeout")
+
+
+async def _serve(conn, host_mac, user, pwd, switch_macs, sequence_ids, options):
+    """Poll switch_macs whenever the parent asks, until it says stop."""
+    loop = asyncio.get_running_loop()
+    network = await AsyncNetwork(
+        host_mac, lazy=True, sequence_ids=sequence_ids, **options
+    ).open()
+    try:
+        conn.send_bytes(_dumps((_READY, network.receive_address[1])))
+        async with Fleet(host_mac, user, pwd, compact=True, network=network) as fleet:
+            while command := pickle.loads(
+                await loop.run_in_executor(None, conn.recv_bytes)
+            ):
+                polls = [_poll(fleet, mac, command[0]) for mac in switch_macs]
+                for poll in asyncio.as_completed(polls):
+                    conn.send_bytes(_dumps(await poll))
+                conn.send_bytes(_dumps((_DONE,)))
+    finally:
+        network.close()
+
+
+def _worker(conn, *args) -> None:
+    """Run one worker process."""
+    try:
+        asyncio.run(_serve(conn, *args))
+    except (EOFError, KeyboardInterrupt):
+        pass
+
+
+class ShardedCollector:
+    """
+    Poll a large fleet from a pool of worker processes.
+
+    Decrypting and parsing replies is pure Python, so one process tops out
+    at what one core can decode. The switches are dealt round-robin to
+    workers, each running its own Fleet. Every worker owns a disjoint range
+    of sequence ids, so all of them can listen on the reply port: replies
+    broadcast to every worker are dropped by the others after decrypting
+    two bytes (see AsyncNetwork sequence_ids). Parsed data, as compact
+    records, is pickled back to the parent switch by switch as it arrives.
+
+    network_options (address, send_port, receive_port) are passed on to
+    every worker's AsyncNetwork, e.g. to poll a SwitchSimulator; the ports
+    the workers bound are in receive_ports after start().
+    """
+
+    def __init__(
+        self,
+        host_mac: str,
+        switch_macs,
+        user: str = "",
+        pwd: str = "",
+        workers: Optional[int] = None,
+        context: Optional[Any] = None,
+        **network_options: Any,
+    ) -> None:
+        """
+        Initialize. workers defaults to the number of CPUs.
+
+        context is a multiprocessing context, spawn by default since the
+        parent may be running an event loop of its own.
+        """
+        self._switch_macs = list(switch_macs)
+        self.workers = max(
+            1, min(workers or os.cpu_count() or 1, len(self._switch_macs))
+        )
+        self._args = (host_mac, user, pwd)
+        self._options = network_options
+        self._context = context or multiprocessing.get_context("spawn")
+        self._processes: list = []
+        self._connections: list = []
+        self.receive_ports: List[int] = []
+
+    def start(self) -> ShardedCollector:
+        """Start the workers and wait until they are listening."""
+        for index, sequence_ids in enumerate(shard_sequence_ids(self.workers)):
+            conn, child = self._context.Pipe()
+            process = self._context.Process(
+                target=_worker,
+                args=(
+                    child,
+                    *self._args,
+                    self._switch_macs[index :: self.workers],
+                    sequence_ids,
+                    self._options,
+                ),
+                name=f"tplink-ess-collector-{index}",
+                daemon=True,
+            )
+            process.start()
+            child.close()
+            self._processes.append(process)
+            self._connections.append(conn)
+        self.receive_ports = [self._receive(conn)[1] for conn in self._connections]
+        return self
+
+    @staticmethod
+    def _receive(conn) -> tuple:
+        """Return the next message of a worker."""
+        try:
+            return pickle.loads(conn.recv_bytes())
+        except EOFError as err:
+            raise ConnectionProblem("collector worker exited") from err
+
+    def poll(self, items=None) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Poll every switch once, yielding (switch_mac, data) as they arrive.
+
+        items is passed to TpLinkESS.update_data: by default every item due
+        for a refresh. Switches that did not answer are logged and left out.
+        """
+        for conn in self._connections:
+            conn.send_bytes(_dumps((items,)))
+        busy = list(self._connections)
+        try:
+            while busy:
+                for conn in wait(busy):
+                    message = self._receive(conn)
+                    if message[0] == _DATA:
+                        yield message[1], message[2]
+                    elif message[0] == _FAILED:
+                        _LOGGER.warning("No reply from %s: %s", *message[1:])
+                    elif message[0] == _DONE:
+                        busy.remove(conn)
+        finally:
+            # left early: read the rest, so the next poll starts in step
+            for conn in busy:
+                while self._receive(conn)[0] != _DONE:
+                    pass
+
+    def close(self) -> None:
+        """Stop the workers."""
+        for conn in self._connections:
+            try:
+                conn.send_bytes(_dumps(None))
+            except OSError:
+                pass
+        for process in self._processes:
+            process.join(5)
+            if process.is_alive():
+                process.terminate()
+        for conn in self._connections:
+            conn.close()
+        self._processes = []
+        self._connections = []
+
+    def __enter__(self):
+        """Enter method."""
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        """Exit method."""
+        self.close()
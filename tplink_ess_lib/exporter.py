@@ -0,0 +1,289 @@
+"""Provide an OpenMetrics exporter serving cached switch state over HTTP."""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .fleet import Fleet
+from .rates import PortRates
+from .records import LINK_STATUS, STATUS, PortStats, SwitchInfo, VlanIndex
+
+_LOGGER = logging.getLogger(__name__)
+
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+DEFAULT_PORT = 29810
+
+# name, type, help; rendered in this order
+FAMILIES = (
+    ("tplink_ess_up", "gauge", "Whether the switch answered the last poll."),
+    ("tplink_ess_switch", "info", "Switch identity."),
+    ("tplink_ess_last_poll_timestamp_seconds", "gauge", "Time of the last reply."),
+    ("tplink_ess_port_enabled", "gauge", "Whether the port is enabled."),
+    ("tplink_ess_port_link_status", "gauge", "Link status code of the port."),
+    ("tplink_ess_port_packets", "counter", "Packets by direction and result."),
+    ("tplink_ess_vlans", "gauge", "Number of VLANs configured."),
+    ("tplink_ess_vlan_member_ports", "gauge", "Number of member ports of a VLAN."),
+)
+
+_INFO_LABELS = ("hostname", "type", "hardware", "firmware", "ip_addr")
+_COUNTERS = (("tx", "good"), ("tx", "bad"), ("rx", "good"), ("rx", "bad"))
+
+
+def _escape(value) -> str:
+    """Escape a label value."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels) -> str:
+    """Return a label set."""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def _stats(data: Dict[str, Any]) -> List[PortStats]:
+    """Return the stats of update_data results, compact or not."""
+    return [
+        entry if isinstance(entry, PortStats) else PortStats.from_dict(entry)
+        for entry in data.get("stats", {}).get("stats", [])
+    ]
+
+
+def _render_ports(lines, switch_mac: str, data, rates) -> None:
+    """Append the port samples of a switch to lines."""
+    totals = {rate.port: rate[5:9] for rate in rates}
+    for entry in _stats(data):
+        port = f'switch="{_escape(switch_mac)}",port="{entry.port}"'
+        lines["tplink_ess_port_enabled"].append(
+            f"tplink_ess_port_enabled{{{port},status="
+            f'"{STATUS.get(entry.status, entry.status)}"}} {int(entry.status == 1)}\n'
+        )
+        lines["tplink_ess_port_link_status"].append(
+            f"tplink_ess_port_link_status{{{port},link="
+            f'"{LINK_STATUS.get(entry.link_status, entry.link_status)}"}} '
+            f"{entry.link_status}\n"
+        )
+        counters = totals.get(entry.port, entry[3:7])
+        for (direction, result), value in zip(_COUNTERS, counters):
+            lines["tplink_ess_port_packets"].append(
+                f"tplink_ess_port_packets_total{{{port},direction="
+                f'"{direction}",result="{result}"}} {value}\n'
+            )
+
+
+def render_switch(
+    switch_mac: str,
+    data: Dict[str, Any],
+    rates: Iterable[PortRates] = (),
+    timestamp: Optional[float] = None,
+) -> Dict[str, str]:
+    """
+    Return the sample lines of one switch, keyed by metric family.
+
+    data is the update_data result of the switch. Packet counters come
+    from rates (64-bit, unwrapped) for ports that have them, otherwise
+    the 32-bit counters of the stats are exported as they are.
+    """
+    switch = _labels(switch=switch_mac)
+    lines: Dict[str, List[str]] = {name: [] for name, _, _ in FAMILIES}
+    if (info := data.get("hostname")) is not None:
+        if isinstance(info, SwitchInfo):
+            info = info.as_dict()
+        labels = {k: info[k] for k in _INFO_LABELS if info.get(k) is not None}
+        lines["tplink_ess_switch"].append(
+            f"tplink_ess_switch_info{_labels(switch=switch_mac, **labels)} 1\n"
+        )
+    if timestamp is not None:
+        lines["tplink_ess_last_poll_timestamp_seconds"].append(
+            f"tplink_ess_last_poll_timestamp_seconds{switch} {timestamp:.3f}\n"
+        )
+    _render_ports(lines, switch_mac, data, rates)
+    if "vlan" in data:
+        index = VlanIndex.from_data(data)
+        lines["tplink_ess_vlans"].append(
+            f"tplink_ess_vlans{switch} {len(index.vlans)}\n"
+        )
+        for vlan_id, vlan in sorted(index.vlans.items()):
+            lines["tplink_ess_vlan_member_ports"].append(
+                "tplink_ess_vlan_member_ports"
+                f"{_labels(switch=switch_mac, vlan=vlan_id, name=vlan.name)} "
+                f"{len(vlan.members)}\n"
+            )
+    return {name: "".join(block) for name, block in lines.items() if block}
+
+
+class MetricsExporter:
+    """
+    Serve the latest state of switches in OpenMetrics text format.
+
+    A scrape never queries a switch: it is answered from a body rendered
+    once after the state changed. The state is fed by update(), from any
+    source (e.g. a PassiveListener callback), or by the poll loop that
+    start() runs with a Fleet every interval seconds. update() renders
+    only the lines of the switch that changed.
+    """
+
+    def __init__(
+        self,
+        fleet: Optional[Fleet] = None,
+        switch_macs: Iterable[str] = (),
+        interval: float = 30.0,
+        items=None,
+    ) -> None:
+        """
+        Initialize. Without a fleet nothing is polled.
+
+        items is passed to update_data: by default every item due.
+        """
+        self._fleet = fleet
+        self._switch_macs = list(switch_macs)
+        self.interval = interval
+        self._items = items
+        self._switches: Dict[str, Dict[str, str]] = {}
+        self._body: Optional[bytes] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._poller: Optional[asyncio.Task] = None
+        self.scrapes = 0
+        self.poll_errors = 0
+
+    def update(
+        self,
+        switch_mac: str,
+        data: Dict[str, Any],
+        rates: Iterable[PortRates] = (),
+        timestamp: Optional[float] = None,
+    ) -> None:
+        """Replace the exported state of a switch with fresh data."""
+        lines = render_switch(
+            switch_mac, data, rates, time.time() if timestamp is None else timestamp
+        )
+        lines["tplink_ess_up"] = f"tplink_ess_up{_labels(switch=switch_mac)} 1\n"
+        self._switches[switch_mac] = lines
+        self._body = None
+
+    def set_down(self, switch_mac: str) -> None:
+        """Mark a switch as not answering, keeping its last state."""
+        lines = self._switches.setdefault(switch_mac, {})
+        lines["tplink_ess_up"] = f"tplink_ess_up{_labels(switch=switch_mac)} 0\n"
+        self._body = None
+
+    def remove(self, switch_mac: str) -> None:
+        """Stop exporting a switch."""
+        if self._switches.pop(switch_mac, None) is not None:
+            self._body = None
+
+    def render(self) -> bytes:
+        """Return the exposition, rendering it only if the state changed."""
+        if self._body is None:
+            parts = []
+            switches = [self._switches[mac] for mac in sorted(self._switches)]
+            for name, kind, text in FAMILIES:
+                parts.append(f"# TYPE {name} {kind}\n# HELP {name} {text}\n")
+                parts.extend(lines[name] for lines in switches if name in lines)
+            parts.append("# EOF\n")
+            self._body = "".join(parts).encode("utf-8")
+        return self._body
+
+    async def poll(self) -> None:
+        """Poll the fleet once and update the exported state."""
+        if self._fleet is None:
+            return
+        data = await self._fleet.update_data(self._switch_macs, self._items)
+        for switch_mac in self._switch_macs:
+            if switch_mac not in data:
+                self.set_down(switch_mac)
+                continue
+            switch = await self._fleet.switch(switch_mac)
+            self.update(switch_mac, data[switch_mac], switch.port_rates(switch_mac))
+
+    def _set_all_down(self) -> None:
+        """Mark every polled switch as not answering."""
+        for switch_mac in self._switch_macs:
+            self.set_down(switch_mac)
+
+    async def _poll_loop(self) -> None:
+        """
+        Poll every interval seconds, independently of scrapes.
+
+        A failed poll is logged and marks every switch down, so scrapes do
+        not keep reporting the last samples as live; the next poll is
+        tried as usual.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            try:
+                await self.poll()
+            except OSError as err:
+                self.poll_errors += 1
+                _LOGGER.error("Problems with network interface: %s", err)
+                self._set_all_down()
+            except Exception:  # pylint: disable=broad-except
+                self.poll_errors += 1
+                _LOGGER.exception("Polling %d switches failed", len(self._switch_macs))
+                self._set_all_down()
+            await asyncio.sleep(max(0.0, started + self.interval - loop.time()))
+
+    def _poll_ended(self, task: asyncio.Task) -> None:
+        """Report a poll loop that stopped other than by close()."""
+        if task.cancelled():
+            return
+        _LOGGER.error("Poll loop stopped: %r", task.exception())
+        self._set_all_down()
+
+    async def _handle(self, reader, writer) -> None:
+        """Answer one HTTP request."""
+        try:
+            request = await reader.readline()
+            while await reader.readline() not in (b"\r\n", b"\n", b""):
+                pass
+            method, path, *_ = request.decode("latin-1").split(" ") + ["", ""]
+            if method == "GET" and path.split("?")[0] in ("/metrics", "/"):
+                self.scrapes += 1
+                status, content_type, body = "200 OK", CONTENT_TYPE, self.render()
+            else:
+                status, content_type, body = "404 Not Found", "text/plain", b""
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode()
+                + body
+            )
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError) as err:
+            _LOGGER.debug("Scrape failed: %s", err)
+        finally:
+            writer.close()
+
+    async def start(
+        self, host: str = "127.0.0.1", port: int = DEFAULT_PORT
+    ) -> MetricsExporter:
+        """Listen for scrapes on host:port and start polling; port 0 picks one."""
+        self._server = await asyncio.start_server(self._handle, host, port)
+        if self._fleet is not None:
+            self._poller = asyncio.create_task(self._poll_loop())
+            self._poller.add_done_callback(self._poll_ended)
+        return self
+
+    @property
+    def address(self) -> Optional[Tuple[str, int]]:
+        """Return the (address, port) scrapes are served on."""
+        if self._server is None:
+            return None
+        return self._server.sockets[0].getsockname()[:2]
+
+    def close(self) -> None:
+        """Stop polling and serving."""
+        if self._poller is not None:
+            self._poller.cancel()
+        if self._server is not None:
+            self._server.close()
+        self._poller = self._server = None
+
+    async def __aenter__(self):
+        """Enter method."""
+        return await self.start()
+
+    async def __aexit__(self, exc_type, exc_value, exc_tb):
+        """Exit method."""
+        self.close()
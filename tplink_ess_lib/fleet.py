@@ -0,0 +1,179 @@
+"""Provide concurrent polling of many switches."""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Any, Dict, Iterable, Optional
+
+from . import TpLinkESS
+from .capture import Recorder
+from .metrics import Metrics
+from .network import AsyncNetwork, ConnectionProblem
+from .reconcile import DesiredState
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class Fleet:
+    """
+    Poll many switches at the same time.
+
+    All switches share one AsyncNetwork, so a single socket receives every
+    broadcast reply and routes it by (switch_mac, sequence_id) to the
+    switch conversation waiting for it.
+    """
+
+    def __init__(
+        self,
+        host_mac: str,
+        user: str = "",
+        pwd: str = "",
+        testing: bool = False,
+        compact: bool = False,
+        network: Optional[AsyncNetwork] = None,
+        metrics: Optional[Metrics] = None,
+        capture: Optional[Recorder] = None,
+    ) -> None:
+        """
+        Initialize. compact is passed on to every TpLinkESS.
+
+        Pass an open network, e.g. one pointed at a SwitchSimulator, to use
+        it instead of the broadcast sockets; it is then left open by close().
+        metrics collects counters and timings of the network the fleet opens,
+        and capture its datagrams.
+        """
+        self._host_mac = host_mac
+        self._user = user
+        self._pwd = pwd
+        self._testing = testing
+        self._compact = compact
+        self._network: Optional[AsyncNetwork] = network
+        self._owns_network = network is None
+        self._metrics = metrics
+        self._capture = capture
+        self._switches: Dict[str, TpLinkESS] = {}
+
+    async def open(self) -> Fleet:
+        """Open the shared network."""
+        if self._network is None:
+            self._network = await AsyncNetwork(
+                self._host_mac,
+                testing=self._testing,
+                lazy=self._compact,
+                metrics=self._metrics,
+                capture=self._capture,
+            ).open()
+        return self
+
+    def close(self) -> None:
+        """Close the shared network and forget all switches."""
+        for switch in self._switches.values():
+            switch.close()
+        self._switches = {}
+        if self._owns_network:
+            if self._network is not None:
+                self._network.close()
+            self._network = None
+
+    async def __aenter__(self):
+        """Enter method."""
+        return await self.open()
+
+    async def __aexit__(self, exc_type, exc_value, exc_tb):
+        """Exit method."""
+        self.close()
+
+    async def switch(self, switch_mac: str) -> TpLinkESS:
+        """Return the TpLinkESS for a switch, sharing the fleet network."""
+        if (switch := self._switches.get(switch_mac)) is None:
+            await self.open()
+            switch = TpLinkESS(
+                self._host_mac,
+                self._user,
+                self._pwd,
+                testing=self._testing,
+                network=self._network,
+                compact=self._compact,
+            )
+            self._switches[switch_mac] = switch
+        return switch
+
+    async def discovery(self, timeout=None, quiet=None, max_switches=None) -> list:
+        """Return a list of unique switches found by discovery."""
+        await self.open()
+        return await TpLinkESS(
+            self._host_mac,
+            testing=self._testing,
+            network=self._network,
+            compact=self._compact,
+        ).discovery(timeout, quiet, max_switches)
+
+    async def _update_one(self, switch_mac: str, action_names) -> Dict[str, Any]:
+        """Refresh one switch."""
+        switch = await self.switch(switch_mac)
+        return await switch.update_data(switch_mac, action_names)
+
+    async def _set_one(self, switch_mac: str, items) -> list:
+        """Apply settings to one switch."""
+        switch = await self.switch(switch_mac)
+        return await switch.set_many(switch_mac, items)
+
+    async def set_many(self, changes: Dict[str, list]) -> Dict[str, list]:
+        """
+        Apply settings to several switches concurrently.
+
+        changes maps switch MACs to the (type_id, value) items for each, and
+        the result maps them to the per-item results of TpLinkESS.set_many.
+        """
+        results = await asyncio.gather(
+            *(self._set_one(mac, items) for mac, items in changes.items())
+        )
+        return dict(zip(changes, results))
+
+    async def _reconcile_one(self, switch_mac: str, desired) -> list:
+        """Bring one switch to its desired state."""
+        switch = await self.switch(switch_mac)
+        return await switch.reconcile(switch_mac, desired)
+
+    async def reconcile(self, desired: Dict[str, DesiredState]) -> Dict[str, list]:
+        """
+        Bring several switches to their desired states concurrently.
+
+        Returns what TpLinkESS.reconcile sent to each switch, keyed by MAC;
+        switches that did not answer are logged and left out.
+        """
+        results = await asyncio.gather(
+            *(self._reconcile_one(mac, state) for mac, state in desired.items()),
+            return_exceptions=True,
+        )
+        return self._answered(desired, results)
+
+    async def update_data(
+        self, switch_macs: Iterable[str], action_names=None
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        Refresh several switches concurrently.
+
+        Returns the data of every switch that answered, keyed by MAC;
+        switches that did not answer are logged and left out.
+        """
+        switch_macs = list(switch_macs)
+        results = await asyncio.gather(
+            *(self._update_one(mac, action_names) for mac in switch_macs),
+            return_exceptions=True,
+        )
+        return self._answered(switch_macs, results)
+
+    @staticmethod
+    def _answered(switch_macs, results) -> Dict[str, Any]:
+        """Key the results by MAC, leaving out switches that did not answer."""
+        data = {}
+        for switch_mac, result in zip(switch_macs, results):
+            if isinstance(result, ConnectionProblem):
+                _LOGGER.warning("No reply from %s: %s", switch_mac, result)
+            elif isinstance(result, BaseException):
+                raise result
+            else:
+                data[switch_mac] = result
+        return data
@@ -0,0 +1,307 @@
+"""Provide memory-mapped ring files of port counter history."""
+
+from __future__ import annotations
+
+import mmap
+import os
+import struct
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from .records import PortStats
+
+MAGIC = b"TPESSRNG"
+VERSION = 1
+
+# magic, version, num_ports, capacity, record size, records ever appended
+_HEADER = struct.Struct("!8sHHIIQ")
+HEADER_SIZE = 64  # header padded so records start aligned
+_COUNT = struct.Struct("!Q")
+_COUNT_OFFSET = _HEADER.size - _COUNT.size
+_TIMESTAMP = struct.Struct("!d")
+PORT_FORMAT = "bbbIIII"  # as in the stats TLV
+
+Sample = Tuple[float, List[PortStats]]
+
+
+def record_struct(num_ports: int) -> struct.Struct:
+    """Return the struct of one record: timestamp, then every port's stats."""
+    return struct.Struct("!d" + PORT_FORMAT * num_ports)
+
+
+def _port_fields(entry) -> tuple:
+    """Return the fields of a stats entry: PortStats, dict or raw tuple."""
+    if isinstance(entry, dict):
+        return PortStats.from_dict(entry)
+    return entry
+
+
+class RingStore:
+    """
+    Fixed-size ring of stats samples of one switch in a memory-mapped file.
+
+    Every record has the same width (a timestamp plus the stats fields of
+    each port), so appending writes one record in place, overwriting the
+    oldest once capacity is reached, and never moves anything. Range
+    reads return memoryviews into the mapping: no bytes are copied until
+    they are unpacked. Timestamps must not decrease.
+    """
+
+    def __init__(self, path: str, num_ports: int, capacity: int = 100_000) -> None:
+        """Open the ring at path, creating it with capacity records if missing."""
+        self.path = path
+        self._record = record_struct(num_ports)
+        exists = os.path.exists(path) and os.path.getsize(path) >= HEADER_SIZE
+        # pylint: disable-next=consider-using-with
+        self._file = open(path, "r+b" if exists else "w+b")
+        if exists:
+            magic, version, ports, capacity, size, _ = _HEADER.unpack(
+                self._file.read(_HEADER.size)
+            )
+            if magic != MAGIC or version != VERSION:
+                self._file.close()
+                raise ValueError(f"{path} is not a ring file")
+            if (ports, size) != (num_ports, self._record.size):
+                self._file.close()
+                raise ValueError(f"{path} holds {ports} ports, not {num_ports}")
+        else:
+            self._file.write(
+                _HEADER.pack(MAGIC, VERSION, num_ports, capacity, self._record.size, 0)
+            )
+            self._file.truncate(HEADER_SIZE + capacity * self._record.size)
+        self.num_ports = num_ports
+        self.capacity = capacity
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        self._view = memoryview(self._map)
+        (self.appended,) = _COUNT.unpack_from(self._map, _COUNT_OFFSET)
+
+    def __len__(self) -> int:
+        """Return the number of records held."""
+        return min(self.appended, self.capacity)
+
+    def _offset(self, index: int) -> int:
+        """Return the file offset of the index-th oldest record held."""
+        slot = (self.appended - len(self) + index) % self.capacity
+        return HEADER_SIZE + slot * self._record.size
+
+    def timestamp(self, index: int) -> float:
+        """Return the timestamp of the index-th oldest record."""
+        return _TIMESTAMP.unpack_from(self._map, self._offset(index))[0]
+
+    def append(self, stats, timestamp: Optional[float] = None) -> None:
+        """Append one stats sample: PortStats, dicts or raw tuples per port."""
+        if timestamp is None:
+            timestamp = time.time()
+        if len(stats) != self.num_ports:
+            raise ValueError(f"{len(stats)} ports, the ring holds {self.num_ports}")
+        if len(self) and timestamp < self.timestamp(len(self) - 1):
+            raise ValueError("timestamp older than the last record")
+        fields = [value for entry in stats for value in _port_fields(entry)]
+        slot = self.appended % self.capacity
+        self._record.pack_into(
+            self._map, HEADER_SIZE + slot * self._record.size, timestamp, *fields
+        )
+        self.appended += 1
+        _COUNT.pack_into(self._map, _COUNT_OFFSET, self.appended)
+
+    def _bisect(self, timestamp: float) -> int:
+        """Return the index of the first record at or after timestamp."""
+        low, high = 0, len(self)
+        while low < high:
+            middle = (low + high) // 2
+            if self.timestamp(middle) < timestamp:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def views(
+        self, start: Optional[float] = None, end: Optional[float] = None
+    ) -> List[memoryview]:
+        """
+        Return the records with start <= timestamp < end as memoryviews.
+
+        The views point into the mapping and hold whole records, oldest
+        first: one view, or two when the range wraps around the end of the
+        file. Unpack them with record_struct(num_ports).iter_unpack, and
+        release them before closing the ring.
+        """
+        first = 0 if start is None else self._bisect(start)
+        last = len(self) if end is None else self._bisect(end)
+        if first >= last:
+            return []
+        size = self._record.size
+        begin = self._offset(first)
+        stop = self._offset(last - 1) + size
+        if begin < stop:
+            return [self._view[begin:stop]]
+        return [self._view[begin:], self._view[HEADER_SIZE:stop]]
+
+    def samples(
+        self, start: Optional[float] = None, end: Optional[float] = None
+    ) -> Iterator[Sample]:
+        """Yield (timestamp, [PortStats, ...]) of the records in a range."""
+        width = len(PortStats._fields)
+        for view in self.views(start, end):
+            for fields in self._record.iter_unpack(view):
+                yield fields[0], [
+                    PortStats._make(fields[i : i + width])
+                    for i in range(1, len(fields), width)
+                ]
+
+    def compact(
+        self, start: Optional[float] = None, end: Optional[float] = None
+    ) -> bytes:
+        """Return the records of a range delta-encoded, see encode_deltas."""
+        return encode_deltas(self.num_ports, self.samples(start, end))
+
+    def flush(self) -> None:
+        """Write changes to disk."""
+        self._map.flush()
+
+    def close(self) -> None:
+        """Unmap and close the file."""
+        self._view.release()
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        """Enter method."""
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        """Exit method."""
+        self.close()
+
+
+def _put_varint(out: bytearray, value: int) -> None:
+    """Append an unsigned LEB128 integer."""
+    while value > 0x7F:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _get_varint(data, offset: int) -> Tuple[int, int]:
+    """Return an unsigned LEB128 integer and the offset after it."""
+    value = shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+def _zigzag(value: int) -> int:
+    """Map a signed integer to an unsigned one, small magnitudes first."""
+    return value << 1 if value >= 0 else (-value << 1) - 1
+
+
+def _unzigzag(value: int) -> int:
+    """Undo _zigzag."""
+    return value >> 1 if not value & 1 else -((value + 1) >> 1)
+
+
+def encode_deltas(num_ports: int, samples) -> bytes:
+    """
+    Encode samples as varint differences from the previous sample.
+
+    Timestamps are kept to the microsecond. Counters are differences
+    modulo 2**32, so wraps and reboots cost no more than any other change;
+    ports whose counters did not move take seven bytes instead of 19.
+    """
+    out = bytearray(MAGIC)
+    _put_varint(out, num_ports)
+    previous_time = 0
+    previous = [0] * (num_ports * len(PortStats._fields))
+    for timestamp, stats in samples:
+        micros = round(timestamp * 1_000_000)
+        _put_varint(out, _zigzag(micros - previous_time))
+        previous_time = micros
+        index = 0
+        for entry in stats:
+            for position, value in enumerate(entry):
+                if position < 3:
+                    _put_varint(out, _zigzag(value - previous[index]))
+                else:
+                    _put_varint(out, (value - previous[index]) & 0xFFFFFFFF)
+                previous[index] = value
+                index += 1
+    return bytes(out)
+
+
+def decode_deltas(data: bytes) -> List[Sample]:
+    """Return the samples encoded by encode_deltas."""
+    if data[: len(MAGIC)] != MAGIC:
+        raise ValueError("not delta-encoded history")
+    num_ports, offset = _get_varint(data, len(MAGIC))
+    width = len(PortStats._fields)
+    current = [0] * (num_ports * width)
+    micros = 0
+    samples: List[Sample] = []
+    while offset < len(data):
+        delta, offset = _get_varint(data, offset)
+        micros += _unzigzag(delta)
+        for index, value in enumerate(current):
+            delta, offset = _get_varint(data, offset)
+            if index % width < 3:
+                current[index] = value + _unzigzag(delta)
+            else:
+                current[index] = (value + delta) & 0xFFFFFFFF
+        samples.append(
+            (
+                micros / 1_000_000,
+                [
+                    PortStats._make(current[i : i + width])
+                    for i in range(0, len(current), width)
+                ],
+            )
+        )
+    return samples
+
+
+class HistoryStore:
+    """
+    One RingStore per switch in a directory.
+
+    Rings are created on the first sample of a switch, sized for the number
+    of ports it reported, and named after its MAC address.
+    """
+
+    def __init__(self, directory: str, capacity: int = 100_000) -> None:
+        """Keep rings of capacity records in directory."""
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.capacity = capacity
+        self._rings: Dict[str, RingStore] = {}
+
+    def path(self, switch_mac: str) -> str:
+        """Return the ring file of a switch."""
+        return os.path.join(self.directory, switch_mac.replace(":", "") + ".ring")
+
+    def ring(self, switch_mac: str, num_ports: int) -> RingStore:
+        """Return the open ring of a switch, opening or creating it."""
+        if (ring := self._rings.get(switch_mac)) is None:
+            ring = RingStore(self.path(switch_mac), num_ports, self.capacity)
+            self._rings[switch_mac] = ring
+        return ring
+
+    def append(self, switch_mac: str, stats, timestamp: Optional[float] = None):
+        """Append a stats sample, e.g. update_data()["stats"]["stats"]."""
+        self.ring(switch_mac, len(stats)).append(stats, timestamp)
+
+    def close(self) -> None:
+        """Close every ring."""
+        for ring in self._rings.values():
+            ring.close()
+        self._rings = {}
+
+    def __enter__(self):
+        """Enter method."""
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        """Exit method."""
+        self.close()
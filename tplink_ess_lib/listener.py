@@ -0,0 +1,170 @@
+"""Provide a passive listener that harvests the replies switches broadcast."""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import struct
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from . import TpLinkESS
+from .binary import mac_to_str
+from .capture import RECEIVED, Recorder
+from .metrics import Metrics
+from .network import _NetworkBase
+from .protocol import Protocol
+from .rates import RateEngine
+from .records import SwitchInfo, parse_records
+
+_LOGGER = logging.getLogger(__name__)
+
+_REPLIES = (Protocol.SET, Protocol.RETURN)  # op codes switches answer with
+_HOSTNAME = Protocol.get_id("hostname")
+
+
+class SwitchState:
+    """What has been heard from one switch."""
+
+    __slots__ = ("mac", "info", "data", "first_seen", "last_seen", "replies")
+
+    def __init__(self, mac: str, now: float) -> None:
+        """Initialize."""
+        self.mac = mac
+        self.info: Optional[SwitchInfo] = None
+        self.data: Dict[str, Any] = {}
+        self.first_seen = now
+        self.last_seen = now
+        self.replies = 0
+
+    def __repr__(self) -> str:
+        """Return the representation."""
+        return f"SwitchState({self.mac}, items={sorted(self.data)})"
+
+
+class PassiveListener(_NetworkBase, asyncio.DatagramProtocol):
+    """
+    Build an inventory from replies to queries made by other hosts.
+
+    Switches broadcast every reply to the reply port, so a listener bound
+    there, alongside any network of this host, sees what any tool on the
+    segment asks. It
+    never sends: every reply is decoded whatever host it was meant for,
+    and its items are parsed into the state of the switch it came from,
+    with the same layout as TpLinkESS.update_data (records when compact).
+    Stats replies also feed rates, a RateEngine.
+    """
+
+    def __init__(
+        self,
+        compact: bool = False,
+        address: Optional[str] = None,
+        receive_port: Optional[int] = None,
+        callback: Optional[Callable[[SwitchState, List[str]], None]] = None,
+        metrics: Optional[Metrics] = None,
+        capture: Optional[Recorder] = None,
+    ) -> None:
+        """
+        Initialize.
+
+        address and receive_port replace the broadcast defaults, e.g. to
+        listen to a SwitchSimulator on loopback. callback is called with the
+        state of a switch and the names of the items a reply updated.
+        """
+        super().__init__(_NetworkBase.BROADCAST_MAC, metrics=metrics, capture=capture)
+        self.lazy = compact
+        self._compact = compact
+        if address is not None:
+            self.BROADCAST_ADDR = address  # pylint: disable=invalid-name
+        if receive_port is not None:
+            self.UDP_RECEIVE_FROM_PORT = receive_port  # pylint: disable=invalid-name
+        self._callback = callback
+        self._transport: Optional[asyncio.DatagramTransport] = None
+        self.switches: Dict[str, SwitchState] = {}
+        self.rates = RateEngine()
+
+    async def open(self) -> PassiveListener:
+        """Bind the receive socket to the running event loop."""
+        r_socket = self._open_receive_socket()
+        r_socket.setblocking(False)
+        self._transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+            lambda: self, sock=r_socket
+        )
+        return self
+
+    @property
+    def receive_address(self):
+        """Return the (address, port) the receive socket is bound to."""
+        if self._transport is None:
+            return None
+        return self._transport.get_extra_info("sockname")
+
+    def close(self) -> None:
+        """Close the socket."""
+        if self._transport is not None:
+            self._transport.close()
+        self._transport = None
+
+    async def __aenter__(self):
+        """Enter method."""
+        return await self.open()
+
+    async def __aexit__(self, exc_type, exc_value, exc_tb):
+        """Exit method."""
+        self.close()
+
+    def datagram_received(self, data, addr) -> None:
+        """Decode a reply and record what it says about its switch."""
+        if self.capture is not None:
+            self.capture.record(RECEIVED, data)
+        try:
+            header, payload = self._decode_packet(data)
+        except (AssertionError, KeyError, ValueError, struct.error) as err:
+            _LOGGER.debug("Ignoring malformed packet from %s: %s", addr, err)
+            return
+        if header["op_code"] not in _REPLIES:
+            return
+        if self.metrics.enabled:
+            self.metrics.increment(
+                "packets_received",
+                **self._labels(header["switch_mac"], header["op_code"]),
+            )
+        self.ingest(header, payload)
+
+    def ingest(self, header, payload, now: Optional[float] = None) -> SwitchState:
+        """Update the state of the switch a decoded reply came from."""
+        if now is None:
+            now = time.monotonic()
+        mac = mac_to_str(header["switch_mac"])
+        if (state := self.switches.get(mac)) is None:
+            state = self.switches[mac] = SwitchState(mac, now)
+        state.last_seen = now
+        state.replies += 1
+        if header["error_code"]:
+            return state
+        type_ids = list(
+            dict.fromkeys(
+                tlv[0] for tlv in payload if tlv[0] in TpLinkESS.working_ids_tp
+            )
+        )
+        if not type_ids:
+            return state
+        # pylint: disable-next=protected-access
+        groups = TpLinkESS._group_payload(type_ids, payload)
+        names = []
+        for type_id, tlvs in groups.items():
+            name = TpLinkESS.working_ids_tp[type_id][1]
+            if type_id == _HOSTNAME:
+                state.info = SwitchInfo.from_payload(tlvs)
+            if not self._compact:
+                state.data[name] = TpLinkESS.parse_response(tlvs)
+            elif type_id == _HOSTNAME:
+                state.data[name] = state.info
+            else:
+                state.data[name] = parse_records(tlvs)
+            if name == "stats":
+                self.rates.update(mac, state.data[name].get("stats", []), now)
+            names.append(name)
+        if names and self._callback is not None:
+            self._callback(state, names)
+        return state
@@ -0,0 +1,163 @@
+"""Provide counters and latency histograms for network and codec operations."""
+
+from __future__ import annotations
+
+import bisect
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Upper bounds in seconds, from codec work (microseconds) to lost replies.
+DEFAULT_BUCKETS = (
+    0.00001,
+    0.000025,
+    0.00005,
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+# Names reported by the library:
+#   counters   packets_sent, packets_received, replies_dropped (reason),
+#              timeouts, retransmits, logins
+#   histograms rtt_seconds, decode_seconds, parse_seconds
+# labelled with switch (MAC) and op_code (name) where known.
+
+
+class Metrics:
+    """
+    Metrics sink that discards everything.
+
+    The library reports through this interface; subclass it, or use
+    MetricsRegistry or CallbackMetrics, to collect. Callers test enabled
+    before timing anything, so an unused sink costs one attribute lookup.
+    """
+
+    enabled = False
+
+    def increment(self, name: str, value: int = 1, **labels: str) -> None:
+        """Add value to a counter."""
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        """Record one sample, in seconds, in a histogram."""
+
+
+NULL_METRICS = Metrics()
+
+
+class Histogram:
+    """Cumulative-bucket histogram of samples."""
+
+    __slots__ = ("bounds", "counts", "count", "sum")
+
+    def __init__(self, bounds=DEFAULT_BUCKETS) -> None:
+        """Initialize."""
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)  # last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        """Record one sample."""
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self) -> List[Tuple[float, int]]:
+        """Return (upper bound, samples at or below it) pairs, ending at +Inf."""
+        total = 0
+        result = []
+        for bound, count in zip(self.bounds + (float("inf"),), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def quantile(self, fraction: float) -> Optional[float]:
+        """Return the upper bound of the bucket holding the given quantile."""
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        for bound, total in self.cumulative():
+            if total >= rank:
+                return bound
+        return None  # pragma: no cover
+
+
+class MetricsRegistry(Metrics):
+    """Collect counters and histograms in memory, keyed by name and labels."""
+
+    enabled = True
+
+    def __init__(self, buckets=DEFAULT_BUCKETS) -> None:
+        """Initialize."""
+        self.buckets = tuple(buckets)
+        self.counters: Dict[Tuple[str, Labels], int] = {}
+        self.histograms: Dict[Tuple[str, Labels], Histogram] = {}
+
+    def increment(self, name: str, value: int = 1, **labels: str) -> None:
+        """Add value to a counter."""
+        key = (name, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        """Record one sample in a histogram."""
+        key = (name, tuple(sorted(labels.items())))
+        if (histogram := self.histograms.get(key)) is None:
+            histogram = self.histograms[key] = Histogram(self.buckets)
+        histogram.observe(value)
+
+    def counter(self, name: str, **labels: str) -> int:
+        """Return a counter summed over every label set matching labels."""
+        wanted = set(labels.items())
+        return sum(
+            value
+            for (key, key_labels), value in self.counters.items()
+            if key == name and wanted.issubset(key_labels)
+        )
+
+    def histogram(self, name: str, **labels: str) -> Histogram:
+        """Return a histogram merged over every label set matching labels."""
+        wanted = set(labels.items())
+        merged = Histogram(self.buckets)
+        for (key, key_labels), histogram in self.histograms.items():
+            if key == name and wanted.issubset(key_labels):
+                merged.counts = [a + b for a, b in zip(merged.counts, histogram.counts)]
+                merged.count += histogram.count
+                merged.sum += histogram.sum
+        return merged
+
+    def reset(self) -> None:
+        """Forget everything recorded."""
+        self.counters = {}
+        self.histograms = {}
+
+
+class CallbackMetrics(Metrics):
+    """Forward every counter and sample to a callback(kind, name, value, labels)."""
+
+    enabled = True
+
+    def __init__(self, callback: Callable[[str, str, float, dict], None]) -> None:
+        """Initialize. kind is "counter" or "histogram"."""
+        self._callback = callback
+
+    def increment(self, name: str, value: int = 1, **labels: str) -> None:
+        """Forward a counter increment."""
+        self._callback("counter", name, value, labels)
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        """Forward a histogram sample."""
+        self._callback("histogram", name, value, labels)
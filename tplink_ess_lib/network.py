@@ -1,12 +1,18 @@
 """Provide network interfacing functions."""
 
+import asyncio
 import logging
 import random
 import socket
+import time
 from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
 
 from .binary import mac_to_bytes, mac_to_str
+from .capture import RECEIVED, SENT, Recorder
+from .metrics import NULL_METRICS, Metrics
 from .protocol import Protocol
+from .rtt import RttEstimator
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -23,8 +29,8 @@ class MissingMac(Exception):
     """Exception for missing MAC address."""
 
 
-class Network:
-    """Class for network functions."""
+class _NetworkBase:
+    """Packet handling shared by the blocking and asyncio networks."""
 
     BROADCAST_ADDR = "255.255.255.255"
     BROADCAST_MAC = "00:00:00:00:00:00"
@@ -34,32 +40,213 @@ class Network:
     SOCKET_TIMEOUT = 2  # timeout for socket operations
     RECEIVE_TIMEOUT = 10  # total amount of time to wait for tx/rx sequence
 
-    def __init__(self, host_mac, testing: bool = False):
-        """Initialize."""
+    def __init__(
+        self,
+        host_mac,
+        testing: bool = False,
+        metrics: Optional[Metrics] = None,
+        capture: Optional[Recorder] = None,
+    ):
+        """
+        Initialize.
+
+        metrics receives counters and timings (see metrics.py); capture,
+        e.g. a CaptureWriter or FlightRecorder, every datagram sent and
+        received (see capture.py).
+        """
         self.host_mac = host_mac
         self.sequence_id = random.randint(0, 1000)
         self.token_id = None
         self.testing = testing
+        self.metrics = metrics or NULL_METRICS
+        self.capture = capture
+        # the host MAC as it appears in encrypted replies addressed to us
+        self._host_cipher = Protocol.encrypt_field(
+            mac_to_bytes(host_mac), Protocol.HOST_MAC_FIELD
+        )
+        # packed headers per (switch_mac, op_code), see Protocol.build_packet
+        self._templates: Dict[Tuple[str, int], bytes] = {}
 
-        # Sending socket
-        self.s_socket = socket.socket(
+    @staticmethod
+    def _open_send_socket():
+        """Create the broadcast sending socket."""
+        s_socket = socket.socket(
             socket.AF_INET,
             socket.SOCK_DGRAM,
             socket.IPPROTO_UDP,
         )
-        self.s_socket.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
-        self.s_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
-        self.s_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        s_socket.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        s_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        s_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        return s_socket
 
-        # Receiving socket
-        self.r_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    def _open_receive_socket(self):
+        """
+        Create the receiving socket bound to the reply port.
+
+        Replies are broadcast, so every socket bound to the port gets each
+        one: the port is shared, letting networks, fleets and listeners of
+        other event loops or processes on this host bind it too.
+        """
+        r_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        r_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         try:
-            self.r_socket.bind((Network.BROADCAST_ADDR, Network.UDP_RECEIVE_FROM_PORT))
+            r_socket.bind((self.BROADCAST_ADDR, self.UDP_RECEIVE_FROM_PORT))
         except OSError:
-            self.r_socket.bind(("", Network.UDP_RECEIVE_FROM_PORT))
+            r_socket.bind(("", self.UDP_RECEIVE_FROM_PORT))
         except Exception as err:
             _LOGGER.error("Problem creating listener: %s", err)
             raise err
+        return r_socket
+
+    def _build_packet(
+        self, switch_mac, op_code, payload, token_id=None, sequence_id=None
+    ):
+        """Advance the sequence and return an encoded packet for the switch."""
+        if sequence_id is None:
+            sequence_id = (self.sequence_id + 1) % 1000
+        self.sequence_id = sequence_id
+
+        key = (switch_mac, op_code)
+        if (template := self._templates.get(key)) is None:
+            template = self._templates[key] = Protocol.header_template(
+                op_code, mac_to_bytes(switch_mac), mac_to_bytes(self.host_mac)
+            )
+        if token_id is None:
+            token_id = self.token_id
+
+        packet = Protocol.build_packet(
+            template, self.sequence_id, token_id or 0, payload
+        )
+        if _LOGGER.isEnabledFor(logging.DEBUG):
+            _LOGGER.debug("Sending Packet to %s: %s", switch_mac, packet.hex())
+            _LOGGER.debug("Sending Header: %s", Protocol.interpret_header(packet))
+            _LOGGER.debug("Sending Payload: %s", payload)
+        packet = Protocol.encode(packet)
+        if self.capture is not None:
+            self.capture.record(SENT, packet)
+        if self.metrics.enabled:
+            self.metrics.increment("packets_sent", **self._labels(switch_mac, op_code))
+        return packet
+
+    lazy = False  # return TlvView payloads instead of decoded tuples
+    sequence_ids: Optional[range] = None  # replies outside are someone else's
+
+    # XOR with the encrypted sequence_id field to read it without decrypting
+    _SEQUENCE_MASK = int.from_bytes(Protocol.KEYSTREAM[Protocol.SEQUENCE_FIELD], "big")
+
+    def _prefilter(self, data) -> Optional[dict]:
+        """
+        Return the header of a datagram, or None if it is not for this host.
+
+        The host MAC is compared while still encrypted, so replies to other
+        hosts are dropped without decrypting anything, and with sequence_ids
+        set so are replies to requests of other processes sharing the port
+        (only the two sequence_id bytes are decrypted). Otherwise only the
+        header is decrypted. The payload is left to _decode_packet.
+        """
+        if self.capture is not None:
+            self.capture.record(RECEIVED, data)
+        if len(data) < Protocol.MIN_PACKET_SIZE:
+            # could be anyone's: counted, but no reason to dump the capture
+            _LOGGER.debug("Ignoring short packet of %d bytes", len(data))
+            self._dropped("malformed")
+            return None
+        if not self.testing and data[Protocol.HOST_MAC_FIELD] != self._host_cipher:
+            self._dropped("host_mac")
+            return None
+        if self.sequence_ids is not None:
+            sequence_id = int.from_bytes(data[Protocol.SEQUENCE_FIELD], "big")
+            if sequence_id ^ self._SEQUENCE_MASK not in self.sequence_ids:
+                self._dropped("sequence_id")
+                return None
+        header = Protocol.peek_header(data)
+        if self.metrics.enabled:
+            self.metrics.increment(
+                "packets_received",
+                **self._labels(header["switch_mac"], header["op_code"]),
+            )
+        return header
+
+    def _decode_packet(self, data):
+        """Decrypt a datagram and return its header+payload as a tuple."""
+        if self.metrics.enabled:
+            return self._decode_packet_timed(data)
+        data = Protocol.decode(data)
+        header, payload = Protocol.parse(data, lazy=self.lazy)
+        if _LOGGER.isEnabledFor(logging.DEBUG):
+            _LOGGER.debug("Receive Packet: %s", data.hex())
+            _LOGGER.debug("Received Header: %s", header)
+            _LOGGER.debug("Received Payload: %s", payload)
+        return header, payload
+
+    def _decode_packet_timed(self, data):
+        """Decode as _decode_packet does, reporting decode and parse times."""
+        start = time.perf_counter()
+        try:
+            data = Protocol.decode(data)
+            decoded = time.perf_counter()
+            header, payload = Protocol.parse(data, lazy=self.lazy)
+        except (AssertionError, KeyError, ValueError):
+            self.metrics.increment("replies_dropped", reason="malformed")
+            raise
+        parsed = time.perf_counter()
+        if _LOGGER.isEnabledFor(logging.DEBUG):
+            _LOGGER.debug("Receive Packet: %s", data.hex())
+            _LOGGER.debug("Received Header: %s", header)
+            _LOGGER.debug("Received Payload: %s", payload)
+        labels = self._labels(header["switch_mac"], header["op_code"])
+        self.metrics.observe("decode_seconds", decoded - start, **labels)
+        self.metrics.observe("parse_seconds", parsed - decoded, **labels)
+        return header, payload
+
+    @staticmethod
+    def _labels(switch_mac, op_code) -> Dict[str, str]:
+        """Return the metric labels of a packet."""
+        if isinstance(switch_mac, bytes):
+            switch_mac = mac_to_str(switch_mac)
+        return {
+            "switch": switch_mac,
+            "op_code": Protocol.op_codes.get(op_code, str(op_code)),
+        }
+
+    def _failed(self, reason: str) -> None:
+        """Tell the capture a request failed or a packet was unreadable."""
+        if self.capture is not None:
+            self.capture.error(reason)
+
+    def _dropped(self, reason: str) -> None:
+        """Count a received reply that was ignored."""
+        if self.metrics.enabled:
+            self.metrics.increment("replies_dropped", reason=reason)
+
+    @staticmethod
+    def login_dict(username, password):
+        """Return login dict."""
+        return [
+            (Protocol.get_id("username"), username.encode("ascii") + b"\x00"),
+            (Protocol.get_id("password"), password.encode("ascii") + b"\x00"),
+        ]
+
+
+class Network(_NetworkBase):
+    """Class for network functions."""
+
+    def __init__(
+        self,
+        host_mac,
+        testing: bool = False,
+        metrics: Optional[Metrics] = None,
+        capture: Optional[Recorder] = None,
+    ):
+        """Initialize."""
+        super().__init__(host_mac, testing, metrics, capture)
+
+        # Sending socket
+        self.s_socket = self._open_send_socket()
+
+        # Receiving socket
+        self.r_socket = self._open_receive_socket()
         self.r_socket.settimeout(10)
 
     def __enter__(self):
@@ -72,25 +259,7 @@ class Network:
 
     def send(self, switch_mac, op_code, payload):
         """Send a packet to the given switch."""
-        self.sequence_id = (self.sequence_id + 1) % 1000
-
-        header = Protocol.header["blank"].copy()
-        header.update(
-            {
-                "sequence_id": self.sequence_id,
-                "host_mac": mac_to_bytes(self.host_mac),
-                "switch_mac": mac_to_bytes(switch_mac),
-                "op_code": op_code,
-            }
-        )
-        if self.token_id:
-            header["token_id"] = self.token_id
-
-        packet = Protocol.assemble_packet(header, payload)
-        _LOGGER.debug("Sending Packet to %s: %s", switch_mac, packet.hex())
-        packet = Protocol.encode(packet)
-        _LOGGER.debug("Sending Header: %s", str(header))
-        _LOGGER.debug("Sending Payload: %s", str(payload))
+        packet = self._build_packet(switch_mac, op_code, payload)
 
         # Send packet
         self.s_socket.sendto(packet, (Network.BROADCAST_ADDR, Network.UDP_SEND_TO_PORT))
@@ -99,14 +268,9 @@ class Network:
         """Wait for an incoming packet, then return header+payload as a tuple."""
         end_time = datetime.now() + timedelta(seconds=Network.RECEIVE_TIMEOUT)
         while (data := self.receive_socket()) and datetime.now() < end_time:
-            data = Protocol.decode(data)
-            _LOGGER.debug("Receive Packet: %s", data.hex())
-            header, payload = Protocol.split(data)
-            header, payload = Protocol.interpret_header(
-                header
-            ), Protocol.interpret_payload(payload)
-            _LOGGER.debug("Received Header: %s", str(header))
-            _LOGGER.debug("Received Payload: %s", str(payload))
+            # check host_mac alignment
+            if (header := self._prefilter(data)) is None:
+                continue
             # check sequence_id alignment
             if self.sequence_id != header["sequence_id"] and not self.testing:
                 _LOGGER.debug(
@@ -114,16 +278,14 @@ class Network:
                     header["sequence_id"],
                     self.sequence_id,
                 )
+                self._dropped("sequence_id")
                 continue
-            # check host_mac alignment
-            data_mac = mac_to_str(header["host_mac"])
-            if self.host_mac != data_mac and not self.testing:
-                _LOGGER.debug(
-                    "Ignoring host-mac %s expected %s", data_mac, self.host_mac
-                )
-                continue
+            header, payload = self._decode_packet(data)
             self.token_id = header["token_id"]
             return header, payload
+        if self.metrics.enabled:
+            self.metrics.increment("timeouts")
+        self._failed("timeout")
         raise ConnectionProblem()
 
     def receive_socket(self):
@@ -142,16 +304,18 @@ class Network:
         Send a packet to the given switch, then wait for a response and
         return header+payload as a tuple.
         """
+        if not self.metrics.enabled:
+            self.send(switch_mac, op_code, payload)
+            return self.receive()
+        start = time.perf_counter()
         self.send(switch_mac, op_code, payload)
-        return self.receive()
-
-    @staticmethod
-    def login_dict(username, password):
-        """Return login dict."""
-        return [
-            (Protocol.get_id("username"), username.encode("ascii") + b"\x00"),
-            (Protocol.get_id("password"), password.encode("ascii") + b"\x00"),
-        ]
+        reply = self.receive()
+        self.metrics.observe(
+            "rtt_seconds",
+            time.perf_counter() - start,
+            **self._labels(switch_mac, op_code),
+        )
+        return reply
 
     def login(self, switch_mac: str, username: str, password: str):
         """Send login credentials to switch."""
@@ -165,3 +329,435 @@ class Network:
         real_payload += payload
         header, payload = self.query(switch_mac, Protocol.LOGIN, real_payload)
         return header, payload
+
+
+# networks handed out by AsyncNetwork.shared, opening or open, by options
+_SHARED: Dict[tuple, asyncio.Future] = {}
+
+
+class AsyncNetwork(_NetworkBase, asyncio.DatagramProtocol):
+    """
+    Class for asyncio network functions.
+
+    Replies are delivered by the event loop and matched to the waiting
+    request by (switch_mac, sequence_id), so no coroutine ever blocks on a
+    socket and one receive socket can serve many switches at once.
+    """
+
+    _BROADCAST_BYTES = mac_to_bytes(_NetworkBase.BROADCAST_MAC)
+
+    MAX_RETRANSMITS = 3  # resends of an unanswered request, same sequence_id
+
+    def __init__(
+        self,
+        host_mac,
+        testing: bool = False,
+        lazy: bool = False,
+        address: Optional[str] = None,
+        send_port: Optional[int] = None,
+        receive_port: Optional[int] = None,
+        metrics: Optional[Metrics] = None,
+        capture: Optional[Recorder] = None,
+        sequence_ids: Optional[range] = None,
+    ):
+        """
+        Initialize.
+
+        With lazy set, reply payloads are lists of TlvView that decode
+        each value only when it is accessed. address and the ports replace
+        the broadcast defaults, e.g. to talk to a SwitchSimulator on
+        loopback; receive_port 0 binds any free port. sequence_ids limits
+        the sequence ids this network uses and accepts replies for, so
+        networks in several processes can share one reply port.
+        """
+        super().__init__(host_mac, testing, metrics, capture)
+        self.lazy = lazy
+        if sequence_ids is not None:
+            # several processes, each with its own sequence_ids, share the port
+            self.sequence_ids = sequence_ids
+            self.sequence_id = random.choice(sequence_ids)
+        if address is not None:
+            self.BROADCAST_ADDR = address  # pylint: disable=invalid-name
+        if send_port is not None:
+            self.UDP_SEND_TO_PORT = send_port  # pylint: disable=invalid-name
+        if receive_port is not None:
+            self.UDP_RECEIVE_FROM_PORT = receive_port  # pylint: disable=invalid-name
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._transport: Optional[asyncio.DatagramTransport] = None
+        self._send_transport: Optional[asyncio.DatagramTransport] = None
+        self._pending: Dict[Tuple[bytes, int], asyncio.Queue] = {}
+        self._sequences: Dict[bytes, int] = {}
+        self._rtt: Dict[bytes, RttEstimator] = {}
+        self._sockets: tuple = ()
+        self._shared_key: Optional[tuple] = None
+        self._users = 0
+        self.retransmits = 0
+
+    async def open(self, send_transport: Optional[asyncio.DatagramTransport] = None):
+        """
+        Create the sockets and attach them to the running event loop.
+
+        With send_transport, e.g. a capture.ReplayTransport, packets are sent
+        through it instead and no socket is opened; it delivers replies to
+        datagram_received.
+        """
+        self._loop = asyncio.get_running_loop()
+        if send_transport is not None:
+            self._send_transport = send_transport
+            return self
+        s_socket = self._open_send_socket()
+        try:
+            r_socket = self._open_receive_socket()
+        except Exception:
+            s_socket.close()
+            raise
+        s_socket.setblocking(False)
+        r_socket.setblocking(False)
+        self._sockets = (s_socket, r_socket)
+        self._send_transport, _ = await self._loop.create_datagram_endpoint(
+            asyncio.DatagramProtocol, sock=s_socket
+        )
+        self._transport, _ = await self._loop.create_datagram_endpoint(
+            lambda: self, sock=r_socket
+        )
+        return self
+
+    @property
+    def receive_address(self) -> Optional[Tuple[str, int]]:
+        """Return the (address, port) the receive socket is bound to."""
+        if self._transport is None:
+            return None
+        return self._transport.get_extra_info("sockname")
+
+    @classmethod
+    async def shared(
+        cls,
+        host_mac,
+        testing: bool = False,
+        lazy: bool = False,
+        metrics: Optional[Metrics] = None,
+        capture: Optional[Recorder] = None,
+    ) -> "AsyncNetwork":
+        """
+        Return an open network shared by every caller on this event loop.
+
+        Callers passing the same host MAC and options get the same network,
+        so they share its receive socket and sequence ids instead of each
+        binding the reply port. Every call must be paired with release().
+        """
+        for stale in [key for key in _SHARED if key[0].is_closed()]:
+            # left open by asyncio.run calls that ended, holding the port
+            opening = _SHARED.pop(stale)
+            if opening.done() and not opening.cancelled() and not opening.exception():
+                opening.result().close()
+        key = (
+            asyncio.get_running_loop(),
+            host_mac,
+            testing,
+            lazy,
+            id(metrics),
+            id(capture),
+        )
+        if (opening := _SHARED.get(key)) is None:
+            network = cls(host_mac, testing, lazy, metrics=metrics, capture=capture)
+            network._shared_key = key
+            opening = _SHARED[key] = asyncio.ensure_future(network.open())
+        try:
+            network = await opening
+        except Exception:
+            if _SHARED.get(key) is opening:
+                del _SHARED[key]
+            raise
+        network._users += 1
+        return network
+
+    def release(self) -> None:
+        """Give back a network from shared(), closing it after its last user."""
+        self._users -= 1
+        if self._users <= 0:
+            _SHARED.pop(self._shared_key, None)
+            self.close()
+
+    def close(self):
+        """Close the transports and fail any outstanding requests."""
+        if self._loop is not None and self._loop.is_closed():
+            # the transports cannot close without their loop
+            for sock in self._sockets:
+                sock.close()
+        else:
+            for transport in (self._transport, self._send_transport):
+                if transport is not None:
+                    transport.close()
+        self._transport = self._send_transport = None
+        self._sockets = ()
+        for queue in self._pending.values():
+            queue.put_nowait(ConnectionProblem("network closed"))
+
+    async def __aenter__(self):
+        """Enter method."""
+        return await self.open()
+
+    async def __aexit__(self, exc_type, exc_value, exc_tb):
+        """Exit method."""
+        self.close()
+
+    def datagram_received(self, data, addr):
+        """Route a received datagram to the request waiting for it."""
+        if (header := self._prefilter(data)) is None:
+            return
+        sequence_id = header["sequence_id"]
+        queue = self._pending.get((header["switch_mac"], sequence_id))
+        if queue is None:
+            # broadcast requests (discovery) accept replies from any switch
+            queue = self._pending.get((self._BROADCAST_BYTES, sequence_id))
+        if queue is None and self.testing and self._pending:
+            queue = next(iter(self._pending.values()))
+        if queue is None:
+            _LOGGER.debug(
+                "Ignoring unexpected sequence_id %d from %s",
+                sequence_id,
+                mac_to_str(header["switch_mac"]),
+            )
+            self._dropped("sequence_id")
+            return
+        try:
+            header, payload = self._decode_packet(data)
+        except (AssertionError, KeyError, ValueError) as err:
+            _LOGGER.debug("Ignoring malformed packet from %s: %s", addr, err)
+            self._failed("malformed packet")
+            return
+        self.token_id = header["token_id"]
+        queue.put_nowait((header, payload))
+
+    def error_received(self, exc):
+        """Fail outstanding requests on a socket error."""
+        _LOGGER.debug("Error: %s", exc)
+        for queue in self._pending.values():
+            queue.put_nowait(ConnectionProblem(str(exc)))
+
+    def _deadline(self, timeout):
+        """Return the loop time at which a request gives up."""
+        if timeout is None:
+            timeout = self.RECEIVE_TIMEOUT
+        return self._loop.time() + timeout
+
+    def _next_key(self, switch_mac) -> Tuple[bytes, int]:
+        """Return the (switch_mac, sequence_id) key of the next request."""
+        mac = mac_to_bytes(switch_mac)
+        ids = self.sequence_ids or range(1000)
+        sequence_id = self._sequences.get(mac, self.sequence_id)
+        for _ in ids:
+            sequence_id = ids[(sequence_id - ids.start + 1) % len(ids)]
+            # skip ids still in flight so pipelined replies stay unambiguous
+            if (mac, sequence_id) not in self._pending:
+                break
+        else:
+            raise ConnectionProblem(f"too many requests in flight to {switch_mac}")
+        self._sequences[mac] = sequence_id
+        return mac, sequence_id
+
+    def _register(self, switch_mac) -> Tuple[Tuple[bytes, int], asyncio.Queue]:
+        """Reserve the next sequence_id for a switch and queue its replies."""
+        key = self._next_key(switch_mac)
+        queue: asyncio.Queue = asyncio.Queue()
+        self._pending[key] = queue
+        return key, queue
+
+    def _send_packet(self, key, op_code, payload, token_id=None) -> bytes:
+        """Encode and send a packet for a registered request, return it."""
+        if self._send_transport is None:
+            raise ConnectionProblem("network not open")
+        packet = self._build_packet(
+            mac_to_str(key[0]), op_code, payload, token_id, sequence_id=key[1]
+        )
+        self._send_transport.sendto(
+            packet, (self.BROADCAST_ADDR, self.UDP_SEND_TO_PORT)
+        )
+        return packet
+
+    def _resend(self, packet: bytes) -> None:
+        """Send an already encoded packet again."""
+        if self._send_transport is None:
+            raise ConnectionProblem("network not open")
+        self.retransmits += 1
+        if self.capture is not None:
+            self.capture.record(SENT, packet)
+        if self.metrics.enabled:
+            self.metrics.increment("retransmits")
+        self._send_transport.sendto(
+            packet, (self.BROADCAST_ADDR, self.UDP_SEND_TO_PORT)
+        )
+
+    def rtt(self, switch_mac) -> RttEstimator:
+        """Return the round-trip time estimate of a switch."""
+        mac = mac_to_bytes(switch_mac) if isinstance(switch_mac, str) else switch_mac
+        if (estimator := self._rtt.get(mac)) is None:
+            estimator = self._rtt[mac] = RttEstimator()
+        return estimator
+
+    async def _wait_reply(self, queue: asyncio.Queue, until: float):
+        """Return the next reply on queue, or None if none came by until."""
+        remaining = until - self._loop.time()
+        if remaining <= 0:
+            return None
+        try:
+            reply = await asyncio.wait_for(queue.get(), remaining)
+        except asyncio.TimeoutError:
+            return None
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+    async def _next_reply(self, queue: asyncio.Queue, deadline: float):
+        """Wait for the next reply on queue until the deadline passes."""
+        if (reply := await self._wait_reply(queue, deadline)) is None:
+            raise ConnectionProblem("timeout")
+        return reply
+
+    async def send(self, switch_mac, op_code, payload):
+        """Send a packet to the given switch without waiting for a reply."""
+        key = self._next_key(switch_mac)
+        self._send_packet(key, op_code, payload)
+        return key[1]
+
+    async def query(
+        self,
+        switch_mac,
+        op_code,
+        payload,
+        timeout=None,
+        token_id=None,
+        retransmit=True,
+    ):
+        """
+        Send packet to switch.
+
+        Send a packet to the given switch, then wait for a response and
+        return header+payload as a tuple. token_id overrides the token of
+        the last reply, for callers that track one token per switch.
+
+        An unanswered packet is resent unchanged, keeping its sequence_id,
+        after the switch's retransmit timeout, at most MAX_RETRANSMITS
+        times and never past the overall timeout. Requests that change
+        the switch's state on every copy (get_token_id and LOGIN hand out
+        a new token each time) pass retransmit=False: the packet is sent
+        once and waited for until the timeout.
+        """
+        deadline = self._deadline(timeout)
+        key, queue = self._register(switch_mac)
+        try:
+            packet = self._send_packet(key, op_code, payload, token_id)
+            return await self._exchange(
+                key, queue, packet, op_code, deadline, retransmit
+            )
+        finally:
+            self._pending.pop(key, None)
+
+    # pylint: disable-next=too-many-arguments
+    async def _exchange(self, key, queue, packet, op_code, deadline, retransmit):
+        """Wait for the reply to a sent packet, resending it on timeouts."""
+        estimator = self.rtt(key[0])
+        sent = self._loop.time()
+        resends = self.MAX_RETRANSMITS if retransmit else 0
+        for attempt in range(resends + 1):
+            until = deadline
+            if retransmit:
+                until = min(deadline, self._loop.time() + estimator.rto)
+            if (reply := await self._wait_reply(queue, until)) is not None:
+                elapsed = self._loop.time() - sent
+                # Karn: a reply to a resent packet is an ambiguous sample
+                if attempt == 0:
+                    estimator.sample(elapsed)
+                if self.metrics.enabled:
+                    self.metrics.observe(
+                        "rtt_seconds", elapsed, **self._labels(key[0], op_code)
+                    )
+                return reply
+            if self._loop.time() >= deadline:
+                break
+            if attempt < resends:
+                estimator.backoff()
+                _LOGGER.debug(
+                    "Resending sequence_id %d to %s", key[1], mac_to_str(key[0])
+                )
+                self._resend(packet)
+        if self.metrics.enabled:
+            self.metrics.increment("timeouts", **self._labels(key[0], op_code))
+        self._failed("timeout")
+        raise ConnectionProblem("timeout")
+
+    async def query_many(
+        self, switch_mac, requests, window=4, timeout=None, token_id=None
+    ):
+        """
+        Send several packets to a switch with up to window of them in flight.
+
+        requests is a list of (op_code, payload). Replies are matched by
+        sequence_id, so they may arrive out of order; duplicates are dropped.
+        Returns a list in request order holding header+payload tuples, or the
+        ConnectionProblem of a request that got no reply.
+        """
+        semaphore = asyncio.Semaphore(window)
+
+        async def _query(op_code, payload):
+            async with semaphore:
+                try:
+                    return await self.query(
+                        switch_mac, op_code, payload, timeout, token_id
+                    )
+                except ConnectionProblem as err:
+                    return err
+
+        return list(await asyncio.gather(*(_query(*request) for request in requests)))
+
+    async def replies(self, switch_mac, op_code, payload, timeout=None, quiet=None):
+        """
+        Send a packet and yield every reply to it until the deadline.
+
+        With quiet set, also stop once no reply has arrived for that many
+        seconds after the previous one.
+        """
+        deadline = self._deadline(timeout)
+        key, queue = self._register(switch_mac)
+        try:
+            self._send_packet(key, op_code, payload)
+            wait_until = deadline
+            while True:
+                try:
+                    reply = await self._next_reply(queue, wait_until)
+                except ConnectionProblem:
+                    return
+                yield reply
+                if quiet is not None:
+                    wait_until = min(deadline, self._loop.time() + quiet)
+        finally:
+            self._pending.pop(key, None)
+
+    async def login(self, switch_mac: str, username: str, password: str):
+        """Send login credentials to switch, each request sent once."""
+        await self.query(
+            switch_mac,
+            Protocol.GET,
+            [(Protocol.get_id("get_token_id"), b"")],
+            retransmit=False,
+        )
+        await self.query(
+            switch_mac,
+            Protocol.LOGIN,
+            self.login_dict(username, password),
+            retransmit=False,
+        )
+
+    async def set(self, switch_mac, username, password, payload):
+        """Authenticate to the switch, each request sent once."""
+        await self.query(
+            switch_mac,
+            Protocol.GET,
+            [(Protocol.get_id("get_token_id"), b"")],
+            retransmit=False,
+        )
+        real_payload = self.login_dict(username, password)
+        real_payload += payload
+        return await self.query(
+            switch_mac, Protocol.LOGIN, real_payload, retransmit=False
+        )
@@ -4,11 +4,185 @@ import base64
 import logging
 import struct
 from ipaddress import ip_address
+from typing import Any, Callable, Dict, Iterator, NamedTuple
 
-from .binary import byte2ports, mac_to_str
+from .binary import byte2ports, mac_to_bytes, mac_to_str
 
 _LOGGER = logging.getLogger(__name__)
 
+_VLAN = struct.Struct("!hii")
+_PVID = struct.Struct("!bh")
+_STAT = struct.Struct("!bbbIIII")
+# header = prefix (version, op_code, switch_mac, host_mac) + tail
+_HEADER_PREFIX = struct.Struct("!bb6s6s")
+_HEADER_TAIL = struct.Struct("!hihhhhi")
+
+
+def _decode_str(value):
+    """Decode a NUL-terminated ASCII string."""
+    return value.split(b"\x00", 1)[0].decode("ascii")
+
+
+def _decode_ip(value):
+    """Decode an IPv4 address."""
+    return f"{ip_address(value):s}"
+
+
+def _decode_vlan(value):
+    """Decode a VLAN entry into [vlan_id, member ports, tagged ports, name]."""
+    vlan_id, member, tagged = _VLAN.unpack_from(value)
+    return [
+        vlan_id,
+        byte2ports(member),
+        byte2ports(tagged),
+        value[10:-1].decode("ascii"),
+    ]
+
+
+def _decode_pvid(value):
+    """Decode a (port, vlan_id) pair."""
+    return _PVID.unpack(value) if value else None
+
+
+def _decode_bool(value):
+    """Decode a one-byte flag; empty values are returned unchanged."""
+    if len(value) == 0:
+        return value
+    if len(value) == 1:
+        return value[0] > 0
+    raise AssertionError("boolean should be one byte long")
+
+
+def _encode_str(value):
+    """Encode a NUL-terminated ASCII string."""
+    return value.encode("ascii") + b"\x00"
+
+
+def _encode_dec(value):
+    """Encode an integer in as few bytes as it needs."""
+    return value.to_bytes(max(1, (value.bit_length() + 7) // 8), "big")
+
+
+def _encode_vlan(value):
+    """Encode a (vlan_id, member mask, tagged mask, name) entry."""
+    vlan_id, member, tagged, name = value
+    return _VLAN.pack(vlan_id, member, tagged) + name.encode("ascii") + b"\x00"
+
+
+KIND_DECODERS: Dict[str, Callable[[bytes], Any]] = {
+    "str": _decode_str,
+    "ip": _decode_ip,
+    "hex": mac_to_str,
+    "action": lambda value: "n/a",
+    "dec": lambda value: int.from_bytes(value, "big"),
+    "vlan": _decode_vlan,
+    "pvid": _decode_pvid,
+    "stat": _STAT.unpack,
+    "bool": _decode_bool,
+}
+
+KIND_ENCODERS: Dict[str, Callable[[Any], bytes]] = {
+    "str": _encode_str,
+    "ip": lambda value: ip_address(value).packed,
+    "hex": mac_to_bytes,
+    "action": lambda value: b"",
+    "dec": _encode_dec,
+    "vlan": _encode_vlan,
+    "pvid": lambda value: _PVID.pack(*value),
+    "stat": lambda value: _STAT.pack(*value),
+    "bool": lambda value: b"\x01" if value else b"\x00",
+}
+
+
+class TlvCodec(NamedTuple):
+    """Compiled decoder and encoder of one type id."""
+
+    type_id: int
+    kind: str
+    name: str
+    decode: Callable[[bytes], Any]
+    encode: Callable[[Any], bytes]
+
+
+def compile_schema(ids_tp) -> Dict[int, TlvCodec]:
+    """Return the codec of every type id in an ids_tp style table."""
+    return {
+        type_id: TlvCodec(type_id, kind, name, KIND_DECODERS[kind], KIND_ENCODERS[kind])
+        for type_id, (kind, name, *_) in ids_tp.items()
+    }
+
+
+def _rc4_keystream(state, length):
+    """Return length bytes of RC4 keystream generated from the given S-box."""
+    s = bytearray(state)  # pylint: disable=invalid-name
+    out = bytearray(length)
+    j = 0
+    for k in range(length):
+        i = (k + 1) & 255
+        j = (j + s[i]) & 255
+        s[i], s[j] = s[j], s[i]
+        out[k] = s[(s[i] + s[j]) & 255]
+    return bytes(out)
+
+
+class TlvView:
+    """
+    Lazy view of one TLV inside a decoded packet.
+
+    Holds only an offset into the packet buffer; the value is decoded the
+    first time it is accessed. Iterates like the (type_id, name, value)
+    tuples returned by Protocol.interpret_payload.
+    """
+
+    __slots__ = ("type_id", "_buffer", "_offset", "_length", "_value")
+
+    _UNSET = object()
+
+    def __init__(self, type_id: int, buffer: memoryview, offset: int, length: int):
+        """Initialize."""
+        self.type_id = type_id
+        self._buffer = buffer
+        self._offset = offset
+        self._length = length
+        self._value: Any = TlvView._UNSET
+
+    @property
+    def name(self) -> str:
+        """Return the type name."""
+        return Protocol.ids_tp[self.type_id][1]
+
+    @property
+    def raw(self) -> memoryview:
+        """Return the undecoded value bytes without copying."""
+        return self._buffer[self._offset : self._offset + self._length]
+
+    @property
+    def value(self) -> Any:
+        """Return the decoded value, decoding it on first access."""
+        if self._value is TlvView._UNSET:
+            self._value = Protocol.schema[self.type_id].decode(bytes(self.raw))
+        return self._value
+
+    def __iter__(self) -> Iterator[Any]:
+        """Iterate as a (type_id, name, value) tuple."""
+        return iter((self.type_id, self.name, self.value))
+
+    def __getitem__(self, index):
+        """Index as a (type_id, name, value) tuple, decoding only the value."""
+        if index in (0, -3):
+            return self.type_id
+        if index in (1, -2):
+            return self.name
+        return tuple(self)[index]
+
+    def __len__(self) -> int:
+        """Return the tuple length."""
+        return 3
+
+    def __repr__(self) -> str:
+        """Return the representation."""
+        return f"TlvView({self.type_id}, {self._length} bytes)"
+
 
 class Protocol:
     """Class to handle TpLink ESS messages."""
@@ -25,6 +199,12 @@ class Protocol:
 
     KEY = base64.b64decode(KEY_BASE64)
 
+    MAX_PACKET_SIZE = 1500  # largest datagram the switches send
+
+    # KEY is used directly as the cipher state, so every packet is XORed
+    # with the same keystream; compute it once.
+    KEYSTREAM = _rc4_keystream(KEY, MAX_PACKET_SIZE)
+
     header = {
         "len": 32,
         "fmt": "!bb6s6shihhhhi",
@@ -103,6 +283,15 @@ class Protocol:
 
     tp_ids = {v[1]: k for k, v in ids_tp.items()}
 
+    HEADER_STRUCT = struct.Struct(header["fmt"])
+    TLV_STRUCT = struct.Struct("!hh")
+    MIN_PACKET_SIZE = header["len"] + len(PACKET_END)
+
+    HOST_MAC_FIELD = slice(8, 14)  # bytes of host_mac in the header
+    SEQUENCE_FIELD = slice(14, 16)  # bytes of sequence_id in the header
+
+    schema = compile_schema(ids_tp)
+
     @staticmethod
     def get_id(name):
         """Return id from name."""
@@ -111,18 +300,30 @@ class Protocol:
     @staticmethod
     def decode(data):
         """Decode switch packet."""
-        data = bytearray(data)
-        s = bytearray(Protocol.KEY)  # pylint: disable=invalid-name
-        j = 0
-        for k in range(len(data)):  # pylint: disable=consider-using-enumerate
-            i = (k + 1) & 255
-            j = (j + s[i]) & 255
-            s[i], s[j] = s[j], s[i]
-            data[k] = data[k] ^ s[(s[i] + s[j]) & 255]
-        return bytes(data)
+        length = len(data)
+        if length > len(Protocol.KEYSTREAM):
+            keystream = _rc4_keystream(Protocol.KEY, length)
+        else:
+            keystream = Protocol.KEYSTREAM[:length]
+        value = int.from_bytes(data, "big") ^ int.from_bytes(keystream, "big")
+        return value.to_bytes(length, "big")
 
     encode = decode
 
+    @staticmethod
+    def encrypt_field(value, field: slice) -> bytes:
+        """Return value as it appears on the wire at field of a datagram."""
+        return bytes(a ^ b for a, b in zip(value, Protocol.KEYSTREAM[field]))
+
+    @staticmethod
+    def peek_header(data):
+        """Decrypt and decode only the header of an encrypted datagram."""
+        if len(data) < Protocol.MIN_PACKET_SIZE:
+            raise AssertionError("invalid data length")
+        return Protocol.interpret_header(
+            Protocol.decode(data[: Protocol.header["len"]])
+        )
+
     @staticmethod
     def split(data):
         """Split the packet apart."""
@@ -132,88 +333,152 @@ class Protocol:
             raise AssertionError("data without packet end")
         return data[0 : Protocol.header["len"]], data[Protocol.header["len"] :]
 
+    @staticmethod
+    def parse(data, wanted=None, lazy=True):
+        """
+        Split a decoded packet without copying it.
+
+        Returns the header dict and the TLVs. With lazy set these are
+        TlvView objects sharing one memoryview of data, otherwise decoded
+        (type_id, name, value) tuples. When wanted is a collection of type
+        ids, other TLVs are skipped by length without being decoded.
+        """
+        if len(data) < Protocol.header["len"] + len(Protocol.PACKET_END):
+            raise AssertionError("invalid data length")
+        if data[-len(Protocol.PACKET_END) :] != Protocol.PACKET_END:
+            raise AssertionError("data without packet end")
+        header = Protocol.interpret_header(data)
+        if lazy:
+            tlvs = Protocol.iter_payload(data, Protocol.header["len"], wanted)
+            return header, list(tlvs)
+        return header, Protocol._decode_tlvs(data, Protocol.header["len"], wanted)
+
     @staticmethod
     def interpret_header(header):
         """Decode the packet header."""
         names = Protocol.header["blank"].keys()
-        vals = struct.unpack(Protocol.header["fmt"], header)
+        vals = Protocol.HEADER_STRUCT.unpack_from(header)
         return dict(zip(names, vals))
 
     @staticmethod
-    def interpret_payload(payload):
-        """Decode the packet payload."""
+    def iter_payload(payload, offset=0, wanted=None) -> Iterator[TlvView]:
+        """Yield a lazy TlvView for each TLV in payload, starting at offset."""
+        view = memoryview(payload)
+        end = len(view) - len(Protocol.PACKET_END)
+        unpack_from = Protocol.TLV_STRUCT.unpack_from
+        while offset < end:
+            dtype, dlen = unpack_from(view, offset)
+            offset += 4
+            if wanted is None or dtype in wanted:
+                yield TlvView(dtype, view, offset, dlen)
+            offset += dlen
+
+    @staticmethod
+    def _decode_tlvs(data, offset, wanted):
+        """Decode the TLVs of data from offset, walking it by unpack_from."""
+        if isinstance(data, memoryview):
+            data = data.tobytes()
+        end = len(data) - len(Protocol.PACKET_END)
+        unpack_from = Protocol.TLV_STRUCT.unpack_from
+        schema = Protocol.schema
         results = []
-        while len(payload) > len(Protocol.PACKET_END):
-            dtype, dlen = struct.unpack("!hh", payload[0:4])
-            data = payload[4 : 4 + dlen]
-            results.append(
-                (
-                    dtype,
-                    Protocol.ids_tp[dtype][1],
-                    Protocol.interpret_value(data, Protocol.ids_tp[dtype][0]),
-                )
-            )
-            payload = payload[4 + dlen :]
+        while offset < end:
+            dtype, dlen = unpack_from(data, offset)
+            offset += 4
+            if wanted is None or dtype in wanted:
+                codec = schema[dtype]
+                value = codec.decode(data[offset : offset + dlen])
+                results.append((dtype, codec.name, value))
+            offset += dlen
         return results
 
+    @staticmethod
+    def interpret_payload(payload, wanted=None):
+        """Decode the packet payload."""
+        return Protocol._decode_tlvs(payload, 0, wanted)
+
+    @staticmethod
+    def _pack_payload(payload, parts):
+        """Append packed TLVs and the end marker to parts, return packet length."""
+        pack = Protocol.TLV_STRUCT.pack
+        length = Protocol.header["len"] + len(Protocol.PACKET_END)
+        for dtype, value in payload:
+            parts.append(pack(dtype, len(value)))
+            parts.append(value)
+            length += 4 + len(value)
+        parts.append(Protocol.PACKET_END)
+        return length
+
+    @staticmethod
+    def split_payload(payload, reserved=()):
+        """
+        Split TLVs into payloads that each fit in one packet.
+
+        Every payload leaves room for the reserved TLVs (e.g. credentials)
+        that are sent along with it. TLVs keep their order.
+        """
+        budget = Protocol.MAX_PACKET_SIZE - Protocol.MIN_PACKET_SIZE
+        budget -= sum(4 + len(value) for _, value in reserved)
+        batches = []
+        used = budget
+        for tlv in payload:
+            size = 4 + len(tlv[1])
+            if used + size > budget:
+                batches.append([])
+                used = 0
+            batches[-1].append(tlv)
+            used += size
+        return batches
+
     @staticmethod
     def assemble_packet(header, payload):
         """Build packet from header and payload."""
-        payload_bytes = b""
-        for dtype, value in payload:
-            payload_bytes += struct.pack("!hh", dtype, len(value))
-            payload_bytes += value
-        header["check_length"] = (
-            Protocol.header["len"] + len(payload_bytes) + len(Protocol.PACKET_END)
+        parts = [b""]
+        header["check_length"] = Protocol._pack_payload(payload, parts)
+        parts[0] = Protocol.HEADER_STRUCT.pack(
+            *(header[part] for part in Protocol.header["blank"])
         )
-        header = tuple(header[part] for part in Protocol.header["blank"])
-        header_bytes = struct.pack(Protocol.header["fmt"], *header)
-        return header_bytes + payload_bytes + Protocol.PACKET_END
+        return b"".join(parts)
+
+    @staticmethod
+    def header_template(op_code, switch_mac, host_mac) -> bytes:
+        """Return the fixed start of a header, to build packets from."""
+        return _HEADER_PREFIX.pack(
+            Protocol.header["blank"]["version"], op_code, switch_mac, host_mac
+        )
+
+    @staticmethod
+    def build_packet(template, sequence_id, token_id, payload):
+        """
+        Build a packet from a header template and payload.
+
+        Only sequence_id, token_id and check_length are packed per packet;
+        the result equals assemble_packet with the same fields. All parts
+        are copied once, into the returned bytes.
+        """
+        parts = [template, b""]
+        length = Protocol._pack_payload(payload, parts)
+        parts[1] = _HEADER_TAIL.pack(sequence_id, 0, length, 0, 0, token_id, 0)
+        return b"".join(parts)
+
+    @staticmethod
+    def encode_value(type_id, value) -> bytes:
+        """Encode a value of the given type id."""
+        return Protocol.schema[type_id].encode(value)
 
     @staticmethod
     def interpret_value(value, kind):
         """Decode payload values."""
-        if kind == "str":
-            value = value.split(b"\x00", 1)[0].decode("ascii")
-        elif kind == "ip":
-            value = f"{ip_address(value):s}"
-        elif kind == "hex":
-            value = mac_to_str(value)
-        elif kind == "action":
-            value = "n/a"
-        elif kind == "dec":
-            value = int.from_bytes(value, "big")
-        elif kind == "vlan":
-            value = list(
-                struct.unpack("!hii", value[:10]) + (value[10:-1].decode("ascii"),)
-            )
-            value[1] = byte2ports(value[1])
-            value[2] = byte2ports(value[2])
-        elif kind == "pvid":
-            value = struct.unpack("!bh", value) if value else None
-        elif kind == "stat":
-            value = struct.unpack("!bbbIIII", value)
-        elif kind == "bool":
-            if len(value) == 0:
-                pass
-            elif len(value) == 1:
-                value = value[0] > 0
-            else:
-                raise AssertionError("boolean should be one byte long")
-        return value
+        if (decoder := KIND_DECODERS.get(kind)) is None:
+            return value
+        return decoder(value)
 
     @staticmethod
     def set_vlan(vlan_num, member_mask, tagged_mask, vlan_name):
         """Set vlan entry."""
-        value = (
-            struct.pack("!hii", vlan_num, member_mask, tagged_mask)
-            + vlan_name.encode("ascii")
-            + b"\x00"
-        )
-        return value
+        return _encode_vlan((vlan_num, member_mask, tagged_mask, vlan_name))
 
     @staticmethod
     def set_pvid(vlan_num, port):
         """Set port primary vlan ID."""
-        value = struct.pack("!bh", port, vlan_num)
-        return value
+        return _PVID.pack(port, vlan_num)
@@ -0,0 +1,156 @@
+"""Per-port packet rates from the 32-bit stats counters."""
+
+from __future__ import annotations
+
+import time
+from array import array
+from typing import Dict, List, NamedTuple, Optional
+
+COUNTER_WRAP = 1 << 32
+# packets per second of 1 GbE at minimum frame size; a larger jump in a
+# counter cannot be a wrap and means the switch restarted its counters
+LINE_RATE_PPS = 1_488_096
+
+_COUNTERS = 4  # TxGoodPkt, TxBadPkt, RxGoodPkt, RxBadPkt
+
+
+class PortRates(NamedTuple):
+    """Rates for one port over the last poll interval."""
+
+    port: int
+    tx_pps: float
+    rx_pps: float
+    tx_error_ratio: float
+    rx_error_ratio: float
+    tx_good: int  # 64-bit virtual counters
+    tx_bad: int
+    rx_good: int
+    rx_bad: int
+
+
+def _counters(entry) -> tuple:
+    """Return (port, tx_good, tx_bad, rx_good, rx_bad) of a stats entry."""
+    if isinstance(entry, dict):
+        return (
+            entry["Port"],
+            entry["TxGoodPkt"],
+            entry["TxBadPkt"],
+            entry["RxGoodPkt"],
+            entry["RxBadPkt"],
+        )
+    return (entry[0],) + tuple(entry[3:7])
+
+
+def _ratio(bad: int, good: int) -> float:
+    """Return the share of bad packets."""
+    return bad / (good + bad) if bad else 0.0
+
+
+class _SwitchState:
+    """Previous sample of one switch, kept in flat arrays."""
+
+    __slots__ = ("ports", "raw", "total", "timestamp", "rates", "reboots")
+
+    def __init__(self, ports: array, raw: array, timestamp: float) -> None:
+        """Initialize from a first sample."""
+        self.ports = ports
+        self.raw = raw
+        self.total = array("Q", raw)
+        self.timestamp = timestamp
+        self.rates: List[PortRates] = []
+        self.reboots = 0
+
+
+class RateEngine:
+    """
+    Incremental packet rate and error ratio engine.
+
+    Keeps the previous raw counters and 64-bit virtual counters of every
+    port per switch, so each poll is processed in O(ports). A decreasing
+    counter is a 32-bit wrap if the wrapped delta is possible at
+    max_pps, otherwise the switch rebooted and all its counters restart
+    from zero.
+    """
+
+    def __init__(self, max_pps: float = LINE_RATE_PPS) -> None:
+        """Initialize."""
+        self.max_pps = max_pps
+        self._switches: Dict[str, _SwitchState] = {}
+
+    def update(
+        self, switch_mac: str, stats, timestamp: Optional[float] = None
+    ) -> List[PortRates]:
+        """
+        Feed one stats sample and return the rates since the previous one.
+
+        stats is the list of stats entries as dicts, PortStats records or
+        raw (port, status, link, tx_good, tx_bad, rx_good, rx_bad) tuples.
+        The first sample of a switch only primes the engine.
+        """
+        if timestamp is None:
+            timestamp = time.monotonic()
+        ports = array("H")
+        raw = array("L")
+        for entry in stats:
+            port, *counters = _counters(entry)
+            ports.append(port)
+            raw.extend(counters)
+
+        state = self._switches.get(switch_mac)
+        if state is None or state.ports != ports:
+            self._switches[switch_mac] = _SwitchState(ports, raw, timestamp)
+            return []
+        elapsed = timestamp - state.timestamp
+        if elapsed <= 0:
+            return state.rates
+
+        deltas, rebooted = self._deltas(state, raw, self.max_pps * elapsed)
+        if rebooted:
+            state.reboots += 1
+        rates = [
+            PortRates(
+                port,
+                (deltas[i] + deltas[i + 1]) / elapsed,
+                (deltas[i + 2] + deltas[i + 3]) / elapsed,
+                _ratio(deltas[i + 1], deltas[i]),
+                _ratio(deltas[i + 3], deltas[i + 2]),
+                *state.total[i : i + _COUNTERS],
+            )
+            for port, i in zip(ports, range(0, len(raw), _COUNTERS))
+        ]
+        state.raw = raw
+        state.timestamp = timestamp
+        state.rates = rates
+        return rates
+
+    @staticmethod
+    def _deltas(state: _SwitchState, raw: array, limit: float):
+        """Advance the virtual counters and return the per-counter deltas."""
+        prev, total = state.raw, state.total
+        # after a reboot every counter restarted from zero, not just the
+        # ones that happen to be lower than before
+        rebooted = any(
+            value < prev[i] and value - prev[i] + COUNTER_WRAP > limit
+            for i, value in enumerate(raw)
+        )
+        if rebooted:
+            deltas = array("Q", raw)
+        else:
+            deltas = array("Q", ((v - p) % COUNTER_WRAP for v, p in zip(raw, prev)))
+        for i, delta in enumerate(deltas):
+            total[i] += delta
+        return deltas, rebooted
+
+    def rates(self, switch_mac: str) -> List[PortRates]:
+        """Return the rates of the last update for a switch."""
+        state = self._switches.get(switch_mac)
+        return state.rates if state is not None else []
+
+    def reboots(self, switch_mac: str) -> int:
+        """Return how many counter resets were detected for a switch."""
+        state = self._switches.get(switch_mac)
+        return state.reboots if state is not None else 0
+
+    def forget(self, switch_mac: str) -> None:
+        """Drop the state of a switch."""
+        self._switches.pop(switch_mac, None)
@@ -0,0 +1,91 @@
+"""Compute the settings that bring a switch to a desired configuration."""
+
+from __future__ import annotations
+
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from .protocol import Protocol
+from .records import VlanEntry, VlanIndex
+
+DEFAULT_VLAN = 1  # cannot be removed from a switch
+
+SETTINGS = ("qos1", "qos2", "mirror", "loop_prev")
+
+
+class DesiredState(NamedTuple):
+    """
+    Configuration a switch should have; items left as None are not managed.
+
+    vlans is the complete VLAN table: listed VLANs are created or updated
+    and, with prune set, every other VLAN but the default one is removed.
+    Removal sends the VLAN with no member ports. That a switch deletes it
+    then is an assumption, not checked against a capture of the firmware;
+    diff treats an empty VLAN as absent, so either way it is sent once.
+    pvids maps ports to their primary VLAN id; unlisted ports are left
+    alone. settings maps item names from SETTINGS to values in the form
+    update_data returns them (bool, or the hex string of the raw value),
+    or to the raw bytes.
+    """
+
+    vlans: Optional[Iterable[VlanEntry]] = None
+    pvids: Optional[Dict[int, int]] = None
+    settings: Optional[Dict[str, Any]] = None
+    prune: bool = False
+
+    def items(self) -> List[str]:
+        """Return the update_data items needed to compare against."""
+        names = []
+        if self.vlans is not None:
+            names.append("vlan")
+        if self.pvids is not None:
+            names.append("pvid")
+        for name in self.settings or {}:
+            if name not in SETTINGS:
+                raise ValueError(f"{name} is not a managed setting")
+            names.append(name)
+        return names
+
+
+def _encoded(type_id: int, value) -> Optional[bytes]:
+    """Return the raw form of a setting, None when the switch sent none."""
+    if isinstance(value, (bytes, bytearray)):
+        return bytes(value) or None
+    if value is None or value == "":
+        return None
+    return Protocol.encode_value(type_id, value)
+
+
+def diff(desired: DesiredState, data: Dict[str, Any]) -> List[Tuple[int, bytes]]:
+    """
+    Return the settings TLVs that turn data into the desired state.
+
+    data holds update_data results, compact or not, for desired.items().
+    New and changed VLANs come first so PVIDs can move to them, removed
+    VLANs last once no PVID points at them. Nothing drifted: empty list.
+
+    A VLAN without member ports counts as absent: a switch that keeps a
+    VLAN emptied by an earlier prune is not sent the removal again.
+    """
+    current = VlanIndex.from_data(data)
+    vlan_id = Protocol.get_id("vlan")
+    pvid_id = Protocol.get_id("pvid")
+    changes: List[Tuple[int, bytes]] = []
+    removed: List[Tuple[int, bytes]] = []
+    if desired.vlans is not None:
+        wanted = {vlan.vlan_id: vlan for vlan in desired.vlans}
+        for vlan in sorted(wanted.values()):
+            if current.vlans.get(vlan.vlan_id) != vlan:
+                changes.append((vlan_id, Protocol.set_vlan(*vlan)))
+        if desired.prune:
+            for vid, vlan in sorted(current.vlans.items()):
+                if vlan.member_mask and vid not in wanted and vid != DEFAULT_VLAN:
+                    removed.append((vlan_id, Protocol.set_vlan(vid, 0, 0, "")))
+    for port, vid in sorted((desired.pvids or {}).items()):
+        if current.pvid_of(port) != vid:
+            changes.append((pvid_id, Protocol.set_pvid(vid, port)))
+    for name, value in (desired.settings or {}).items():
+        type_id = Protocol.get_id(name)
+        raw = _encoded(type_id, value)
+        if raw != _encoded(type_id, data.get(name, {}).get(name)):
+            changes.append((type_id, raw or b""))
+    return changes + removed
@@ -0,0 +1,266 @@
+"""Compact record types for parsed switch data."""
+
+from __future__ import annotations
+
+import struct
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from .binary import PortSet, ports2byte
+from .protocol import Protocol, TlvView
+
+STATUS = {
+    0: "Disabled",
+    1: "Enabled",
+}
+
+LINK_STATUS = {
+    0: "Link Down",
+    1: "AUTO",
+    2: "MH10",
+    3: "MF10",
+    4: "MH100",
+    5: "100Full",
+    6: "1000Full",
+}
+
+_STATS = struct.Struct("!bbbIIII")
+_VLAN = struct.Struct("!hii")
+_PVID = struct.Struct("!bh")
+
+
+class PortStats(NamedTuple):
+    """Packet counters of one port from the stats TLV."""
+
+    port: int
+    status: int
+    link_status: int
+    tx_good: int
+    tx_bad: int
+    rx_good: int
+    rx_bad: int
+
+    @classmethod
+    def from_tlv(cls, tlv) -> PortStats:
+        """Build from a TlvView or a decoded (type_id, name, value) tuple."""
+        if isinstance(tlv, TlvView):
+            return cls._make(_STATS.unpack(tlv.raw))
+        return cls._make(tlv[2])
+
+    @classmethod
+    def from_dict(cls, entry: Dict[str, Any]) -> PortStats:
+        """Build from the dict form produced by TpLinkESS.parse_response."""
+        return cls(
+            entry["Port"],
+            entry["Status Raw"],
+            entry["Link Status Raw"],
+            entry["TxGoodPkt"],
+            entry["TxBadPkt"],
+            entry["RxGoodPkt"],
+            entry["RxBadPkt"],
+        )
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Return the dict form produced by TpLinkESS.parse_response."""
+        return {
+            "Port": self.port,
+            "Status": STATUS.get(self.status),
+            "Status Raw": self.status,
+            "Link Status": LINK_STATUS.get(self.link_status),
+            "Link Status Raw": self.link_status,
+            "TxGoodPkt": self.tx_good,
+            "TxBadPkt": self.tx_bad,
+            "RxGoodPkt": self.rx_good,
+            "RxBadPkt": self.rx_bad,
+        }
+
+
+class VlanEntry(NamedTuple):
+    """One 802.1Q VLAN with its member and tagged port masks."""
+
+    vlan_id: int
+    member_mask: int
+    tagged_mask: int
+    name: str
+
+    @classmethod
+    def from_tlv(cls, tlv) -> VlanEntry:
+        """Build from a TlvView or a decoded (type_id, name, value) tuple."""
+        if isinstance(tlv, TlvView):
+            raw = tlv.raw
+            vlan_id, member_mask, tagged_mask = _VLAN.unpack_from(raw)
+            return cls(vlan_id, member_mask, tagged_mask, str(raw[10:-1], "ascii"))
+        vlan_id, members, tagged, name = tlv[2]
+        return cls(vlan_id, ports2byte(members), ports2byte(tagged), name)
+
+    @classmethod
+    def from_dict(cls, entry: Dict[str, Any]) -> VlanEntry:
+        """Build from the dict form produced by TpLinkESS.parse_response."""
+        return cls(
+            entry["VLAN ID"],
+            ports2byte(entry["Member Ports"]),
+            ports2byte(entry["Tagged Ports"]),
+            entry["VLAN Name"],
+        )
+
+    @property
+    def members(self) -> PortSet:
+        """Return the member ports."""
+        return PortSet(self.member_mask)
+
+    @property
+    def tagged(self) -> PortSet:
+        """Return the tagged ports."""
+        return PortSet(self.tagged_mask)
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Return the dict form produced by TpLinkESS.parse_response."""
+        return {
+            "VLAN ID": self.vlan_id,
+            "Member Ports": str(self.members),
+            "Tagged Ports": str(self.tagged),
+            "VLAN Name": self.name,
+        }
+
+
+class PvidEntry(NamedTuple):
+    """Primary VLAN ID of one port; compares equal to the (port, vlan) tuple."""
+
+    port: int
+    vlan_id: int
+
+    @classmethod
+    def from_tlv(cls, tlv) -> Optional[PvidEntry]:
+        """Build from a TlvView or a decoded (type_id, name, value) tuple."""
+        if isinstance(tlv, TlvView):
+            return cls._make(_PVID.unpack(tlv.raw)) if len(tlv.raw) else None
+        return cls._make(tlv[2]) if tlv[2] else None
+
+
+class SwitchInfo(NamedTuple):
+    """System information returned by discovery and the hostname query."""
+
+    type: Optional[str] = None
+    hostname: Optional[str] = None
+    mac: Optional[str] = None
+    firmware: Optional[str] = None
+    hardware: Optional[str] = None
+    dhcp: Optional[bool] = None
+    ip_addr: Optional[str] = None
+    ip_mask: Optional[str] = None
+    gateway: Optional[str] = None
+
+    @classmethod
+    def from_payload(cls, payload) -> SwitchInfo:
+        """Build from the TLVs of a discovery or hostname reply."""
+        fields = cls._fields
+        return cls(**{tlv[1]: tlv[2] for tlv in payload if tlv[1] in fields})
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Return the dict form produced by TpLinkESS.parse_response."""
+        items = self._asdict().items()  # pylint: disable=no-member
+        return {k: v for k, v in items if v is not None}
+
+
+RECORD_TYPES = {
+    Protocol.get_id("stats"): PortStats,
+    Protocol.get_id("vlan"): VlanEntry,
+    Protocol.get_id("pvid"): PvidEntry,
+}
+
+
+def parse_records(payload) -> Dict[str, Any]:
+    """
+    Parse the payload into a dict holding record objects.
+
+    Same layout as TpLinkESS.parse_response, but stats, vlan and pvid
+    entries are compact records instead of dicts. TlvView input is decoded
+    straight from the packet bytes.
+    """
+    output: Dict[str, Any] = {}
+    for tlv in payload:
+        type_name = tlv[1]
+        if (record_type := RECORD_TYPES.get(tlv[0])) is not None:
+            record = record_type.from_tlv(tlv)
+            entries = output.setdefault(type_name, [])
+            if record is not None:
+                entries.append(record)
+            continue
+        data = tlv[2]
+        if type_name not in output:
+            output[type_name] = data
+        elif isinstance(output[type_name], list):
+            output[type_name].append(data)
+        else:
+            output[type_name] = [output[type_name], data]
+    return output
+
+
+class VlanIndex:
+    """
+    VLAN membership and PVIDs indexed both by VLAN and by port.
+
+    Built once from the vlan and pvid items of update_data, so "which VLANs
+    is port 5 in" is a dict lookup instead of a scan of every entry.
+    """
+
+    def __init__(
+        self, vlans: Iterable[VlanEntry], pvids: Iterable[Tuple[int, int]] = ()
+    ) -> None:
+        """Index VlanEntry records and (port, vlan_id) pairs."""
+        self.vlans: Dict[int, VlanEntry] = {vlan.vlan_id: vlan for vlan in vlans}
+        self._member_of: Dict[int, List[int]] = {}
+        self._tagged_in: Dict[int, List[int]] = {}
+        for vlan_id, vlan in sorted(self.vlans.items()):
+            for port in vlan.members:
+                self._member_of.setdefault(port, []).append(vlan_id)
+            for port in vlan.tagged:
+                self._tagged_in.setdefault(port, []).append(vlan_id)
+        self.pvids: Dict[int, int] = dict(pvids)
+        self._pvid_ports: Dict[int, int] = {}
+        for port, vlan_id in self.pvids.items():
+            self._pvid_ports[vlan_id] = self._pvid_ports.get(vlan_id, 0) | (
+                1 << (port - 1)
+            )
+
+    @classmethod
+    def from_data(cls, data: Dict[str, Any]) -> VlanIndex:
+        """Build from update_data results, compact or not."""
+        vlans = []
+        for entry in data.get("vlan", {}).get("vlan", []):
+            vlans.append(
+                VlanEntry.from_dict(entry) if isinstance(entry, dict) else entry
+            )
+        pvids = [tuple(entry) for entry in data.get("pvid", {}).get("pvid", [])]
+        return cls(vlans, pvids)
+
+    def vlans_of(self, port: int) -> List[int]:
+        """Return the ids of the VLANs port is a member of."""
+        return self._member_of.get(port, [])
+
+    def tagged_vlans_of(self, port: int) -> List[int]:
+        """Return the ids of the VLANs port sends tagged frames in."""
+        return self._tagged_in.get(port, [])
+
+    def ports_of(self, vlan_id: int) -> PortSet:
+        """Return the member ports of a VLAN."""
+        vlan = self.vlans.get(vlan_id)
+        return vlan.members if vlan is not None else PortSet()
+
+    def pvid_of(self, port: int) -> Optional[int]:
+        """Return the primary VLAN id of a port."""
+        return self.pvids.get(port)
+
+    def ports_with_pvid(self, vlan_id: int) -> PortSet:
+        """Return the ports whose primary VLAN is vlan_id."""
+        return PortSet(self._pvid_ports.get(vlan_id, 0))
+
+
+def as_dict(data) -> Any:
+    """Recursively convert records in parsed data to their dict form."""
+    if hasattr(data, "as_dict"):
+        return data.as_dict()
+    if isinstance(data, dict):
+        return {k: as_dict(v) for k, v in data.items()}
+    if isinstance(data, list):
+        return [as_dict(v) for v in data]
+    return data
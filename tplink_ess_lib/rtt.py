@@ -0,0 +1,60 @@
+"""Provide round-trip time estimation for retransmit timeouts."""
+
+from __future__ import annotations
+
+from typing import Optional
+
+
+class RttEstimator:
+    """
+    Smoothed round-trip time of one switch, as in RFC 6298.
+
+    Keeps SRTT and RTTVAR from measured samples; the retransmit timeout is
+    SRTT + 4 * RTTVAR clamped to [min_rto, max_rto]. Every timeout doubles
+    it until the next sample. Samples must come from requests that were not
+    retransmitted, since a reply cannot be matched to one of several copies.
+    """
+
+    ALPHA = 1 / 8
+    BETA = 1 / 4
+    K = 4
+
+    INITIAL_RTO = 1.0  # seconds, until the first sample
+    MIN_RTO = 0.05
+    MAX_RTO = 4.0
+
+    __slots__ = ("srtt", "rttvar", "rto", "min_rto", "max_rto", "samples")
+
+    def __init__(
+        self,
+        initial_rto: float = INITIAL_RTO,
+        min_rto: float = MIN_RTO,
+        max_rto: float = MAX_RTO,
+    ) -> None:
+        """Initialize."""
+        self.srtt: Optional[float] = None
+        self.rttvar = 0.0
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+        self.rto = min(max(initial_rto, min_rto), max_rto)
+        self.samples = 0
+
+    def sample(self, rtt: float) -> None:
+        """Update the estimate with one measured round trip, in seconds."""
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar += RttEstimator.BETA * (abs(self.srtt - rtt) - self.rttvar)
+            self.srtt += RttEstimator.ALPHA * (rtt - self.srtt)
+        self.samples += 1
+        rto = self.srtt + RttEstimator.K * self.rttvar
+        self.rto = min(max(rto, self.min_rto), self.max_rto)
+
+    def backoff(self) -> None:
+        """Double the timeout after a retransmit."""
+        self.rto = min(self.rto * 2, self.max_rto)
+
+    def __repr__(self) -> str:
+        """Return the representation."""
+        return f"RttEstimator(srtt={self.srtt}, rttvar={self.rttvar}, rto={self.rto})"
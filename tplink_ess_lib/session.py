@@ -0,0 +1,214 @@
+"""Provide a persistent, authenticated session with one switch."""
+
+import asyncio
+import logging
+
+from .network import AsyncNetwork, ConnectionProblem
+from .protocol import Protocol
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class Session:
+    """
+    Long-lived conversation with one switch.
+
+    Keeps the switch's token_id between polls so a steady-state query is a
+    single round trip. A non-zero error_code in a reply means the token
+    expired or was rejected; the session then logs in again and retries once.
+    """
+
+    def __init__(
+        self, network: AsyncNetwork, switch_mac: str, user: str, pwd: str
+    ) -> None:
+        """Initialize."""
+        self.network = network
+        self.switch_mac = switch_mac
+        self._user = user
+        self._pwd = pwd
+        self.token_id = None
+        self.logged_in = False
+        self.logins = 0
+
+    async def _request(self, op_code, payload, timeout=None, retransmit=True):
+        """Send one request with this session's token."""
+        header, payload = await self.network.query(
+            self.switch_mac,
+            op_code,
+            payload,
+            timeout=timeout,
+            token_id=self.token_id,
+            retransmit=retransmit,
+        )
+        self.token_id = header["token_id"]
+        return header, payload
+
+    async def login(self, timeout=None):
+        """
+        Fetch a token and send login credentials to switch.
+
+        Every copy of get_token_id or LOGIN makes the switch issue a new
+        token, so neither is resent: a request unanswered within the
+        retransmit timeout starts the whole exchange over instead, with new
+        sequence ids, at most MAX_RETRANSMITS times before the timeout.
+        """
+        self.logged_in = False
+        loop = asyncio.get_running_loop()
+        if timeout is None:
+            timeout = self.network.RECEIVE_TIMEOUT
+        deadline = loop.time() + timeout
+        estimator = self.network.rtt(self.switch_mac)
+        for attempt in range(self.network.MAX_RETRANSMITS + 1):
+            self.token_id = None
+            try:
+                await self._request(
+                    Protocol.GET,
+                    [(Protocol.get_id("get_token_id"), b"")],
+                    min(estimator.rto, deadline - loop.time()),
+                    retransmit=False,
+                )
+                header, _ = await self._request(
+                    Protocol.LOGIN,
+                    AsyncNetwork.login_dict(self._user, self._pwd),
+                    min(estimator.rto, deadline - loop.time()),
+                    retransmit=False,
+                )
+                break
+            except ConnectionProblem:
+                if attempt == self.network.MAX_RETRANSMITS or loop.time() >= deadline:
+                    raise
+                estimator.backoff()
+                _LOGGER.debug("Login to %s timed out, starting over", self.switch_mac)
+        if header["error_code"]:
+            raise ConnectionProblem(f"login rejected: error {header['error_code']}")
+        self.logged_in = True
+        self.logins += 1
+        if self.network.metrics.enabled:
+            self.network.metrics.increment("logins", switch=self.switch_mac)
+
+    async def query(self, op_code, payload, timeout=None, retransmit=True):
+        """Send an authenticated request, logging in again only when needed."""
+        if not self.logged_in:
+            await self.login()
+        header, reply = await self._request(op_code, payload, timeout, retransmit)
+        if header["error_code"]:
+            _LOGGER.debug(
+                "Token rejected by %s (error %d), logging in again",
+                self.switch_mac,
+                header["error_code"],
+            )
+            await self.login()
+            header, reply = await self._request(op_code, payload, timeout, retransmit)
+        return header, reply
+
+    async def set_many(self, items, timeout=None) -> list:
+        """
+        Apply settings with one login, packing as many items per packet as fit.
+
+        items is a list of (type_id, value) TLVs as for AsyncNetwork.set,
+        e.g. from Protocol.set_vlan and Protocol.set_pvid. Packets are sent
+        in order, one at a time, so a VLAN is created before PVIDs use it.
+        Returns a list in item order holding None for every applied item or
+        the ConnectionProblem of an item that was not. A packet the switch
+        rejects is resent in halves until the items at fault are found;
+        once the switch stops answering, the remaining items are not sent.
+        """
+        credentials = AsyncNetwork.login_dict(self._user, self._pwd)
+        results: list = []
+        for batch in Protocol.split_payload(items, credentials):
+            try:
+                await self._set_batch(credentials, batch, timeout, results)
+            except ConnectionProblem as err:
+                results += [err] * (len(items) - len(results))
+                break
+        return results
+
+    # pylint: disable-next=too-many-arguments
+    async def _set_batch(
+        self, credentials, batch, timeout, results, fresh=False
+    ) -> None:
+        """Send one packet of settings, appending each item's result to results."""
+        request = self._request if fresh else self.query
+        header = await self._send_settings(request, credentials + batch, timeout)
+        if not header["error_code"]:
+            results += [None] * len(batch)
+            return
+        if len(batch) > 1:
+            # the token was just renewed by query, so halves go out as they are
+            _LOGGER.debug(
+                "%s rejected %d settings, splitting them", self.switch_mac, len(batch)
+            )
+            half = len(batch) // 2
+            await self._set_batch(credentials, batch[:half], timeout, results, True)
+            await self._set_batch(credentials, batch[half:], timeout, results, True)
+            return
+        name = Protocol.ids_tp.get(batch[0][0], (None, batch[0][0]))[1]
+        results.append(
+            ConnectionProblem(f"{name} rejected: error {header['error_code']}")
+        )
+
+    async def _send_settings(self, request, packet, timeout) -> dict:
+        """
+        Send a LOGIN packet carrying settings and return the reply header.
+
+        Like the LOGIN of login, the packet is never resent: a request
+        unanswered within the retransmit timeout logs in again and sends the
+        settings anew, at most MAX_RETRANSMITS times before the timeout.
+        """
+        loop = asyncio.get_running_loop()
+        if timeout is None:
+            timeout = self.network.RECEIVE_TIMEOUT
+        deadline = loop.time() + timeout
+        estimator = self.network.rtt(self.switch_mac)
+        for attempt in range(self.network.MAX_RETRANSMITS + 1):
+            try:
+                header, _ = await request(
+                    Protocol.LOGIN,
+                    packet,
+                    min(estimator.rto, deadline - loop.time()),
+                    retransmit=False,
+                )
+                break
+            except ConnectionProblem:
+                if attempt == self.network.MAX_RETRANSMITS or loop.time() >= deadline:
+                    raise
+                estimator.backoff()
+                _LOGGER.debug(
+                    "Settings to %s timed out, starting over", self.switch_mac
+                )
+                await self.login(deadline - loop.time())
+        return header
+
+    async def query_many(self, requests, window=4, timeout=None):
+        """
+        Send several authenticated requests pipelined up to window deep.
+
+        Returns results in request order as AsyncNetwork.query_many does.
+        Requests whose token was rejected are retried once after a new login.
+        """
+        if not self.logged_in:
+            await self.login()
+        results = await self.network.query_many(
+            self.switch_mac, requests, window, timeout, self.token_id
+        )
+        rejected = [
+            index
+            for index, result in enumerate(results)
+            if not isinstance(result, ConnectionProblem) and result[0]["error_code"]
+        ]
+        if rejected:
+            _LOGGER.debug("Token rejected by %s, logging in again", self.switch_mac)
+            await self.login()
+            retried = await self.network.query_many(
+                self.switch_mac,
+                [requests[index] for index in rejected],
+                window,
+                timeout,
+                self.token_id,
+            )
+            for index, result in zip(rejected, retried):
+                results[index] = result
+        for result in results:
+            if not isinstance(result, ConnectionProblem):
+                self.token_id = result[0]["token_id"]
+        return results
@@ -0,0 +1,378 @@
+"""Provide a UDP simulator of TP-Link ESS switches for load and latency tests."""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+import socket
+import struct
+import time
+from typing import Dict, List, Optional, Tuple
+
+from .binary import mac_to_bytes, mac_to_str
+from .network import AsyncNetwork
+from .protocol import Protocol
+
+_LOGGER = logging.getLogger(__name__)
+
+ERROR_REJECTED = 1  # error_code of a reply to a bad login or a stale token
+ERROR_INVALID = 2  # error_code of a reply to settings out of range
+
+RECEIVE_BUFFER = 4 * 1024 * 1024  # bytes; capped by net.core.rmem_max
+
+_BROADCAST_BYTES = mac_to_bytes(AsyncNetwork.BROADCAST_MAC)
+_NO_TOKEN = {Protocol.get_id("get_token_id")}
+
+
+class SimulatedSwitch:
+    """
+    State of one simulated switch.
+
+    Counters grow with time at a fixed rate per port and wrap at 32 bits;
+    a reboot resets them. Settings without dedicated state are kept as the
+    raw TLV value and echoed back on GET.
+    """
+
+    def __init__(
+        self,
+        index: int,
+        num_ports: int = 8,
+        user: str = "admin",
+        pwd: str = "admin",
+        token_ttl: Optional[float] = None,
+        rng: Optional[random.Random] = None,
+        require_login: bool = True,
+    ) -> None:
+        """
+        Initialize the switch with index-derived MAC, name and address.
+
+        Without require_login, GETs are answered without a token.
+        """
+        rng = rng or random.Random(index)
+        self.mac_bytes = b"\x02\x00" + index.to_bytes(4, "big")
+        self.mac = mac_to_str(self.mac_bytes)
+        self.hostname = f"sim{index:05d}"
+        self.ip_addr = bytes((10, (index >> 16) & 255, (index >> 8) & 255, index & 255))
+        self.num_ports = num_ports
+        self.user = user
+        self.pwd = pwd
+        self.token_ttl = token_ttl
+        self.require_login = require_login
+        self.token_id = 0
+        self.logged_in = False
+        self.token_expires = 0.0
+        self.booted = time.monotonic()
+        self.reboots = 0
+        self.vlans: Dict[int, Tuple[int, int, str]] = {
+            1: ((1 << num_ports) - 1, 0, "Default_VLAN")
+        }
+        self.pvids = {port: 1 for port in range(1, num_ports + 1)}
+        self.links = {port: rng.random() < 0.75 for port in range(1, num_ports + 1)}
+        # packets per second sent and received on each linked port
+        self.pps = {
+            port: (rng.randint(10, 5000), rng.randint(10, 5000)) for port in self.links
+        }
+        self.settings: Dict[int, bytes] = {
+            4608: b"\x01\x00\x00\x00\x00",
+            8192: b"\x00\x01",
+            12288: b"\x01",
+            12289: b"\x01\x00\x00\x00\x00",
+            16640: b"\x00\x00\x00\x00\x00",
+            17152: b"\x00",
+        }
+        self._rng = rng
+
+    def system_tlvs(self) -> List[Tuple[int, bytes]]:
+        """Return the system block sent for discovery and hostname."""
+        return [
+            (1, b"TL-SG108E\x00"),
+            (2, self.hostname.encode("ascii") + b"\x00"),
+            (3, self.mac_bytes),
+            (7, b"1.0.0 Build 20191021 Rel.40140\x00"),
+            (8, b"TL-SG108E 4.0\x00"),
+            (9, b"\x00"),
+            (4, self.ip_addr),
+            (5, b"\xff\x00\x00\x00"),
+            (6, self.ip_addr[:3] + b"\x01"),
+        ]
+
+    def stats_tlvs(self) -> List[Tuple[int, bytes]]:
+        """Return one stats TLV per port with counters as of now."""
+        elapsed = time.monotonic() - self.booted
+        tlvs = []
+        for port, link in self.links.items():
+            tx_pps, rx_pps = self.pps[port] if link else (0, 0)
+            tx_good = int(tx_pps * elapsed) % (1 << 32)
+            rx_good = int(rx_pps * elapsed) % (1 << 32)
+            value = struct.pack(
+                "!bbbIIII", port, 1, 6 if link else 0, tx_good, 0, rx_good, 0
+            )
+            tlvs.append((16384, value))
+        return tlvs
+
+    # pylint: disable-next=too-many-return-statements
+    def get_tlvs(self, type_id: int) -> List[Tuple[int, bytes]]:
+        """Return the reply TLVs for one requested type id."""
+        if type_id == 2:
+            return self.system_tlvs()
+        if type_id == 10:
+            return [(10, bytes((self.num_ports,)))]
+        if type_id == 4096:
+            return [
+                (4096, bytes((port, 1, 0, 1, 6 if link else 0, 0, 0)))
+                for port, link in self.links.items()
+            ]
+        if type_id == 8705:
+            return (
+                [(8704, b"\x01")]
+                + [
+                    (8705, Protocol.set_vlan(vid, member, tagged, name))
+                    for vid, (member, tagged, name) in sorted(self.vlans.items())
+                ]
+                + [(8707, b" ")]
+            )
+        if type_id == 8706:
+            return [
+                (8706, Protocol.set_pvid(vid, port))
+                for port, vid in sorted(self.pvids.items())
+            ] + [(8707, b" ")]
+        if type_id == 16384:
+            return self.stats_tlvs()
+        if type_id in self.settings:
+            return [(type_id, self.settings[type_id])]
+        return []
+
+    def valid(self, payload: List[Tuple[int, bytes]]) -> bool:
+        """Return True if every VLAN and PVID setting is in range."""
+        for type_id, value in payload:
+            if type_id == 8705:
+                vid, member = struct.unpack("!hi", value[:6])
+                if not 1 <= vid <= 4094 or member >> self.num_ports:
+                    return False
+            elif type_id == 8706:
+                port, vid = struct.unpack("!bh", value)
+                if not 1 <= port <= self.num_ports or not 1 <= vid <= 4094:
+                    return False
+        return True
+
+    def apply(self, payload: List[Tuple[int, bytes]]) -> None:
+        """Apply the TLVs of a SET or a LOGIN carrying settings."""
+        for type_id, value in payload:
+            if type_id in (512, 514):
+                continue
+            if type_id == 2:
+                self.hostname = value.split(b"\x00", 1)[0].decode("ascii")
+            elif type_id == 8705:
+                vid, member, tagged = struct.unpack("!hii", value[:10])
+                name = value[10:].split(b"\x00", 1)[0].decode("ascii")
+                if member:
+                    self.vlans[vid] = (member, tagged, name)
+                else:
+                    # assumed to delete it, as reconcile prunes VLANs
+                    self.vlans.pop(vid, None)
+            elif type_id == 8706:
+                port, vid = struct.unpack("!bh", value)
+                self.pvids[port] = vid
+            elif type_id == 773:
+                self.reboot()
+            else:
+                self.settings[type_id] = value
+
+    def reboot(self) -> None:
+        """Reset counters and drop the login."""
+        self.booted = time.monotonic()
+        self.reboots += 1
+        self.logged_in = False
+        self.token_id = 0
+
+    def issue_token(self) -> int:
+        """Start a new login with a fresh token."""
+        self.token_id = self._rng.randint(1, 0x7FFF)
+        self.logged_in = False
+        return self.token_id
+
+    def login(self, token_id: int, payload: List[Tuple[int, bytes]]) -> bool:
+        """Check credentials against the issued token, return True if accepted."""
+        values = dict(payload)
+        accepted = (
+            token_id == self.token_id != 0
+            and values.get(512, b"").split(b"\x00", 1)[0] == self.user.encode()
+            and values.get(514, b"").split(b"\x00", 1)[0] == self.pwd.encode()
+        )
+        if accepted:
+            self.logged_in = True
+            if self.token_ttl is not None:
+                self.token_expires = time.monotonic() + self.token_ttl
+        return accepted
+
+    def token_valid(self, token_id: int) -> bool:
+        """Return True if token_id belongs to a live login."""
+        if not self.logged_in or token_id != self.token_id:
+            return False
+        return self.token_ttl is None or time.monotonic() < self.token_expires
+
+    # pylint: disable-next=too-many-return-statements
+    def handle(self, header: dict, payload: List[Tuple[int, bytes]]):
+        """Return the reply (header, payload) for a request."""
+        op_code = header["op_code"]
+        reply = dict(header, op_code=Protocol.SET, error_code=0)
+        if op_code == Protocol.DISCOVERY:
+            return reply, self.system_tlvs()
+        if op_code == Protocol.GET:
+            type_ids = [type_id for type_id, _ in payload]
+            if _NO_TOKEN.issuperset(type_ids):
+                reply["token_id"] = self.issue_token()
+                return reply, []
+            if self.require_login and not self.token_valid(header["token_id"]):
+                return dict(reply, error_code=ERROR_REJECTED), []
+            tlvs: List[Tuple[int, bytes]] = []
+            for type_id in type_ids:
+                tlvs += self.get_tlvs(type_id)
+            return reply, tlvs
+        reply["op_code"] = Protocol.RETURN
+        if op_code == Protocol.LOGIN:
+            if not self.login(header["token_id"], payload):
+                return dict(reply, error_code=ERROR_REJECTED), []
+        elif op_code != Protocol.SET or not self.token_valid(header["token_id"]):
+            return dict(reply, error_code=ERROR_REJECTED), []
+        if not self.valid(payload):
+            return dict(reply, error_code=ERROR_INVALID), []
+        self.apply(payload)
+        return reply, []
+
+
+class SwitchSimulator(asyncio.DatagramProtocol):
+    """
+    Emulate many switches behind one UDP socket.
+
+    Listens where switches listen for requests and sends replies to
+    reply_port, like a real switch answering on 29809: back to the
+    sender, or to reply_address, e.g. 255.255.255.255 to broadcast them as
+    switches do (start the simulator on 0.0.0.0 to hear broadcasts). Every
+    reply is delayed by latency plus or minus a uniform jitter, and each
+    request is dropped with probability loss. token_ttl makes logins expire.
+    """
+
+    def __init__(
+        self,
+        count: int = 1,
+        num_ports: int = 8,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        loss: float = 0.0,
+        token_ttl: Optional[float] = None,
+        require_login: bool = True,
+        user: str = "admin",
+        pwd: str = "admin",
+        reply_port: int = AsyncNetwork.UDP_RECEIVE_FROM_PORT,
+        seed: Optional[int] = None,
+        reply_address: Optional[str] = None,
+    ) -> None:
+        """Initialize count switches."""
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.reply_port = reply_port
+        self.reply_address = reply_address
+        # more ports every reply goes to, like a broadcast reaching many hosts
+        self.reply_ports: List[int] = []
+        self._rng = random.Random(seed)
+        self.switches: Dict[bytes, SimulatedSwitch] = {}
+        for index in range(1, count + 1):
+            switch = SimulatedSwitch(
+                index,
+                num_ports,
+                user,
+                pwd,
+                token_ttl,
+                random.Random(self._rng.random()),
+                require_login,
+            )
+            self.switches[switch.mac_bytes] = switch
+        self.received = 0
+        self.dropped = 0
+        self._transport: Optional[asyncio.DatagramTransport] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def macs(self) -> List[str]:
+        """Return the MAC addresses of the simulated switches."""
+        return [switch.mac for switch in self.switches.values()]
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        """Return the (address, port) the simulator listens on."""
+        if self._transport is None:
+            raise RuntimeError("simulator not started")
+        return self._transport.get_extra_info("sockname")
+
+    async def start(self, address: str = "127.0.0.1", port: int = 0):
+        """Bind the request socket; port 0 picks a free port."""
+        self._loop = asyncio.get_running_loop()
+        await self._loop.create_datagram_endpoint(
+            lambda: self, local_addr=(address, port), allow_broadcast=True
+        )
+        return self
+
+    def connection_made(self, transport) -> None:
+        """Keep the transport, with room to queue a fleet-wide burst."""
+        self._transport = transport
+        sock = transport.get_extra_info("socket")
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECEIVE_BUFFER)
+
+    def close(self) -> None:
+        """Close the socket."""
+        if self._transport is not None:
+            self._transport.close()
+        self._transport = None
+
+    async def __aenter__(self):
+        """Enter method."""
+        return await self.start()
+
+    async def __aexit__(self, exc_type, exc_value, exc_tb):
+        """Exit method."""
+        self.close()
+
+    def datagram_received(self, data, addr) -> None:
+        """Answer a request from every switch it is addressed to."""
+        self.received += 1
+        try:
+            header, tlvs = Protocol.parse(Protocol.decode(data))
+        except (AssertionError, struct.error):
+            return
+        values = [(tlv.type_id, bytes(tlv.raw)) for tlv in tlvs]
+        if header["switch_mac"] == _BROADCAST_BYTES:
+            targets = list(self.switches.values())
+        elif (switch := self.switches.get(header["switch_mac"])) is not None:
+            targets = [switch]
+        else:
+            return
+        for target in targets:
+            self._reply(target, dict(header, switch_mac=target.mac_bytes), values, addr)
+
+    def _reply(self, switch: SimulatedSwitch, header, payload, addr) -> None:
+        """Schedule the reply of one switch after the simulated delay."""
+        if self.loss and self._rng.random() < self.loss:
+            self.dropped += 1
+            return
+        packet = Protocol.encode(
+            Protocol.assemble_packet(*switch.handle(header, payload))
+        )
+        delay = self.latency
+        if self.jitter:
+            delay += self._rng.uniform(-self.jitter, self.jitter)
+        host = self.reply_address or addr[0]
+        destinations = [(host, self.reply_port)]
+        destinations += [(host, port) for port in self.reply_ports]
+        if delay <= 0:
+            self._send(packet, destinations)
+        else:
+            self._loop.call_later(delay, self._send, packet, destinations)
+
+    def _send(self, packet: bytes, destinations) -> None:
+        """Send a reply unless the simulator was closed meanwhile."""
+        if self._transport is not None:
+            for destination in destinations:
+                self._transport.sendto(packet, destination)